@@ -0,0 +1,121 @@
+"""Coalesced admin error notifications.
+
+Processing failures used to push one LINE message to the admin each, which
+floods the admin whenever a dependency degrades. Failures are now counted
+here and sent as one summary at most every SUMMARY_INTERVAL seconds; the
+request handlers call flush() before returning, so the first failure after
+a quiet period still goes out right away.
+
+Counts are cleared only once their summary was pushed, so a failed push
+(e.g. while the LINE breaker is open) is retried by a later flush. They
+live in memory: counts still held back when an instance is frozen or
+recycled are lost, but each failure is also in the logs and api_logs.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from . import config
+from .flex_messages import build_error_message
+from .line_client import push_message
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INTERVAL = 300.0  # seconds
+# Distinct errors listed in one summary; the rest are only counted
+MAX_LISTED_ERRORS = 5
+
+
+@dataclass(frozen=True)
+class Summary:
+    """A rendered summary and the counts it reports."""
+    text: str
+    errors: Counter[str]
+
+
+class AdminDigest:
+    """Counts failures and renders them as one periodic summary."""
+
+    def __init__(self, interval: float = SUMMARY_INTERVAL) -> None:
+        self.interval = interval
+        self._errors: Counter[str] = Counter()
+        self._users: set[str] = set()
+        self._last_sent: float | None = None  # monotonic time; None: never sent
+        self._sending = False
+        self._lock = threading.Lock()
+
+    def record(self, user_display: str | None, error_msg: str) -> None:
+        with self._lock:
+            self._errors[error_msg[:100]] += 1
+            if user_display:
+                self._users.add(user_display)
+
+    def take_summary(self, force: bool = False) -> Summary | None:
+        """Return the pending summary if one is due. Its counts stay pending
+        until done(summary, sent=True); one summary is out at a time."""
+        with self._lock:
+            if not self._errors or self._sending:
+                return None
+            now = time.monotonic()
+            if not force and self._last_sent is not None and now - self._last_sent < self.interval:
+                return None
+            self._sending = True
+            errors, users = Counter(self._errors), set(self._users)
+        return Summary(_render(errors, users), errors)
+
+    def done(self, summary: Summary, sent: bool) -> None:
+        """Clear the counts a summary carried once it was pushed."""
+        with self._lock:
+            self._sending = False
+            if not sent:
+                return
+            self._last_sent = time.monotonic()
+            self._errors -= summary.errors
+            if not self._errors:
+                self._users.clear()
+
+
+def _render(errors: Counter[str], users: set[str]) -> str:
+    total = sum(errors.values())
+    lines = [f"• {msg} ×{count}" for msg, count in errors.most_common(MAX_LISTED_ERRORS)]
+    if len(errors) > MAX_LISTED_ERRORS:
+        lines.append(f"• 其他 {len(errors) - MAX_LISTED_ERRORS} 種錯誤")
+    if len(users) == 1:
+        affected = f"用戶：{next(iter(users))}"
+    else:
+        affected = f"受影響用戶：{len(users)} 位"
+    return (
+        f"⚠️ 處理失敗通知（{total} 次）\n\n"
+        f"{affected}\n"
+        + "\n".join(lines)
+    )
+
+
+digest = AdminDigest()
+
+
+def record(user_display: str | None, error_msg: str) -> None:
+    """Count a processing failure for the next admin summary."""
+    digest.record(user_display, error_msg)
+
+
+async def flush(force: bool = False) -> None:
+    """Push the pending summary to the admin if it is due. Never raises."""
+    if not config.ADMIN_LINE_USER_ID:
+        return
+    summary = digest.take_summary(force)
+    if summary is None:
+        return
+    sent = False
+    try:
+        await push_message(config.ADMIN_LINE_USER_ID, [build_error_message(summary.text)])
+        sent = True
+    except Exception:
+        logger.exception("Failed to send admin error summary, keeping it for the next flush")
+    finally:
+        digest.done(summary, sent)
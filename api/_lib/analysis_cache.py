@@ -0,0 +1,167 @@
+"""Content-hash cache for Gemini screenshot analyses.
+
+Two tiers:
+1. In-process LRU keyed by image hash (survives across warm invocations)
+2. Supabase `analysis_cache` table shared by all instances
+
+Images are keyed by the SHA-256 of their bytes. When ANALYSIS_CACHE_PHASH is
+enabled and Pillow is installed, a perceptual difference hash is also used
+so re-encoded or resized copies of the same screenshot hit the cache.
+
+A perceptual hash can't tell apart screenshots that differ only in their
+text (two lessons of the same app look alike at 16x16), so a perceptual
+match is only served from the same user's earlier screenshots: a collision
+may show a user words they already captured, never another user's. Exact
+SHA-256 matches are shared by everyone.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from . import config
+from .models import GeminiParseResult
+from .supabase_client import get_cached_analysis, save_cached_analysis
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CACHE_SIZE = 256
+# dHash grid: (PHASH_SIZE + 1) x PHASH_SIZE pixels -> PHASH_SIZE² bits
+PHASH_SIZE = 16
+# Minimum brightness step that sets a bit; keeps flat areas stable under
+# JPEG noise instead of flipping on near-ties.
+PHASH_THRESHOLD = 4
+
+_local: OrderedDict[str, "CachedAnalysis"] = OrderedDict()
+_local_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class CacheKey:
+    """Hashes identifying one screenshot; perceptual matches are limited to
+    user_id's own screenshots."""
+    image_hash: str
+    phash: str | None = None
+    user_id: str | None = None
+
+
+@dataclass(frozen=True)
+class CachedAnalysis:
+    """A cached Gemini result and where it was found."""
+    result: GeminiParseResult
+    token_count: int
+    tier: str  # "local" | "db"
+
+
+def perceptual_hash(image_bytes: bytes) -> str | None:
+    """Difference hash of the image, or None if it can't be computed."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        import io
+
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            gray = img.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE))
+            pixels = gray.tobytes()
+    except Exception:
+        logger.debug("Could not compute perceptual hash", exc_info=True)
+        return None
+
+    bits = 0
+    width = PHASH_SIZE + 1
+    for row in range(PHASH_SIZE):
+        for col in range(PHASH_SIZE):
+            left = pixels[row * width + col]
+            right = pixels[row * width + col + 1]
+            bits = (bits << 1) | (left - right > PHASH_THRESHOLD)
+    return f"{bits:0{PHASH_SIZE * PHASH_SIZE // 4}x}"
+
+
+def cache_key(image_bytes: bytes, user_id: str | None = None) -> CacheKey:
+    """Compute the cache key for a screenshot sent by `user_id`. Without a
+    user only the exact hash is used."""
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    phash = None
+    if config.ANALYSIS_CACHE_PHASH and user_id:
+        phash = perceptual_hash(image_bytes)
+    return CacheKey(image_hash=image_hash, phash=phash, user_id=user_id if phash else None)
+
+
+def _local_keys(key: CacheKey, exact: bool = True) -> list[str]:
+    """Local keys for `key`; exact=False leaves out the shared SHA-256 key
+    for results that only matched perceptually."""
+    keys = [f"sha:{key.image_hash}"] if exact else []
+    if key.phash:
+        keys.append(f"ph:{key.user_id}:{key.phash}")
+    return keys
+
+
+def _local_get(key: CacheKey) -> CachedAnalysis | None:
+    with _local_lock:
+        for k in _local_keys(key):
+            if k in _local:
+                _local.move_to_end(k)
+                return _local[k]
+    return None
+
+
+def _local_put(key: CacheKey, entry: CachedAnalysis, exact: bool = True) -> None:
+    with _local_lock:
+        for k in _local_keys(key, exact):
+            _local[k] = entry
+            _local.move_to_end(k)
+        while len(_local) > LOCAL_CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def clear_local() -> None:
+    """Empty the in-process tier."""
+    with _local_lock:
+        _local.clear()
+
+
+def lookup(key: CacheKey) -> CachedAnalysis | None:
+    """Return a cached analysis for this screenshot, or None on a miss."""
+    entry = _local_get(key)
+    if entry:
+        return CachedAnalysis(entry.result, entry.token_count, "local")
+
+    try:
+        row = get_cached_analysis(key.image_hash, key.phash, key.user_id)
+    except Exception:
+        logger.exception("Analysis cache lookup failed")
+        return None
+    if not row:
+        return None
+
+    try:
+        result = GeminiParseResult(**row["result"])
+    except Exception:
+        logger.warning("Discarding invalid analysis cache row for %s", key.image_hash)
+        return None
+
+    entry = CachedAnalysis(result, row.get("token_count") or 0, "db")
+    # A perceptual match belongs to this user only; under the SHA-256 key it
+    # would be served to anyone sending byte-identical bytes.
+    _local_put(key, entry, exact=row.get("image_hash") == key.image_hash)
+    return entry
+
+
+def store(key: CacheKey, result: GeminiParseResult, token_count: int) -> None:
+    """Cache a successful analysis in both tiers. Never raises."""
+    if not result.words:
+        # Empty results may be a transient model failure; don't pin them.
+        return
+
+    _local_put(key, CachedAnalysis(result, token_count, "local"))
+    try:
+        save_cached_analysis(key.image_hash, key.phash, key.user_id, result, token_count)
+    except Exception:
+        logger.exception("Analysis cache write failed")
@@ -0,0 +1,127 @@
+"""Async concurrency helpers for webhook processing."""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+
+async def run_keyed(
+    items: Iterable[_T],
+    key: Callable[[_T], Hashable],
+    handler: Callable[[_T], Awaitable[None]],
+    limit: int,
+) -> None:
+    """Run handler over items concurrently, at most `limit` at a time.
+
+    Items sharing a key run one after another in their original order;
+    different keys run in parallel. A failing item is logged and does not
+    affect the others.
+    """
+    chains: dict[Hashable, list[_T]] = {}
+    for item in items:
+        chains.setdefault(key(item), []).append(item)
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run_chain(chain: list[_T]) -> None:
+        for item in chain:
+            async with semaphore:
+                try:
+                    await handler(item)
+                except Exception:
+                    logger.exception("Unhandled error in keyed task")
+
+    await asyncio.gather(*(_run_chain(chain) for chain in chains.values()))
+
+
+@dataclass
+class _PendingBatch(Generic[_T, _R]):
+    items: list[_T] = field(default_factory=list)
+    futures: list[asyncio.Future] = field(default_factory=list)
+    expected: int = 1
+    timer: asyncio.TimerHandle | None = None
+
+
+class MicroBatcher(Generic[_T, _R]):
+    """Collect items submitted under the same key and run them as one batch.
+
+    A batch is dispatched when it holds `expected` items (the largest hint
+    given by its submitters, capped at max_size) or when `window` seconds
+    have passed since its first item, whichever comes first. A single item
+    with expected=1 is dispatched immediately.
+
+    `run_batch` receives the items and returns one result per item, in
+    order; a returned Exception is raised to that item's submitter only.
+    It runs in a fresh context rather than the dispatching submitter's, so
+    its tracing spans aren't charged to that one request.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[list[_T]], Awaitable[list]],
+        window: float,
+        max_size: int,
+    ) -> None:
+        self._run_batch = run_batch
+        self.window = window
+        self.max_size = max_size
+        self._open: dict[Hashable, _PendingBatch[_T, _R]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, item: _T, expected: int = 1) -> _R:
+        loop = asyncio.get_running_loop()
+        batch = self._open.get(key)
+        if batch is None:
+            batch = _PendingBatch()
+            self._open[key] = batch
+            batch.timer = loop.call_later(self.window, self._dispatch, key, batch)
+
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        batch.expected = max(batch.expected, expected)
+
+        if len(batch.items) >= min(batch.expected, self.max_size):
+            self._dispatch(key, batch)
+
+        # Shield: one submitter timing out must not cancel the shared batch
+        return await asyncio.shield(future)
+
+    def _dispatch(self, key: Hashable, batch: _PendingBatch[_T, _R]) -> None:
+        if self._open.get(key) is not batch:
+            return  # already dispatched
+        del self._open[key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.get_running_loop().create_task(
+            self._run(batch), context=contextvars.Context()
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _PendingBatch[_T, _R]) -> None:
+        try:
+            results = await self._run_batch(batch.items)
+            if len(results) != len(batch.items):
+                raise RuntimeError(
+                    f"Batch returned {len(results)} results for {len(batch.items)} items"
+                )
+        except Exception as e:
+            results = [e] * len(batch.items)
+
+        for future, result in zip(batch.futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
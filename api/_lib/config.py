@@ -19,10 +19,57 @@ ADMIN_LINE_USER_ID: str = os.environ.get("ADMIN_LINE_USER_ID", "").strip()
 # Storage
 STORAGE_BUCKET = "user_screenshots"
 
+# Analysis cache: also match re-encoded copies by perceptual hash (needs Pillow).
+# Near-identical screenshots with different text can collide, so perceptual
+# matches only reuse the same user's earlier analyses (see analysis_cache).
+ANALYSIS_CACHE_PHASH: bool = os.environ.get("ANALYSIS_CACHE_PHASH", "").strip() == "1"
+
+# Queue mode: webhook only persists events; api/worker.py processes them
+WEBHOOK_QUEUE_MODE: bool = os.environ.get("WEBHOOK_QUEUE_MODE", "").strip() == "1"
+# Bearer token required by the worker's HTTP trigger (same as the web cron;
+# the trigger is disabled if empty)
+CRON_SECRET: str = os.environ.get("CRON_SECRET", "").strip()
+
+# Warm instances sharing LINE's per-channel push rate limits (see line_push)
+LINE_PUSH_INSTANCES: int = int(os.environ.get("LINE_PUSH_INSTANCES", "").strip() or 4)
+
+# Webhook event dedup: "memory" (per process) or "postgres" (shared)
+DEDUP_BACKEND: str = os.environ.get("DEDUP_BACKEND", "memory").strip().lower()
+
+# Stream Gemini output and push the first cards before the rest are parsed
+GEMINI_STREAMING: bool = os.environ.get("GEMINI_STREAMING", "").strip() == "1"
+
+# Analyze screenshots sent together in one multi-image Gemini request
+GEMINI_BATCHING: bool = os.environ.get("GEMINI_BATCHING", "").strip() == "1"
+
+# Route simple screenshots to a faster model and hedge slow Gemini calls
+GEMINI_ROUTING: bool = os.environ.get("GEMINI_ROUTING", "").strip() == "1"
+
+# Optional OTLP/HTTP collector for pipeline traces, e.g. http://localhost:4318
+OTEL_EXPORTER_OTLP_ENDPOINT: str = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "").strip()
+
+# Write per-instance metric rollups to Supabase; bearer token for /api/metrics (disabled if empty)
+METRICS_ROLLUP: bool = os.environ.get("METRICS_ROLLUP", "").strip() == "1"
+METRICS_TOKEN: str = os.environ.get("METRICS_TOKEN", "").strip()
+
 # Brand
 BRAND_COLOR = "#06C755"
 BRAND_NAME = "SnappWord 截詞"
 
+# The Gemini request modes are alternatives: the pipeline picks one per
+# screenshot, so enabling several would silently ignore all but the first.
+_GEMINI_MODES = [
+    name
+    for name, enabled in (
+        ("GEMINI_STREAMING", GEMINI_STREAMING),
+        ("GEMINI_BATCHING", GEMINI_BATCHING),
+        ("GEMINI_ROUTING", GEMINI_ROUTING),
+    )
+    if enabled
+]
+if len(_GEMINI_MODES) > 1:
+    raise RuntimeError(f"Enable at most one of {', '.join(_GEMINI_MODES)}")
+
 # Startup validation (skip during tests)
 import sys as _sys
 
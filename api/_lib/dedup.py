@@ -0,0 +1,105 @@
+"""Webhook event deduplication backends.
+
+LINE redelivers webhook events it thinks were not handled (e.g. while a slow
+Gemini call keeps the request open). Each backend answers "which of these
+webhookEventIds were seen before?" for a whole delivery and records the
+rest in the same step.
+
+- MemoryDedupStore: per-process, O(1) expiry via an insertion-ordered TTL map
+- PostgresDedupStore: shared across instances via a unique key in
+  webhook_events (one insert per delivery), with a local memory tier in
+  front. Expired rows are deleted by cleanup(), which the queue worker calls
+  off the request path.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Protocol
+
+from . import config
+from .supabase_client import delete_webhook_events_before, record_webhook_events
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MEMORY_WINDOW = 300  # seconds
+SHARED_WINDOW = 24 * 60 * 60  # seconds
+CLEANUP_INTERVAL = 10 * 60  # seconds between TTL sweeps per process
+
+
+class DedupStore(Protocol):
+    async def duplicates(self, event_ids: list[str]) -> set[str]:
+        """Return the ids seen before; record the others."""
+        ...
+
+    async def cleanup(self) -> None:
+        """Drop records older than the dedup window. Never raises."""
+        ...
+
+
+class MemoryDedupStore:
+    """In-process dedup. Lost on cold start and not shared across instances."""
+
+    def __init__(self, window: float = MEMORY_WINDOW, maxsize: int = 10_000) -> None:
+        self._seen: TTLCache[str, bool] = TTLCache(ttl=window, maxsize=maxsize)
+
+    def check_and_mark(self, event_id: str) -> bool:
+        if event_id in self._seen:
+            return True
+        self._seen.set(event_id, True)
+        return False
+
+    async def duplicates(self, event_ids: list[str]) -> set[str]:
+        return {event_id for event_id in event_ids if self.check_and_mark(event_id)}
+
+    async def cleanup(self) -> None:
+        pass  # entries expire in the TTL map
+
+
+class PostgresDedupStore:
+    """Shared dedup backed by the webhook_events table's primary key.
+
+    Falls back to the local memory tier if the database is unreachable, so
+    events are never dropped because dedup failed.
+    """
+
+    def __init__(self, window: float = SHARED_WINDOW) -> None:
+        self.window = window
+        self._local = MemoryDedupStore()
+        self._last_cleanup = 0.0
+
+    async def duplicates(self, event_ids: list[str]) -> set[str]:
+        unique = list(dict.fromkeys(event_ids))
+        seen = {event_id for event_id in unique if self._local.check_and_mark(event_id)}
+        fresh = [event_id for event_id in unique if event_id not in seen]
+        if not fresh:
+            return seen
+        try:
+            inserted = await asyncio.to_thread(record_webhook_events, fresh)
+        except Exception:
+            logger.exception("Shared dedup lookup failed, using local store only")
+            return seen
+        return seen | (set(fresh) - inserted)
+
+    async def cleanup(self) -> None:
+        """Delete expired rows, at most once per CLEANUP_INTERVAL per process."""
+        now = time.monotonic()
+        if now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.window)
+        try:
+            await asyncio.to_thread(delete_webhook_events_before, cutoff.isoformat())
+        except Exception:
+            logger.exception("Failed to clean up expired webhook events")
+
+
+def get_dedup_store() -> DedupStore:
+    """Build the backend selected by DEDUP_BACKEND ("memory" or "postgres")."""
+    if config.DEDUP_BACKEND == "postgres":
+        return PostgresDedupStore()
+    return MemoryDedupStore()
@@ -2,17 +2,18 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-import re
 import time
+from typing import AsyncIterator
 
-from google import genai
-from google.genai import types
 from pydantic import ValidationError
 
-from . import config
-from .models import GeminiParseResult
+from . import config, metrics, resilience, tracing
+from .json_stream import HEADER_KEYS, IncrementalWordParser
+from .lazy_import import LazyModule
+from .models import GeminiParseResult, ParsedWord
 
 logger = logging.getLogger(__name__)
 
@@ -66,78 +67,353 @@ If the image truly contains NO text or language content at all (e.g., a pure pho
 ALLOWED_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
 
 
+GEMINI_MODEL = "gemini-2.0-flash"
+USER_PROMPT = "Analyze this screenshot and extract vocabulary words. Output strict JSON only."
+
+# The SDK is imported on first use, so events that never reach Gemini
+# (follow, text, postback) don't pay for it on a cold start.
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
+errors = LazyModule("google.genai.errors")
+
+_client: genai.Client | None = None
+
+
+def load_sdk() -> None:
+    """Import the Gemini SDK now, e.g. in a worker thread while the
+    screenshot pipeline waits on LINE and Supabase."""
+    genai.load()
+    types.load()
+    errors.load()
+
+
+def sdk_loaded() -> bool:
+    """Whether load_sdk() has nothing left to import."""
+    return genai.loaded and types.loaded and errors.loaded
+
+
 def _get_client() -> genai.Client:
-    return genai.Client(api_key=config.GEMINI_API_KEY)
+    """Return the process-wide Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = genai.Client(api_key=config.GEMINI_API_KEY)
+    return _client
+
+
+async def _generate_async(call, request: dict, model: str = GEMINI_MODEL):
+    """Await call(**request) behind the Gemini circuit breaker, so a tripped
+    breaker raises resilience.DependencyUnavailable. Used by the one-shot
+    aio request paths; streams are guarded in ScreenshotStream."""
+    with tracing.span("gemini.generate", model=model):
+        async with resilience.gemini.aguard():
+            return await call(**request)
+
+
+def _generation_config(max_output_tokens: int) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        system_instruction=SYSTEM_PROMPT,
+        response_mime_type="application/json",
+        temperature=0.2,
+        max_output_tokens=max_output_tokens,
+    )
+
+
+def _build_request(image_bytes: bytes, mime_type: str, model: str = GEMINI_MODEL) -> dict:
+    """Build generate_content kwargs for one screenshot."""
+    if mime_type not in ALLOWED_MIME_TYPES:
+        mime_type = "image/jpeg"
+
+    return {
+        "model": model,
+        "contents": [
+            types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
+            USER_PROMPT,
+        ],
+        "config": _generation_config(max_output_tokens=2048),
+    }
 
 
-def analyze_screenshot(
+def _usage(usage_metadata, share: int = 1) -> dict:
+    """Token counts for api_logs; cached_tokens were served from Gemini's
+    implicit prompt cache."""
+    total = getattr(usage_metadata, "total_token_count", 0) or 0
+    prompt = getattr(usage_metadata, "prompt_token_count", 0) or 0
+    cached = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+    return {
+        "token_count": total // share,
+        "cached_tokens": cached // share,
+        "uncached_tokens": max(prompt - cached, 0) // share,
+    }
+
+
+def _record_call(model: str, latency_ms: int, usage: dict) -> None:
+    """Feed one Gemini request into the latency and token histograms."""
+    metrics.gemini_latency.observe(latency_ms / 1000, model=model)
+    metrics.gemini_tokens.observe(usage["token_count"], model=model)
+    if usage["cached_tokens"]:
+        metrics.gemini_cached_tokens.inc(usage["cached_tokens"], model=model)
+
+
+def _build_result(response, start: float, model: str) -> tuple[GeminiParseResult, dict]:
+    latency_ms = int((time.time() - start) * 1000)
+
+    metadata: dict = {
+        "latency_ms": latency_ms,
+        "model": model,
+        **_usage(response.usage_metadata),
+    }
+    _record_call(model, latency_ms, metadata)
+
+    with tracing.span("gemini.parse"):
+        parsed = _parse_response(response.text)
+    return parsed, metadata
+
+
+async def analyze_screenshot_async(
     image_bytes: bytes,
     mime_type: str = "image/jpeg",
+    model: str = GEMINI_MODEL,
 ) -> tuple[GeminiParseResult, dict]:
     """
-    Send screenshot to Gemini for analysis.
+    Send a screenshot to Gemini for analysis, using the SDK's aio interface.
+
+    Runs on the event loop instead of a worker thread, so cancelling the
+    awaiting task (e.g. via asyncio.wait_for) aborts the in-flight request.
 
     Returns:
-        (parsed_result, metadata) where metadata contains latency_ms and token_count
+        (parsed_result, metadata) where metadata contains latency_ms, the
+        serving model, token_count and the cached/uncached prompt token split
     """
-    if mime_type not in ALLOWED_MIME_TYPES:
-        mime_type = "image/jpeg"
+    start = time.time()
+    response = await _generate_async(
+        _get_client().aio.models.generate_content,
+        _build_request(image_bytes, mime_type, model),
+        model,
+    )
+    return _build_result(response, start, model)
+
 
-    client = _get_client()
+BATCH_PROMPT = (
+    "You received {count} screenshots, labelled Image 0 to Image {last}. "
+    "Analyze each screenshot independently using the rules above. "
+    'Output strict JSON only: {{"results": [...]}} with exactly one object per '
+    'image, in order. Each object has an "image_index" field plus the fields '
+    "of the OUTPUT FORMAT."
+)
+# Output budget per image in a batch, and overall cap (the model's maximum).
+# Larger batches are split so every image keeps its full budget.
+BATCH_TOKENS_PER_IMAGE = 2048
+BATCH_MAX_OUTPUT_TOKENS = 8192
+BATCH_MAX_IMAGES_PER_REQUEST = BATCH_MAX_OUTPUT_TOKENS // BATCH_TOKENS_PER_IMAGE
+
+
+async def analyze_screenshots_batch_async(
+    images: list[tuple[bytes, str]],
+) -> list[tuple[GeminiParseResult, dict] | None]:
+    """
+    Analyze several screenshots in one Gemini request.
+
+    The system prompt is sent once for the whole batch. Returns one entry
+    per input image, in order; an entry is None when the model gave no
+    usable result for that image (callers fall back to a single request).
+    Token usage (total, cached and uncached) is split evenly across the images.
+    More than BATCH_MAX_IMAGES_PER_REQUEST images are sent as several
+    concurrent requests.
+    """
+    if len(images) > BATCH_MAX_IMAGES_PER_REQUEST:
+        chunks = [
+            images[i:i + BATCH_MAX_IMAGES_PER_REQUEST]
+            for i in range(0, len(images), BATCH_MAX_IMAGES_PER_REQUEST)
+        ]
+        parts = await asyncio.gather(*(analyze_screenshots_batch_async(chunk) for chunk in chunks))
+        return [result for part in parts for result in part]
+
+    contents: list = []
+    for index, (image_bytes, mime_type) in enumerate(images):
+        if mime_type not in ALLOWED_MIME_TYPES:
+            mime_type = "image/jpeg"
+        contents.append(f"Image {index}:")
+        contents.append(types.Part.from_bytes(data=image_bytes, mime_type=mime_type))
+    contents.append(BATCH_PROMPT.format(count=len(images), last=len(images) - 1))
+    max_output_tokens = min(BATCH_TOKENS_PER_IMAGE * len(images), BATCH_MAX_OUTPUT_TOKENS)
 
     start = time.time()
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[
-            types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
-            "Analyze this screenshot and extract vocabulary words. Output strict JSON only.",
-        ],
-        config=types.GenerateContentConfig(
-            system_instruction=SYSTEM_PROMPT,
-            response_mime_type="application/json",
-            temperature=0.2,
-            max_output_tokens=2048,
-        ),
+    response = await _generate_async(
+        _get_client().aio.models.generate_content,
+        {
+            "model": GEMINI_MODEL,
+            "contents": contents,
+            "config": _generation_config(max_output_tokens),
+        },
     )
     latency_ms = int((time.time() - start) * 1000)
+    _record_call(GEMINI_MODEL, latency_ms, _usage(response.usage_metadata))
+    usage = _usage(response.usage_metadata, share=len(images))
 
-    metadata: dict = {
-        "latency_ms": latency_ms,
-        "token_count": getattr(response.usage_metadata, "total_token_count", 0),
-    }
+    results: list[tuple[GeminiParseResult, dict] | None] = [None] * len(images)
+    for position, item in enumerate(_batch_items(response.text)):
+        index = item.get("image_index", position)
+        if not isinstance(index, int) or not 0 <= index < len(images) or results[index]:
+            continue
+        metadata = {
+            "latency_ms": latency_ms,
+            "model": GEMINI_MODEL,
+            **usage,
+            "batch_size": len(images),
+        }
+        results[index] = (_coerce_result(item, item.get("words")), metadata)
+    return results
 
-    raw_text = response.text
-    parsed = _parse_response(raw_text)
-    return parsed, metadata
+
+def _batch_items(raw: str) -> list[dict]:
+    """Per-image objects of a batch response.
+
+    A response cut off at max_output_tokens still yields every complete
+    element of results[]; the images it missed are retried by the caller.
+    """
+    try:
+        data = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        parser = IncrementalWordParser(array_key="results")
+        items = parser.feed(raw or "")
+        logger.warning("Batch Gemini response is not valid JSON; salvaged %d results", len(items))
+        return items
+    items = data.get("results") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return []
+    return [item for item in items if isinstance(item, dict)]
+
+
+class ScreenshotStream:
+    """Streamed analysis that yields each ParsedWord as soon as it is complete.
+
+    Usage:
+        stream = ScreenshotStream(image_bytes, mime_type)
+        async for word in stream:
+            ...
+        stream.result, stream.metadata  # available after iteration
+
+    Cancelling the consuming task aborts the underlying request.
+    """
+
+    def __init__(self, image_bytes: bytes, mime_type: str = "image/jpeg") -> None:
+        self._image = (image_bytes, mime_type)
+        self.parser = IncrementalWordParser()
+        self.result: GeminiParseResult | None = None
+        self.metadata: dict = {}
+
+    def __aiter__(self) -> AsyncIterator[ParsedWord]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[ParsedWord]:
+        start = time.time()
+        first_word_ms = None
+        usage = None
+        words: list[ParsedWord] = []
+
+        # The request runs (and fails) while the stream is read, so the
+        # breaker and the span cover the whole iteration, not just the call
+        # that returns the lazy stream
+        with tracing.leaf_span("gemini.generate", model=GEMINI_MODEL, streamed=True):
+            async with resilience.gemini.aguard():
+                stream = await _get_client().aio.models.generate_content_stream(
+                    **_build_request(*self._image)
+                )
+                async for chunk in stream:
+                    if chunk.usage_metadata is not None:
+                        usage = chunk.usage_metadata
+                    for item in self.parser.feed(chunk.text or ""):
+                        word = _validate_word(item)
+                        if word is None:
+                            continue
+                        if first_word_ms is None:
+                            first_word_ms = int((time.time() - start) * 1000)
+                        words.append(word)
+                        yield word
+
+        if words:
+            result = GeminiParseResult(**self.parser.header, words=words)
+        else:
+            # Stream didn't match the expected shape; fall back to a full parse
+            result = _parse_response(self.parser.text)
+            for word in result.words:
+                yield word
+
+        self.result = result
+        self.metadata = {
+            "latency_ms": int((time.time() - start) * 1000),
+            "model": GEMINI_MODEL,
+            "first_word_ms": first_word_ms,
+            **_usage(usage),
+            "streamed": True,
+        }
+        _record_call(GEMINI_MODEL, self.metadata["latency_ms"], self.metadata)
+
+
+def _validate_word(item: dict) -> ParsedWord | None:
+    try:
+        return ParsedWord(**item)
+    except (TypeError, ValidationError):
+        logger.debug("Skipping invalid word entry: %r", item)
+        return None
 
 
 def _parse_response(raw: str) -> GeminiParseResult:
-    """Parse Gemini response text into structured result with fallback."""
-    # Attempt 1: direct parse
+    """Parse Gemini response text into structured result, salvaging what it can.
+
+    Well-formed JSON takes one json.loads. Anything else (markdown fences,
+    prose around the object, truncation at max_output_tokens) goes through a
+    single pass of IncrementalWordParser, which keeps every complete element
+    of words[]. Words are validated one by one, so a single bad entry no
+    longer discards the whole result.
+    """
     try:
         data = json.loads(raw)
-        return GeminiParseResult(**data)
-    except (json.JSONDecodeError, ValidationError):
-        logger.debug("Direct JSON parse failed, trying fallback")
-
-    # Attempt 2: extract JSON block from markdown fences
-    match = re.search(r"```(?:json)?\s*(\{[\s\S]*?\})\s*```", raw)
-    if match:
-        try:
-            data = json.loads(match.group(1))
-            return GeminiParseResult(**data)
-        except (json.JSONDecodeError, ValidationError):
-            logger.debug("Markdown fence parse failed, trying fallback")
-
-    # Attempt 3: find first { ... } block (greedy to handle nested objects)
-    match = re.search(r"\{[\s\S]*\}", raw)
-    if match:
-        try:
-            data = json.loads(match.group(0))
-            return GeminiParseResult(**data)
-        except (json.JSONDecodeError, ValidationError):
-            logger.debug("Regex JSON extract failed")
-
-    # All attempts failed
-    logger.warning("All Gemini response parsing attempts failed")
-    return GeminiParseResult(words=[])
+    except (json.JSONDecodeError, TypeError):
+        data = None
+
+    if isinstance(data, dict):
+        items = data.get("words")
+        header = data
+        outcome = "json"
+    elif isinstance(data, list):
+        items = data
+        header = {}
+        outcome = "json"
+    else:
+        logger.debug("Direct JSON parse failed, salvaging words incrementally")
+        parser = IncrementalWordParser()
+        items = parser.feed(raw or "")
+        header = parser.header
+        outcome = "salvaged"
+        if not parser.complete:
+            logger.info("Gemini response truncated, salvaged %d words", len(items))
+            outcome = "truncated"
+
+    if not items and data is None:
+        logger.warning("All Gemini response parsing attempts failed")
+        outcome = "failed"
+    metrics.parse_outcomes.inc(outcome=outcome)
+
+    return _coerce_result(header, items)
+
+
+def _coerce_result(header: dict, items) -> GeminiParseResult:
+    """Build a GeminiParseResult, validating each word independently."""
+    if not isinstance(items, list):
+        items = []
+
+    words = []
+    for item in items:
+        word = _validate_word(item) if isinstance(item, dict) else None
+        if word is not None:
+            words.append(word)
+    skipped = len(items) - len(words)
+    if skipped:
+        logger.info("Dropped %d invalid word entries from Gemini response", skipped)
+        metrics.parse_dropped_words.inc(skipped)
+
+    return GeminiParseResult(
+        words=words,
+        **{k: header[k] for k in HEADER_KEYS if isinstance(header.get(k), str)},
+    )
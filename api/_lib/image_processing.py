@@ -0,0 +1,156 @@
+"""Screenshot preprocessing before upload and Gemini analysis.
+
+Phone screenshots arrive as multi-megabyte PNG/JPEG at native resolution.
+Gemini tiles images at 768px, so pixels beyond what keeps the text legible
+only add input tokens. We detect the real format, crop status/nav-bar
+chrome, downscale and re-encode so uploads, storage and tokens all shrink.
+
+Downscaling caps the pixel count rather than the long edge: a tall scroll
+capture squeezed into a fixed long edge becomes too narrow to read, so the
+short edge is never taken below MIN_SHORT_EDGE.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Pixel budget (a phone screenshot lands around 850x1850) and the short
+# edge below which text stops being legible
+MAX_PIXELS = 1536 * 1024
+MIN_SHORT_EDGE = 720
+# Portrait screenshots with a phone screen's height / width may carry a
+# status bar and navigation bar; taller images are scroll captures.
+PHONE_ASPECT_RANGE = (1.7, 2.35)
+STATUS_BAR_RATIO = 0.04
+NAV_BAR_RATIO = 0.03
+# An edge band is only cropped when it looks like a bar: this share of its
+# pixels in one brightness bin (the clock and icons are small)
+BAR_UNIFORMITY = 0.85
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+_MAGIC: list[tuple[bytes, int, str]] = [
+    (b"\xff\xd8\xff", 0, "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", 0, "image/png"),
+    (b"WEBP", 8, "image/webp"),
+    (b"GIF8", 0, "image/gif"),
+]
+
+EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """Image bytes ready for upload and analysis."""
+    data: bytes
+    mime_type: str
+    original_size: int
+    # Pixel dimensions of `data`; 0 when the image could not be decoded
+    width: int = 0
+    height: int = 0
+
+
+def detect_mime_type(data: bytes) -> str:
+    """Detect the image format from magic bytes (defaults to JPEG)."""
+    for magic, offset, mime in _MAGIC:
+        if data[offset:offset + len(magic)] == magic:
+            return mime
+    return "image/jpeg"
+
+
+def _is_bar(band) -> bool:
+    # 16 brightness bins: anti-aliased icons stay in few bins, content spreads
+    histogram = band.convert("L").point(lambda v: v // 16).histogram()
+    return max(histogram) >= BAR_UNIFORMITY * sum(histogram)
+
+
+def _crop_chrome(img):
+    width, height = img.size
+    low, high = PHONE_ASPECT_RANGE
+    if not low <= height / max(width, 1) <= high:
+        return img
+    top = int(height * STATUS_BAR_RATIO)
+    bottom = height - int(height * NAV_BAR_RATIO)
+    if not _is_bar(img.crop((0, 0, width, top))):
+        top = 0
+    if not _is_bar(img.crop((0, bottom, width, height))):
+        bottom = height
+    if (top, bottom) == (0, height):
+        return img
+    return img.crop((0, top, width, bottom))
+
+
+def _downscale(img):
+    from PIL import Image
+
+    width, height = img.size
+    if width * height <= MAX_PIXELS:
+        return img
+    scale = (MAX_PIXELS / (width * height)) ** 0.5
+    # Keep the short edge legible, even if that exceeds the pixel budget
+    scale = min(1.0, max(scale, MIN_SHORT_EDGE / min(width, height)))
+    if scale >= 1.0:
+        return img
+    return img.resize(
+        (max(1, round(width * scale)), max(1, round(height * scale))),
+        Image.Resampling.LANCZOS,
+    )
+
+
+def _encode(img) -> tuple[bytes, str]:
+    from PIL import features
+
+    out = io.BytesIO()
+    if features.check("webp"):
+        img.save(out, format="WEBP", quality=WEBP_QUALITY, method=4)
+        return out.getvalue(), "image/webp"
+    img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue(), "image/jpeg"
+
+
+def prepare_screenshot(data: bytes) -> PreparedImage:
+    """Crop, downscale and re-encode a screenshot.
+
+    Falls back to the original bytes (with their detected type) when the
+    image can't be decoded or re-encoding would not make it smaller.
+    """
+    mime_type = detect_mime_type(data)
+    original = PreparedImage(data=data, mime_type=mime_type, original_size=len(data))
+
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return original
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            source_size = img.size
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img = _downscale(_crop_chrome(img))
+            encoded, encoded_mime = _encode(img)
+            size = img.size
+    except Exception:
+        logger.warning("Screenshot preprocessing failed, using original bytes", exc_info=True)
+        return original
+
+    if len(encoded) >= len(data):
+        return PreparedImage(
+            data=data, mime_type=mime_type, original_size=len(data),
+            width=source_size[0], height=source_size[1],
+        )
+    return PreparedImage(
+        data=encoded, mime_type=encoded_mime, original_size=len(data),
+        width=size[0], height=size[1],
+    )
@@ -0,0 +1,49 @@
+"""Retry and dead-letter policy for the webhook job queue.
+
+Jobs live in the webhook_jobs table (see 010_webhook_jobs.sql); this module
+decides what happens after a worker has run one.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+
+from .supabase_client import update_webhook_job
+
+logger = logging.getLogger(__name__)
+
+BASE_BACKOFF_S = 5
+MAX_BACKOFF_S = 300
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with full jitter for the given attempt count."""
+    ceiling = min(MAX_BACKOFF_S, BASE_BACKOFF_S * 2 ** max(attempts - 1, 0))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def mark_done(job: dict) -> None:
+    update_webhook_job(job["id"], {"status": "done", "locked_at": None, "last_error": None})
+
+
+def mark_failed(job: dict, error: str) -> str:
+    """Requeue the job with backoff, or dead-letter it. Returns the new status."""
+    attempts = job.get("attempts") or 1
+    max_attempts = job.get("max_attempts") or 3
+    error = error[:1000]
+
+    if attempts >= max_attempts:
+        logger.error("Job %s dead after %d attempts: %s", job["id"], attempts, error)
+        update_webhook_job(job["id"], {"status": "dead", "locked_at": None, "last_error": error})
+        return "dead"
+
+    run_after = datetime.now(timezone.utc) + timedelta(seconds=backoff_seconds(attempts))
+    update_webhook_job(job["id"], {
+        "status": "queued",
+        "locked_at": None,
+        "last_error": error,
+        "run_after": run_after.isoformat(),
+    })
+    return "queued"
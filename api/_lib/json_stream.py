@@ -0,0 +1,174 @@
+"""Incremental parser for Gemini's vocabulary JSON.
+
+Gemini's output looks like {"source_app": ..., "words": [{...}, {...}]},
+possibly wrapped in markdown fences. IncrementalWordParser consumes the text
+chunk by chunk in a single pass, tracking string/escape state and nesting
+depth, and hands back each element of the top-level "words" array as soon
+as its closing brace arrives. Another top-level array can be followed
+instead (array_key="results" for batched responses).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+HEADER_KEYS = ("source_app", "target_lang", "source_lang")
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_STRUCTURAL_RE = re.compile(r'[{}\[\]"]')
+_STRING_RE = re.compile(r'["\\]')
+_DECODER = json.JSONDecoder()
+
+
+class IncrementalWordParser:
+    """Single-pass scanner that extracts complete `words[]` objects."""
+
+    def __init__(self, array_key: str = "words") -> None:
+        self._key_re = re.compile(rf'"{re.escape(array_key)}"\s*:\s*$')
+        self._text = ""
+        self._pos = 0           # next index of _text to scan
+        self._depth = 0         # nesting depth of {} / []
+        self._in_string = False
+        self._escape = False
+        self._started = False   # seen the top-level '{'
+        self._done = False      # top-level object closed
+        self._words_depth = 0   # depth of the words array (0 = not inside)
+        self._item_start = -1   # index of the current word's '{'
+        self.header: dict[str, str] = {}
+        self.words_seen = 0
+        self.invalid_items = 0
+
+    @property
+    def text(self) -> str:
+        """All text fed so far."""
+        return self._text
+
+    @property
+    def complete(self) -> bool:
+        """True once the top-level object has been closed."""
+        return self._done
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Consume a chunk; return word objects completed by it."""
+        if not chunk or self._done:
+            self._text += chunk or ""
+            return []
+        self._text += chunk
+        text = self._text
+        found: list[dict] = []
+
+        i = self._pos
+        n = len(text)
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                m = _STRING_RE.search(text, i)
+                if m is None:
+                    i = n
+                    break
+                if m.group() == "\\":
+                    self._escape = True
+                    i = m.end()
+                    continue
+                self._in_string = False
+                i = m.end()
+                continue
+
+            m = _STRUCTURAL_RE.search(text, i)
+            if m is None:
+                i = n
+                break
+            i = m.start()
+            ch = m.group()
+            if ch == '"':
+                if self._started:
+                    self._in_string = True
+            elif ch in "{[":
+                if not self._started:
+                    if ch == "{":
+                        self._started = True
+                        self._depth = 1
+                else:
+                    self._depth += 1
+                    if (
+                        ch == "["
+                        and self._depth == 2
+                        and not self._words_depth
+                        and self._key_re.search(text[max(0, i - 64):i])
+                    ):
+                        self._words_depth = 2
+                        self._read_header(text[:i])
+                    elif ch == "{" and self._words_depth and self._depth == self._words_depth + 1:
+                        # Fast path: decode the whole element at C speed when
+                        # it is already complete; otherwise keep scanning.
+                        try:
+                            item, end = _DECODER.raw_decode(text, i)
+                        except ValueError:
+                            self._item_start = i
+                        else:
+                            self._depth -= 1
+                            self.words_seen += 1
+                            if isinstance(item, dict):
+                                found.append(item)
+                            else:
+                                self.invalid_items += 1
+                            i = end
+                            continue
+            elif self._started:
+                if (
+                    ch == "}"
+                    and self._words_depth
+                    and self._depth == self._words_depth + 1
+                    and self._item_start >= 0
+                ):
+                    item = self._decode_item(text[self._item_start:i + 1])
+                    if item is not None:
+                        found.append(item)
+                    self._item_start = -1
+                elif ch == "]" and self._depth == self._words_depth:
+                    self._words_depth = 0
+                self._depth -= 1
+                if self._depth == 0:
+                    self._done = True
+                    self._read_header(text[:i + 1])
+                    i += 1
+                    break
+            i += 1
+
+        self._pos = i
+        return found
+
+    def _decode_item(self, raw: str) -> dict | None:
+        self.words_seen += 1
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError:
+            # Common model slip: trailing comma before } or ]
+            try:
+                item = json.loads(_TRAILING_COMMA_RE.sub(r"\1", raw))
+            except json.JSONDecodeError:
+                self.invalid_items += 1
+                logger.debug("Skipping undecodable word object")
+                return None
+        if not isinstance(item, dict):
+            self.invalid_items += 1
+            return None
+        return item
+
+    def _read_header(self, prefix: str) -> None:
+        for key in HEADER_KEYS:
+            if key in self.header:
+                continue
+            match = re.search(rf'"{key}"\s*:\s*"((?:[^"\\]|\\.)*)"', prefix)
+            if match:
+                try:
+                    self.header[key] = json.loads(f'"{match.group(1)}"')
+                except json.JSONDecodeError:
+                    continue
@@ -0,0 +1,40 @@
+"""Deferred imports for heavy SDKs.
+
+google.genai alone takes ~0.4 s to import, which every cold start used to
+pay before handling its first event — including follow, text and postback
+events that never call Gemini. A LazyModule stands in for the module at
+import time and imports it on first attribute access.
+"""
+
+from __future__ import annotations
+
+import importlib
+import sys
+from types import ModuleType
+
+
+class LazyModule:
+    """Module proxy: `types = LazyModule("google.genai.types")` imports on
+    the first `types.X`. Exception classes work too (`except errors.APIError`
+    only looks the name up once an exception is raised)."""
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module: ModuleType | None = None
+
+    def load(self) -> ModuleType:
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None or self._name in sys.modules
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
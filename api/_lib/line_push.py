@@ -0,0 +1,163 @@
+"""Rate-limited LINE message delivery with retries and multicast coalescing.
+
+Every push goes through a PushDispatcher:
+
+- a token bucket per endpoint keeps us under LINE's per-channel rate
+  limits (RATE_LIMITS, requests per second);
+- 429 and 5xx responses and transport errors are retried with jittered
+  exponential backoff (honouring Retry-After). Backoff sleeps stop
+  RETRY_BUDGET_S after the first attempt, so a push made late in an
+  invocation (e.g. after a slow Gemini call) cannot run past the platform
+  timeout; one final attempt follows. Each logical send carries one
+  X-Line-Retry-Key, so LINE never delivers a retried message twice, and
+  counts once towards the LINE circuit breaker: only its last attempt;
+- identical messages pushed to several users within COALESCE_WINDOW are
+  sent as one /message/multicast call (up to MULTICAST_MAX recipients).
+
+Request counts and latency per endpoint and status are recorded by
+line_client in metrics.line_push_*.
+
+Buckets are per process, so each instance gets RATE_LIMITS divided by
+config.LINE_PUSH_INSTANCES. More warm instances than that can exceed the
+channel limit; LINE then answers 429, which is retried as above.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable
+
+import httpx
+import orjson
+
+from . import config
+from .concurrency import MicroBatcher
+from .resilience import is_retryable_status
+
+logger = logging.getLogger(__name__)
+
+# Requests per second per channel (LINE Messaging API rate limits)
+RATE_LIMITS = {"push": 2000, "multicast": 200}
+MULTICAST_MAX = 500
+
+MAX_ATTEMPTS = 4
+BASE_BACKOFF_S = 0.5
+MAX_BACKOFF_S = 8.0
+# Total time retries may spend sleeping for one logical send
+RETRY_BUDGET_S = 5.0
+
+COALESCE_WINDOW = 0.05  # seconds
+
+# send_message(endpoint, payload, headers, will_retry) -> response, e.g.
+# endpoint "push"; will_retry is False on the last attempt
+SendMessage = Callable[[str, dict, dict, bool], Awaitable[httpx.Response]]
+
+
+def backoff_seconds(attempt: int, retry_after: str | None = None) -> float:
+    """Delay before retry number `attempt` (1-based), with full jitter."""
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_BACKOFF_S)
+        except ValueError:
+            pass
+    ceiling = min(MAX_BACKOFF_S, BASE_BACKOFF_S * 2 ** (attempt - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`; acquire() waits."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class PushDispatcher:
+    """Delivers push and multicast messages through `send_message`.
+
+    `send_message` performs one POST to /message/<endpoint> (line_client
+    passes one that uses its pooled, circuit-broken client).
+    """
+
+    def __init__(self, send_message: SendMessage) -> None:
+        self._send_message = send_message
+        share = max(1, config.LINE_PUSH_INSTANCES)
+        self._buckets = {
+            endpoint: TokenBucket(rate / share) for endpoint, rate in RATE_LIMITS.items()
+        }
+        self._coalescer: MicroBatcher[tuple[str, list[dict]], None] = MicroBatcher(
+            self._send_coalesced, window=COALESCE_WINDOW, max_size=MULTICAST_MAX
+        )
+
+    async def push(self, user_id: str, messages: list[dict], coalesce: bool = False) -> None:
+        """Push to one user. With coalesce=True, identical messages pushed to
+        other users within COALESCE_WINDOW share one multicast call."""
+        if not coalesce:
+            await self._send("push", {"to": user_id, "messages": messages})
+            return
+        key = orjson.dumps(messages, option=orjson.OPT_SORT_KEYS)
+        await self._coalescer.submit(key, (user_id, messages), expected=MULTICAST_MAX)
+
+    async def multicast(self, user_ids: list[str], messages: list[dict]) -> None:
+        """Send the same messages to many users, MULTICAST_MAX per request."""
+        user_ids = list(dict.fromkeys(user_ids))
+        if len(user_ids) == 1:
+            await self._send("push", {"to": user_ids[0], "messages": messages})
+            return
+        await asyncio.gather(*(
+            self._send("multicast", {"to": chunk, "messages": messages})
+            for chunk in (
+                user_ids[i:i + MULTICAST_MAX] for i in range(0, len(user_ids), MULTICAST_MAX)
+            )
+        ))
+
+    async def _send_coalesced(self, items: list[tuple[str, list[dict]]]) -> list[None]:
+        # Every item in one batch carries the same (identical) messages
+        await self.multicast([user_id for user_id, _ in items], items[0][1])
+        return [None] * len(items)
+
+    async def _send(self, endpoint: str, payload: dict) -> None:
+        """POST with rate limiting and retries. HTTP errors are logged, not raised."""
+        headers = {"X-Line-Retry-Key": str(uuid.uuid4())}
+        deadline = time.monotonic() + RETRY_BUDGET_S
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self._buckets[endpoint].acquire()
+            last = attempt == MAX_ATTEMPTS or time.monotonic() >= deadline
+            try:
+                resp = await self._send_message(endpoint, payload, headers, not last)
+            except httpx.TransportError:
+                if last:
+                    raise
+                retry_after = None
+            else:
+                # 409 on a retry: LINE already accepted this retry key
+                if resp.is_success or (attempt > 1 and resp.status_code == 409):
+                    return
+                if not is_retryable_status(resp.status_code) or last:
+                    logger.warning("LINE %s failed: %d %s", endpoint, resp.status_code, resp.text)
+                    return
+                retry_after = resp.headers.get("Retry-After")
+            delay = backoff_seconds(attempt, retry_after)
+            await asyncio.sleep(max(0.0, min(delay, deadline - time.monotonic())))
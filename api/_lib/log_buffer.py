@@ -0,0 +1,118 @@
+"""Batched, asynchronous writer for api_logs.
+
+Log calls only append to an in-memory buffer. Rows are written with a
+single bulk insert when the batch is full, when the oldest row is older
+than MAX_AGE, or when the request handler calls flush() before returning.
+A batch whose insert fails is kept and retried once by the next flush() —
+api_logs rows also back the quota counts, so they are not dropped on the
+first transient error.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from .supabase_client import log_events, log_row
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 50
+MAX_AGE = 2.0  # seconds
+# Rows kept while writes are slow or failing; new rows beyond this are dropped.
+MAX_PENDING = 1000
+
+
+class LogBuffer:
+    """Collects log rows and writes them in bulk from a worker thread."""
+
+    def __init__(
+        self,
+        writer: Callable[[list[dict]], None],
+        max_batch: int = MAX_BATCH,
+        max_age: float = MAX_AGE,
+        max_pending: int = MAX_PENDING,
+    ) -> None:
+        self._writer = writer
+        self.max_batch = max_batch
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self._rows: list[dict] = []
+        self._oldest: float | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._failed: list[dict] = []
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, row: dict) -> None:
+        """Queue a row; schedules a background flush when a threshold is hit."""
+        if len(self._rows) >= self.max_pending:
+            if self.dropped == 0:
+                logger.warning("Log buffer full (%d rows), dropping new rows", self.max_pending)
+            self.dropped += 1
+            return
+
+        now = time.monotonic()
+        if not self._rows:
+            self._oldest = now
+        self._rows.append(row)
+
+        if len(self._rows) >= self.max_batch or now - (self._oldest or now) >= self.max_age:
+            self._schedule_flush()
+
+    def _take(self) -> list[dict]:
+        rows, self._rows = self._rows, []
+        self._oldest = None
+        return rows
+
+    def _schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop: rows wait for the next explicit flush()
+        task = loop.create_task(self._write(self._take()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, rows: list[dict], retry: bool = True) -> None:
+        if not rows:
+            return
+        try:
+            await asyncio.to_thread(self._writer, rows)
+        except Exception:
+            if retry and len(self._failed) + len(rows) <= self.max_pending:
+                logger.warning("Failed to write %d log rows, retrying on next flush", len(rows), exc_info=True)
+                self._failed.extend(rows)
+            else:
+                logger.exception("Failed to write %d log rows, dropping them", len(rows))
+
+    async def flush(self) -> None:
+        """Write everything buffered, retry the last failed batch and wait
+        for in-flight batches. Never raises."""
+        failed, self._failed = self._failed, []
+        await self._write(failed, retry=False)
+        await self._write(self._take())
+        current = asyncio.current_task()
+        pending = [t for t in self._tasks if t is not current]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self.dropped:
+            logger.warning("Dropped %d log rows under backpressure", self.dropped)
+            self.dropped = 0
+
+
+buffer = LogBuffer(log_events)
+
+
+def enqueue(user_id: str | None, event_type: str, **kwargs) -> None:
+    """Buffer an api_logs entry (same arguments as log_row)."""
+    buffer.add(log_row(user_id, event_type, **kwargs))
+
+
+async def flush() -> None:
+    """Flush the process-wide buffer; call before the request returns."""
+    await buffer.flush()
@@ -0,0 +1,361 @@
+"""In-process metrics: counters and HDR-style histograms.
+
+Writers never take a lock: every thread increments its own shard (a plain
+dict only that thread writes) and readers sum the shards at scrape time.
+Histograms keep log-linear buckets — SUB_BUCKETS per power of two, so any
+recorded value is known to within about 6% — for quantiles and rollups,
+plus an exact count per fixed `le` bound for Prometheus.
+
+render() returns the Prometheus text format served at /api/metrics. Each
+serverless instance only sees its own traffic, so with METRICS_ROLLUP=1
+flush_rollup() also writes what changed since the last rollup as one
+metrics_rollups row at most every ROLLUP_INTERVAL seconds; summing those
+rows gives fleet-wide numbers.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable
+
+from . import config
+from .supabase_client import insert_metrics_rollup
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SUB_BUCKETS = 16
+ROLLUP_INTERVAL = 60.0  # seconds
+
+LATENCY_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60)
+TOKEN_BOUNDS = (250, 500, 1000, 2000, 4000, 8000, 16000)
+
+# Identifies this process in rollup rows
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+
+class _Shards:
+    """Per-thread dicts: writers don't contend, readers merge them all."""
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._all: list[dict] = []
+        self._lock = threading.Lock()  # taken once per thread, on first write
+
+    def mine(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard: dict = {}
+            with self._lock:
+                self._all.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def merged(self) -> dict:
+        total: dict = {}
+        with self._lock:
+            shards = list(self._all)
+        for shard in shards:
+            # dict.copy() is atomic under the GIL, unlike iterating a live dict
+            for key, value in shard.copy().items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def label_string(self, key: tuple[str, ...]) -> str:
+        """Compact `name=value,...` form used in rollup rows."""
+        return ",".join(f"{name}={value}" for name, value in zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        shard = self._shards.mine()
+        shard[key] = shard.get(key, 0) + amount
+
+    def values(self) -> dict[tuple[str, ...], float]:
+        return self._shards.merged()
+
+    def value(self, **labels: str) -> float:
+        return self.values().get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{self._labels(key)} {_number(value)}"
+            for key, value in sorted(self.values().items())
+        ]
+
+
+def bucket_index(value: float) -> int | None:
+    """Log-linear bucket of a value; None for zero and negative values."""
+    if value <= 0:
+        return None
+    mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent, 0.5 <= mantissa < 1
+    return exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+
+def bucket_upper(index: int | None) -> float:
+    """Upper bound of a bucket from bucket_index()."""
+    if index is None:
+        return 0.0
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), exponent)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        bounds: Iterable[float] = LATENCY_BOUNDS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(sorted(bounds))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        shard = self._shards.mine()
+        bucket = (key, bucket_index(value))
+        shard[bucket] = shard.get(bucket, 0) + 1
+        shard[(key, "sum")] = shard.get((key, "sum"), 0) + value
+        # Exact Prometheus bucket: the first bound >= value (none: +Inf only)
+        bound = bisect.bisect_left(self.bounds, value)
+        if bound < len(self.bounds):
+            slot = (key, ("le", bound))
+            shard[slot] = shard.get(slot, 0) + 1
+
+    def snapshot(self) -> dict[tuple[str, ...], dict]:
+        """Per label set: count, sum, {bucket index: count} and
+        {fixed bound index: count} (non-cumulative)."""
+        series: dict[tuple[str, ...], dict] = {}
+        for (key, slot), value in self._shards.merged().items():
+            entry = series.setdefault(key, {"count": 0, "sum": 0.0, "buckets": {}, "bounds": {}})
+            if slot == "sum":
+                entry["sum"] = value
+            elif isinstance(slot, tuple):
+                entry["bounds"][slot[1]] = value
+            else:
+                entry["buckets"][slot] = value
+                entry["count"] += value
+        return series
+
+    def quantile(self, q: float, **labels: str) -> float:
+        """Approximate q-quantile (the upper bound of its bucket)."""
+        entry = self.snapshot().get(self._key(labels))
+        if not entry or not entry["count"]:
+            return 0.0
+        rank = q * entry["count"]
+        seen = 0
+        for index in sorted(entry["buckets"], key=bucket_upper):
+            seen += entry["buckets"][index]
+            if seen >= rank:
+                return bucket_upper(index)
+        return bucket_upper(max(entry["buckets"], key=bucket_upper))
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, entry in sorted(self.snapshot().items()):
+            cumulative = 0
+            for index, bound in enumerate(self.bounds):
+                cumulative += entry["bounds"].get(index, 0)
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._labels(key, le)} {entry['count']}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_number(entry['sum'])}")
+            lines.append(f"{self.name}_count{self._labels(key)} {entry['count']}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# ── Registry ─────────────────────────────────────────────────────────
+
+_registry: dict[str, _Metric] = {}
+
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+    metric = _registry.setdefault(name, Counter(name, help, labelnames))
+    assert isinstance(metric, Counter)
+    return metric
+
+
+def histogram(
+    name: str,
+    help: str,
+    labelnames: Iterable[str] = (),
+    bounds: Iterable[float] = LATENCY_BOUNDS,
+) -> Histogram:
+    metric = _registry.setdefault(name, Histogram(name, help, labelnames, bounds))
+    assert isinstance(metric, Histogram)
+    return metric
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+gemini_latency = histogram(
+    "snappword_gemini_latency_seconds", "Gemini request latency.", ["model"],
+)
+gemini_tokens = histogram(
+    "snappword_gemini_tokens", "Total tokens per Gemini request.", ["model"], TOKEN_BOUNDS,
+)
+gemini_cached_tokens = counter(
+    "snappword_gemini_cached_tokens_total", "Prompt tokens served from Gemini's implicit cache.", ["model"],
+)
+parse_outcomes = counter(
+    "snappword_gemini_parse_total",
+    "Gemini responses by parse outcome (json, salvaged, truncated, failed).",
+    ["outcome"],
+)
+parse_dropped_words = counter(
+    "snappword_gemini_dropped_words_total", "Word entries dropped as invalid.",
+)
+line_push_latency = histogram(
+    "snappword_line_push_latency_seconds", "LINE push/multicast request latency.", ["endpoint"],
+)
+line_push_responses = counter(
+    "snappword_line_push_responses_total",
+    "LINE push/multicast responses by status code (error: no response).",
+    ["endpoint", "status"],
+)
+quota_rejections = counter(
+    "snappword_quota_rejections_total", "Screenshots refused by quota.", ["reason"],
+)
+dedup_hits = counter(
+    "snappword_dedup_hits_total", "Webhook redeliveries skipped as duplicates.",
+)
+
+
+# ── Supabase rollup ──────────────────────────────────────────────────
+
+
+def _flatten() -> dict[str, dict[str, float]]:
+    """Every series as {metric: {series: value}}; histogram buckets are
+    `le=<bucket upper bound>` series next to `count` and `sum`."""
+    flat: dict[str, dict[str, float]] = {}
+    for metric in _registry.values():
+        series: dict[str, float] = {}
+        if isinstance(metric, Counter):
+            for key, value in metric.values().items():
+                series[metric.label_string(key)] = value
+        elif isinstance(metric, Histogram):
+            for key, entry in metric.snapshot().items():
+                prefix = metric.label_string(key)
+                prefix = f"{prefix}," if prefix else ""
+                series[f"{prefix}count"] = entry["count"]
+                series[f"{prefix}sum"] = entry["sum"]
+                for index, n in entry["buckets"].items():
+                    series[f"{prefix}le={bucket_upper(index):.6g}"] = n
+        flat[metric.name] = series
+    return flat
+
+
+class Rollup:
+    """Tracks what was last written, so each row holds only the changes."""
+
+    def __init__(self, interval: float = ROLLUP_INTERVAL) -> None:
+        self.interval = interval
+        self._baseline: dict[str, dict[str, float]] = {}
+        self._window_start = datetime.now(timezone.utc)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, force: bool = False) -> tuple[dict, dict] | None:
+        """Return (row, new baseline) if a rollup is due and anything changed."""
+        with self._lock:
+            if not force and time.monotonic() - self._last < self.interval:
+                return None
+            self._last = time.monotonic()
+            current = _flatten()
+            delta: dict[str, dict[str, float]] = {}
+            for name, series in current.items():
+                previous = self._baseline.get(name, {})
+                changed = {
+                    label: round(value - previous.get(label, 0), 6)
+                    for label, value in series.items()
+                    if value != previous.get(label, 0)
+                }
+                if changed:
+                    delta[name] = changed
+            if not delta:
+                return None
+            now = datetime.now(timezone.utc)
+            row = {
+                "instance_id": INSTANCE_ID,
+                "window_start": self._window_start.isoformat(),
+                "window_end": now.isoformat(),
+                "metrics": delta,
+            }
+            return row, current
+
+    def commit(self, baseline: dict, window_end: str) -> None:
+        with self._lock:
+            self._baseline = baseline
+            self._window_start = datetime.fromisoformat(window_end)
+
+
+rollup = Rollup()
+
+
+async def flush_rollup(force: bool = False) -> None:
+    """Write a rollup row if METRICS_ROLLUP is on and one is due. Never raises.
+
+    On failure the baseline is kept, so the next row includes these changes.
+    """
+    if not config.METRICS_ROLLUP:
+        return
+    taken = rollup.take(force)
+    if taken is None:
+        return
+    row, baseline = taken
+    try:
+        await asyncio.to_thread(insert_metrics_rollup, row)
+    except Exception:
+        logger.exception("Failed to write metrics rollup")
+        return
+    rollup.commit(baseline, row["window_end"])
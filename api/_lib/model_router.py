@@ -0,0 +1,141 @@
+"""Route screenshot analysis between a fast model and the full model.
+
+Simple screenshots (small, low-detail images such as a single flashcard)
+go to FAST_MODEL first; anything the fast model returns empty, can't
+parse or fails on is escalated to GEMINI_MODEL. Each request is also
+hedged: if it is still running past the serving model's observed p95
+latency, a second request goes to GEMINI_MODEL and the first answer wins.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import threading
+from collections import deque
+
+from .gemini_client import GEMINI_MODEL, analyze_screenshot_async
+from .image_processing import PreparedImage
+from .models import GeminiParseResult
+
+logger = logging.getLogger(__name__)
+
+FAST_MODEL = "gemini-2.0-flash-lite"
+
+# Fast-path heuristics. Text-dense screenshots compress worse, so encoded
+# bits per pixel stands in for text density.
+SIMPLE_MAX_BYTES = 120_000
+SIMPLE_MAX_BITS_PER_PIXEL = 0.5
+
+# Hedging: fire the backup request once the first one has run longer than
+# the model's p95 latency (HEDGE_DEFAULT_S until enough samples exist).
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+HEDGE_DEFAULT_S = 12.0
+HEDGE_MIN_S = 2.0
+
+
+class LatencyTracker:
+    """Rolling window of successful request latencies for one model."""
+
+    def __init__(self, window: int = HEDGE_WINDOW) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+    def hedge_after(self) -> float:
+        p95 = self.percentile(0.95)
+        return HEDGE_DEFAULT_S if p95 is None else max(p95, HEDGE_MIN_S)
+
+
+_latency: dict[str, LatencyTracker] = {}
+
+
+def _tracker(model: str) -> LatencyTracker:
+    tracker = _latency.get(model)
+    if tracker is None:
+        tracker = _latency.setdefault(model, LatencyTracker())
+    return tracker
+
+
+def is_simple(image: PreparedImage) -> bool:
+    """Whether a screenshot looks cheap enough for the fast model."""
+    if not image.width or not image.height:
+        return False
+    if len(image.data) > SIMPLE_MAX_BYTES:
+        return False
+    bits_per_pixel = len(image.data) * 8 / (image.width * image.height)
+    return bits_per_pixel <= SIMPLE_MAX_BITS_PER_PIXEL
+
+
+async def analyze(image: PreparedImage) -> tuple[GeminiParseResult, dict]:
+    """Analyze a screenshot on the cheapest model that gives a usable result.
+
+    metadata["model"] is the model that served the result; "escalated" and
+    "hedged" record how it got there. token_count includes escalated calls.
+    """
+    if is_simple(image):
+        try:
+            result, metadata = await _hedged(image, FAST_MODEL)
+        except Exception:
+            logger.warning("Fast model failed, escalating to %s", GEMINI_MODEL, exc_info=True)
+            spent = 0
+        else:
+            if result.words:
+                return result, {**metadata, "escalated": False}
+            spent = metadata.get("token_count") or 0
+            logger.info("Fast model returned no words, escalating to %s", GEMINI_MODEL)
+
+        result, metadata = await _hedged(image, GEMINI_MODEL)
+        metadata["token_count"] = (metadata.get("token_count") or 0) + spent
+        return result, {**metadata, "escalated": True}
+
+    result, metadata = await _hedged(image, GEMINI_MODEL)
+    return result, {**metadata, "escalated": False}
+
+
+async def _timed(image: PreparedImage, model: str) -> tuple[GeminiParseResult, dict]:
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    result, metadata = await analyze_screenshot_async(image.data, image.mime_type, model=model)
+    _tracker(model).record(loop.time() - start)
+    return result, metadata
+
+
+async def _hedged(image: PreparedImage, model: str) -> tuple[GeminiParseResult, dict]:
+    """Run one request, adding a GEMINI_MODEL backup if it passes its p95.
+
+    The first successful answer wins and the other request is cancelled.
+    """
+    pending = {asyncio.ensure_future(_timed(image, model))}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=_tracker(model).hedge_after())
+        if done:
+            result, metadata = done.pop().result()
+            return result, {**metadata, "hedged": False}
+
+        logger.info("Gemini %s past its p95 budget, hedging with %s", model, GEMINI_MODEL)
+        pending.add(asyncio.ensure_future(_timed(image, GEMINI_MODEL)))
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    result, metadata = task.result()
+                    return result, {**metadata, "hedged": True}
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
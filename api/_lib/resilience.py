@@ -0,0 +1,269 @@
+"""Circuit breakers and adaptive concurrency limits for external APIs.
+
+Each dependency (gemini, line, supabase) gets one Dependency guard that
+every client call goes through:
+
+- a circuit breaker: after FAILURE_THRESHOLD consecutive failures calls
+  fail fast with DependencyUnavailable for `reset_after` seconds, then a
+  single probe call decides whether to close it again;
+- an AIMD limit on in-flight calls: each success raises the limit by
+  about one per `limit` calls, each failure halves it. Calls over the
+  limit wait up to `max_wait` seconds, then fail fast too.
+
+Calls that take longer than `slow_after` count as failures even when they
+succeed, so a dependency that degrades into timeouts trips the breaker.
+Guards are thread-safe: Supabase calls run in worker threads.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = 5
+WAIT_POLL_S = 0.05
+
+
+class DependencyUnavailable(Exception):
+    """Raised instead of calling a dependency that is tripped or saturated."""
+
+    def __init__(self, dependency: str, reason: str) -> None:
+        super().__init__(f"{dependency} unavailable: {reason}")
+        self.dependency = dependency
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Closed → open after consecutive failures → half-open probe → closed."""
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_after: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+        self.on_open: Callable[[], None] | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may proceed; in half-open only one probe at a time."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot without a verdict."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        was_open = self.opened_at is not None
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._probing = False
+            if not was_open and self.on_open is not None:
+                self.on_open()
+
+
+class AIMDLimiter:
+    """Additive-increase / multiplicative-decrease limit on in-flight calls."""
+
+    def __init__(
+        self,
+        initial: int,
+        max_limit: int,
+        min_limit: int = 1,
+        backoff: float = 0.5,
+    ) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, success: bool | None) -> None:
+        """success=None releases without adjusting (e.g. a cancelled call)."""
+        self.in_flight -= 1
+        if success:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif success is False:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+
+
+def _default_is_failure(exc: BaseException) -> bool:
+    return True
+
+
+class Dependency:
+    """Breaker + limiter for one external API."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        initial_limit: int,
+        max_limit: int,
+        slow_after: float,
+        reset_after: float = 30.0,
+        max_wait: float = 5.0,
+        is_failure: Callable[[BaseException], bool] = _default_is_failure,
+    ) -> None:
+        self.name = name
+        self.slow_after = slow_after
+        self.max_wait = max_wait
+        self.is_failure = is_failure
+        self.breaker = CircuitBreaker(reset_after=reset_after)
+        self.breaker.on_open = self._on_open
+        self.limiter = AIMDLimiter(initial_limit, max_limit)
+        self.on_open: Callable[[str], None] | None = None
+        self._lock = threading.Lock()
+
+    def _on_open(self) -> None:
+        logger.error("Circuit for %s opened after repeated failures", self.name)
+        if self.on_open is not None:
+            self.on_open(self.name)
+
+    def _try_enter(self) -> bool:
+        """Admit one call, or raise if the breaker is open."""
+        with self._lock:
+            if not self.breaker.allow():
+                raise DependencyUnavailable(self.name, "circuit open")
+            if self.limiter.try_acquire():
+                return True
+            # Hand back a half-open probe slot we can't use yet
+            self.breaker.release_probe()
+            return False
+
+    def _exit(self, start: float, error: BaseException | None, call: _Call) -> None:
+        slow = time.monotonic() - start > self.slow_after
+        failed = call.failed
+        if failed is None:
+            # Cancelled, or a guarded async generator closed early by its consumer
+            if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+                failed = True if slow else None
+            elif error is not None:
+                failed = self.is_failure(error)
+            else:
+                failed = slow
+        if failed and call.retried:
+            failed = None  # the caller's final attempt gives the verdict
+        with self._lock:
+            self.limiter.release(None if failed is None else not failed)
+            if failed:
+                self.breaker.record_failure()
+            elif failed is False:
+                self.breaker.record_success()
+            else:
+                self.breaker.release_probe()
+
+    @asynccontextmanager
+    async def aguard(self) -> AsyncIterator[_Call]:
+        """Guard one async call; raises DependencyUnavailable to fail fast."""
+        deadline = time.monotonic() + self.max_wait
+        while not self._try_enter():
+            if time.monotonic() >= deadline:
+                raise DependencyUnavailable(self.name, "too many calls in flight")
+            await asyncio.sleep(WAIT_POLL_S)
+        call = _Call()
+        start = time.monotonic()
+        try:
+            yield call
+        except BaseException as e:
+            self._exit(start, e, call)
+            raise
+        self._exit(start, None, call)
+
+    @contextmanager
+    def guard(self) -> Iterator[_Call]:
+        """Sync variant of aguard() for calls made from worker threads."""
+        deadline = time.monotonic() + self.max_wait
+        while not self._try_enter():
+            if time.monotonic() >= deadline:
+                raise DependencyUnavailable(self.name, "too many calls in flight")
+            time.sleep(WAIT_POLL_S)
+        call = _Call()
+        start = time.monotonic()
+        try:
+            yield call
+        except BaseException as e:
+            self._exit(start, e, call)
+            raise
+        self._exit(start, None, call)
+
+
+class _Call:
+    """Lets a guarded call report a failure that didn't raise (e.g. HTTP 503),
+    or mark itself as an attempt the caller will retry."""
+
+    def __init__(self) -> None:
+        self.failed: bool | None = None
+        self.retried = False
+
+    def fail(self) -> None:
+        self.failed = True
+
+    def will_retry(self) -> None:
+        """A failure of this attempt doesn't count against the breaker; the
+        caller's last attempt records the outcome of the logical call."""
+        self.retried = True
+
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def _is_http_failure(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return is_retryable_status(exc.response.status_code)
+    return isinstance(exc, (httpx.TransportError, TimeoutError))
+
+
+def _is_gemini_failure(exc: BaseException) -> bool:
+    from google.genai import errors
+
+    if isinstance(exc, errors.APIError):
+        return exc.code is not None and is_retryable_status(exc.code)
+    return _is_http_failure(exc)
+
+
+gemini = Dependency(
+    "gemini", initial_limit=8, max_limit=32, slow_after=30.0, is_failure=_is_gemini_failure,
+)
+line = Dependency(
+    "line", initial_limit=20, max_limit=50, slow_after=10.0, is_failure=_is_http_failure,
+)
+supabase = Dependency(
+    "supabase", initial_limit=10, max_limit=20, slow_after=10.0, is_failure=_is_http_failure,
+)
+
+DEPENDENCIES = (gemini, line, supabase)
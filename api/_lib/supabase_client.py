@@ -2,14 +2,22 @@
 
 from __future__ import annotations
 
+import functools
 import logging
+import threading
 import uuid
 from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Callable, Iterable, TypeVar
 
-from supabase import create_client, Client
+import httpx
 
-from . import config
+from . import config, resilience, tracing
+from .image_processing import EXTENSIONS
 from .models import GeminiParseResult, ReviewStatus
+from .ttl_cache import TTLCache
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 logger = logging.getLogger(__name__)
 
@@ -28,12 +36,123 @@ DAILY_LIMITS: dict[str, float] = {
 }
 
 
+# Keep-alive pool shared by PostgREST and Storage calls. Warm serverless
+# invocations reuse these connections instead of re-doing TCP+TLS each call.
+_POOL_LIMITS = httpx.Limits(
+    max_connections=20,
+    max_keepalive_connections=10,
+    keepalive_expiry=60.0,
+)
+_POOL_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+_client: Client | None = None
+_http_client: httpx.Client | None = None
+_client_lock = threading.Lock()
+
+_T = TypeVar("_T")
+
+# line_user_id → user row. Tier changes made elsewhere (admin, Stripe, the web
+# app) can't reach other instances' caches: check_quotas() re-reads the row
+# before turning a user away, so upgrades apply at once, and downgrades are
+# picked up within the TTL. Local tier-affecting flows call invalidate_user().
+USER_CACHE_TTL = 60
+_user_cache: TTLCache[str, dict] = TTLCache(ttl=USER_CACHE_TTL, maxsize=2048)
+
+# user_id → {word_key(): card id} of saved words seen recently. Best effort:
+# lookups query only the keys it lacks, and the unique key on vocab_cards
+# (migration 013) rejects anything it misses. Cards deleted in the web app
+# can't be evicted from here, so they may still show for up to the TTL.
+KNOWN_WORDS_TTL = 60
+_known_cards: TTLCache[str, dict[tuple[str, str], str]] = TTLCache(ttl=KNOWN_WORDS_TTL, maxsize=1024)
+
+
+def create_client(url: str, key: str, http_client: httpx.Client) -> Client:
+    """Build a Supabase client on `http_client`.
+
+    The SDK (postgrest, storage, realtime, auth) is imported here rather than
+    at module load, so cold starts that never touch the database skip it.
+    """
+    from supabase import create_client as create_supabase_client
+    from supabase.lib.client_options import SyncClientOptions
+
+    return create_supabase_client(url, key, options=SyncClientOptions(httpx_client=http_client))
+
+
 def _get_client() -> Client:
-    return create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY)
+    """Return the process-wide Supabase client, creating it on first use."""
+    global _client, _http_client
+    client = _client
+    if client is not None:
+        return client
+    with _client_lock:
+        if _client is None:
+            _http_client = httpx.Client(
+                limits=_POOL_LIMITS,
+                timeout=_POOL_TIMEOUT,
+                follow_redirects=True,
+            )
+            _client = create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY, _http_client)
+        return _client
+
+
+def reset_client() -> None:
+    """Drop the pooled client so the next call builds a fresh one."""
+    global _client, _http_client
+    with _client_lock:
+        http_client = _http_client
+        _client = None
+        _http_client = None
+    if http_client is not None:
+        try:
+            http_client.close()
+        except Exception:
+            logger.debug("Error closing Supabase HTTP pool", exc_info=True)
+
+
+def _with_pool_reset(func: Callable[..., _T]) -> Callable[..., _T]:
+    """Guard a call with the Supabase circuit breaker, and rebuild the pool
+    when it fails at the transport level. Each call is a tracing span
+    named supabase.<function>.
+
+    A connection broken mid-flight (e.g. after the instance was frozen)
+    would otherwise keep being handed out to later calls.
+    """
+    span_name = f"supabase.{func.__name__.lstrip('_')}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            with tracing.span(span_name), resilience.supabase.guard():
+                return func(*args, **kwargs)
+        except httpx.TransportError:
+            logger.warning("Supabase transport error in %s, resetting pool", func.__name__)
+            reset_client()
+            raise
+
+    return wrapper
 
 
 def get_or_create_user(line_user_id: str, display_name: str | None = None) -> dict:
-    """Find existing user or create a new one. Returns user dict."""
+    """Find existing user or create a new one. Returns user dict.
+
+    Served from an in-process TTL cache when possible.
+    """
+    cached = _user_cache.get(line_user_id)
+    if cached and (not display_name or cached.get("display_name")):
+        return dict(cached)
+
+    user = _fetch_or_create_user(line_user_id, display_name)
+    _user_cache.set(line_user_id, dict(user))
+    return user
+
+
+def invalidate_user(line_user_id: str) -> None:
+    """Drop a cached user row (call when its tier or quota state changes)."""
+    _user_cache.pop(line_user_id)
+
+
+@_with_pool_reset
+def _fetch_or_create_user(line_user_id: str, display_name: str | None) -> dict:
     sb = _get_client()
     result = sb.table("users").select("*").eq("line_user_id", line_user_id).execute()
 
@@ -55,94 +174,145 @@ def get_or_create_user(line_user_id: str, display_name: str | None = None) -> di
     return result.data[0]
 
 
+@_with_pool_reset
+def get_usage(user_id: str) -> dict:
+    """Return today's and this month's parse_success counts (UTC).
+
+    Reads the trigger-maintained usage_counters table via the get_usage RPC
+    in a single round trip.
+    """
+    sb = _get_client()
+    result = sb.rpc("get_usage", {"p_user_id": user_id}).execute()
+    row = result.data[0] if result.data else {}
+    return {
+        "daily_used": row.get("daily_used") or 0,
+        "monthly_used": row.get("monthly_used") or 0,
+    }
+
+
 def check_quota(user: dict) -> dict:
     """Check if user can send another screenshot (daily + monthly quota).
 
     Returns dict with keys: allowed, reason, tier, monthly_used, monthly_limit.
     """
-    sb = _get_client()
+    return check_quotas(user, 1)[0]
+
+
+def check_quotas(user: dict, count: int) -> list[dict]:
+    """check_quota() for `count` screenshots sent together, with one usage lookup.
+
+    The i-th decision counts the i screenshots before it as already used,
+    so a set can't pass on quota that only covers its first image. Before a
+    screenshot is refused, a possibly cached user row is read again, in case
+    it was upgraded elsewhere.
+    """
+    decisions = _quota_decisions(user, count)
+    line_user_id = user.get("line_user_id")
+    if line_user_id and not all(d["allowed"] for d in decisions):
+        invalidate_user(line_user_id)
+        fresh = get_or_create_user(line_user_id)
+        if _tier(fresh) != _tier(user):
+            decisions = _quota_decisions(fresh, count)
+    return decisions
+
+
+def _tier(user: dict) -> str:
     tier = user.get("subscription_tier") or "free"
     if tier == "free" and user.get("is_premium"):
         tier = "sprout"
+    return tier
+
+
+def _quota_decisions(user: dict, count: int) -> list[dict]:
+    tier = _tier(user)
 
     monthly_limit = MONTHLY_LIMITS.get(tier, MONTHLY_LIMITS["free"])
     daily_limit = DAILY_LIMITS.get(tier, float("inf"))
-    user_id = user["id"]
 
-    # Daily quota check
-    if daily_limit != float("inf"):
-        day_start = datetime.now(timezone.utc).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        )
-        result = (
-            sb.table("api_logs")
-            .select("*", count="exact", head=True)
-            .eq("user_id", user_id)
-            .eq("event_type", "parse_success")
-            .gte("created_at", day_start.isoformat())
-            .execute()
-        )
-        daily_count = result.count or 0
-        if daily_count >= daily_limit:
-            return {
+    if daily_limit == float("inf") and monthly_limit == float("inf"):
+        return [
+            {"allowed": True, "tier": tier, "monthly_used": 0, "monthly_limit": monthly_limit}
+        ] * count
+
+    usage = get_usage(user["id"])
+    decisions = []
+    for pending in range(count):
+        # Daily quota check
+        if usage["daily_used"] + pending >= daily_limit:
+            decisions.append({
                 "allowed": False,
                 "reason": "daily_quota",
                 "tier": tier,
                 "monthly_used": 0,
                 "monthly_limit": monthly_limit,
-            }
-
-    # Monthly quota check
-    if monthly_limit != float("inf"):
-        now = datetime.now(timezone.utc)
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        result = (
-            sb.table("api_logs")
-            .select("*", count="exact", head=True)
-            .eq("user_id", user_id)
-            .eq("event_type", "parse_success")
-            .gte("created_at", month_start.isoformat())
-            .execute()
-        )
-        used = result.count or 0
+            })
+            continue
+
+        # Monthly quota check
+        used = usage["monthly_used"] + pending
         if used >= monthly_limit:
-            return {
+            decisions.append({
                 "allowed": False,
                 "reason": "monthly_quota",
                 "tier": tier,
                 "monthly_used": used,
                 "monthly_limit": monthly_limit,
-            }
-        return {"allowed": True, "tier": tier, "monthly_used": used, "monthly_limit": monthly_limit}
-
-    return {"allowed": True, "tier": tier, "monthly_used": 0, "monthly_limit": monthly_limit}
+            })
+            continue
+        decisions.append({"allowed": True, "tier": tier, "monthly_used": used, "monthly_limit": monthly_limit})
+    return decisions
 
 
-def upload_image(image_bytes: bytes, user_id: str) -> str:
+@_with_pool_reset
+def upload_image(image_bytes: bytes, user_id: str, mime_type: str = "image/jpeg") -> str:
     """Upload screenshot to Supabase Storage. Returns public URL."""
     if len(image_bytes) > 5_242_880:  # 5 MB
         raise ValueError("Image too large (max 5 MB)")
 
     sb = _get_client()
-    filename = f"{user_id}/{uuid.uuid4().hex}.jpg"
+    ext = EXTENSIONS.get(mime_type, "jpg")
+    filename = f"{user_id}/{uuid.uuid4().hex}.{ext}"
     sb.storage.from_(config.STORAGE_BUCKET).upload(
-        filename, image_bytes, {"content-type": "image/jpeg"}
+        filename, image_bytes, {"content-type": mime_type}
     )
     return sb.storage.from_(config.STORAGE_BUCKET).get_public_url(filename)
 
 
+def word_key(word: str, target_lang: str | None) -> tuple[str, str]:
+    """Normalized (word, target_lang) — the unique key of vocab_cards per user.
+
+    The app writes word_key itself (migration 014), so this is the only
+    definition: whitespace collapsed, lower-cased. Keep normalizeWord() in
+    web/lib/server/supabase-server.ts in step.
+    """
+    return " ".join(word.split()).lower(), normalize_lang(target_lang)
+
+
+def normalize_lang(target_lang: str | None) -> str:
+    return (target_lang or "").strip().lower() or "en"
+
+
+@_with_pool_reset
 def save_vocab_cards(
     user_id: str,
-    image_url: str,
+    image_url: str | None,
     parse_result: GeminiParseResult,
+    source_message_id: str | None = None,
 ) -> list[dict]:
-    """Save parsed words as vocab_cards. Returns list of inserted records."""
+    """Save parsed words as vocab_cards. Returns the newly created records.
+
+    Words the user already has a card for are skipped (upsert on the
+    normalized word key), keeping that card and its review progress.
+    source_message_id is the LINE message the words were read from.
+    """
     sb = _get_client()
+    target_lang = normalize_lang(parse_result.target_lang)
     rows = []
     for w in parse_result.words:
         rows.append({
             "user_id": user_id,
             "word": w.word,
+            "word_key": word_key(w.word, target_lang)[0],
             "translation": w.translation,
             "pronunciation": w.pronunciation,
             "original_sentence": w.context_sentence,
@@ -150,20 +320,83 @@ def save_vocab_cards(
             "ai_example": w.ai_example,
             "image_url": image_url,
             "source_app": parse_result.source_app,
-            "target_lang": parse_result.target_lang,
+            "target_lang": target_lang,
             "tags": w.tags,
             "review_status": ReviewStatus.NEW,
+            "source_message_id": source_message_id,
         })
 
     if not rows:
         return []
 
-    result = sb.table("vocab_cards").insert(rows).execute()
-    if not result.data:
-        raise RuntimeError("Failed to save vocab cards")
-    return result.data
+    result = (
+        sb.table("vocab_cards")
+        .upsert(rows, on_conflict="user_id,word_key,target_lang", ignore_duplicates=True)
+        .execute()
+    )
+    saved = result.data or []
+    _remember_cards(user_id, saved)
+    return saved
+
+
+def get_known_cards(user_id: str, keys: Iterable[tuple[str, str]]) -> dict[tuple[str, str], str]:
+    """Card ids of the given word_key()s that the user already has.
+
+    Keys missing from the in-process cache are looked up in one query.
+    """
+    keys = set(keys)
+    cached = _known_cards.get(user_id) or {}
+    known = {key: cached[key] for key in keys if key in cached}
+    missing = keys - known.keys()
+    if missing:
+        found = _fetch_known_cards(user_id, missing)
+        if found:
+            _remember(user_id, found)
+        known.update(found)
+    return known
+
+
+@_with_pool_reset
+def get_message_card_ids(user_id: str, source_message_id: str) -> set[str]:
+    """Ids of the user's cards created from the given LINE message."""
+    sb = _get_client()
+    result = (
+        sb.table("vocab_cards")
+        .select("id")
+        .eq("user_id", user_id)
+        .eq("source_message_id", source_message_id)
+        .execute()
+    )
+    return {r["id"] for r in result.data or []}
+
+
+def _remember_cards(user_id: str, cards: list[dict]) -> None:
+    _remember(user_id, {(c["word_key"], c["target_lang"]): c["id"] for c in cards})
+
+
+def _remember(user_id: str, found: dict[tuple[str, str], str]) -> None:
+    if not found:
+        return
+    # Replace rather than mutate: other threads may be reading the old dict
+    _known_cards.set(user_id, {**(_known_cards.get(user_id) or {}), **found})
+
+
+@_with_pool_reset
+def _fetch_known_cards(user_id: str, keys: set[tuple[str, str]]) -> dict[tuple[str, str], str]:
+    sb = _get_client()
+    result = (
+        sb.table("vocab_cards")
+        .select("id, word_key, target_lang")
+        .eq("user_id", user_id)
+        .in_("word_key", sorted({word for word, _ in keys}))
+        .in_("target_lang", sorted({lang for _, lang in keys}))
+        .execute()
+    )
+    rows = {(r["word_key"], r["target_lang"]): r["id"] for r in result.data or []}
+    return {key: card_id for key, card_id in rows.items() if key in keys}
 
 
+@_with_pool_reset
 def update_card_status(card_id: str, user_id: str, status: int) -> bool:
     """Update review_status of a vocab card. Verifies ownership.
 
@@ -183,6 +416,7 @@ def update_card_status(card_id: str, user_id: str, status: int) -> bool:
     return bool(result.data)
 
 
+@_with_pool_reset
 def get_recent_cards(user_id: str, limit: int = 10) -> list[dict]:
     """Get user's most recent vocab cards."""
     sb = _get_client()
@@ -200,6 +434,7 @@ def get_recent_cards(user_id: str, limit: int = 10) -> list[dict]:
 # ── Upgrade Requests ──
 
 
+@_with_pool_reset
 def create_upgrade_request(user_id: str) -> dict:
     """Create a new upgrade request in waiting_image state."""
     sb = _get_client()
@@ -213,6 +448,7 @@ def create_upgrade_request(user_id: str) -> dict:
     return result.data[0]
 
 
+@_with_pool_reset
 def get_pending_upgrade_request(user_id: str) -> dict | None:
     """Get a recent waiting_image upgrade request (within 10 minutes)."""
     sb = _get_client()
@@ -233,6 +469,7 @@ def get_pending_upgrade_request(user_id: str) -> dict | None:
     return result.data[0] if result.data else None
 
 
+@_with_pool_reset
 def complete_upgrade_request(request_id: str, image_url: str) -> None:
     """Complete an upgrade request: set image URL and status to pending."""
     sb = _get_client()
@@ -241,26 +478,160 @@ def complete_upgrade_request(request_id: str, image_url: str) -> None:
     ).eq("id", request_id).execute()
 
 
-def upload_upgrade_proof(image_bytes: bytes, user_id: str) -> str:
+@_with_pool_reset
+def upload_upgrade_proof(image_bytes: bytes, user_id: str, mime_type: str = "image/jpeg") -> str:
     """Upload payment proof to Supabase Storage. Returns public URL."""
     sb = _get_client()
-    filename = f"upgrade_proofs/{user_id}/{uuid.uuid4().hex}.jpg"
+    ext = EXTENSIONS.get(mime_type, "jpg")
+    filename = f"upgrade_proofs/{user_id}/{uuid.uuid4().hex}.{ext}"
     sb.storage.from_(config.STORAGE_BUCKET).upload(
-        filename, image_bytes, {"content-type": "image/jpeg"}
+        filename, image_bytes, {"content-type": mime_type}
     )
     return sb.storage.from_(config.STORAGE_BUCKET).get_public_url(filename)
 
 
-def log_event(user_id: str | None, event_type: str, **kwargs) -> None:
-    """Write an operational log entry."""
-    try:
-        sb = _get_client()
-        sb.table("api_logs").insert({
+# ── Analysis Cache ──
+
+
+@_with_pool_reset
+def get_cached_analysis(
+    image_hash: str, phash: str | None = None, user_id: str | None = None
+) -> dict | None:
+    """Look up a cached Gemini result by exact image hash, or by perceptual
+    hash among user_id's own screenshots. The row's image_hash tells which
+    of the two matched."""
+    sb = _get_client()
+    query = sb.table("analysis_cache").select("image_hash, result, token_count")
+    if phash and user_id:
+        query = query.or_(
+            f"image_hash.eq.{image_hash},and(phash.eq.{phash},user_id.eq.{user_id})"
+        )
+    else:
+        query = query.eq("image_hash", image_hash)
+    result = query.limit(1).execute()
+    return result.data[0] if result.data else None
+
+
+@_with_pool_reset
+def save_cached_analysis(
+    image_hash: str,
+    phash: str | None,
+    user_id: str | None,
+    parse_result: GeminiParseResult,
+    token_count: int,
+) -> None:
+    """Store a Gemini result keyed by image hash (idempotent)."""
+    sb = _get_client()
+    sb.table("analysis_cache").upsert(
+        {
+            "image_hash": image_hash,
+            "phash": phash,
             "user_id": user_id,
-            "event_type": event_type,
-            "latency_ms": kwargs.get("latency_ms"),
-            "token_count": kwargs.get("token_count"),
-            "payload": kwargs.get("payload"),
-        }).execute()
-    except Exception:
-        logger.exception("Failed to write log event: %s", event_type)
+            "result": parse_result.model_dump(),
+            "token_count": token_count,
+        },
+        on_conflict="image_hash",
+    ).execute()
+
+
+# ── Webhook Job Queue ──
+
+
+@_with_pool_reset
+def enqueue_webhook_jobs(events: list[dict]) -> int:
+    """Persist webhook events as queued jobs. Redelivered events are ignored.
+
+    Returns the number of newly queued jobs.
+    """
+    rows = [
+        {
+            "webhook_event_id": e.get("webhookEventId") or uuid.uuid4().hex,
+            "line_user_id": e.get("source", {}).get("userId"),
+            "event": e,
+        }
+        for e in events
+    ]
+    if not rows:
+        return 0
+    sb = _get_client()
+    result = (
+        sb.table("webhook_jobs")
+        .upsert(rows, on_conflict="webhook_event_id", ignore_duplicates=True)
+        .execute()
+    )
+    return len(result.data or [])
+
+
+@_with_pool_reset
+def claim_webhook_jobs(limit: int, lock_timeout_s: int = 120) -> list[dict]:
+    """Claim runnable jobs (FOR UPDATE SKIP LOCKED) and mark them running."""
+    sb = _get_client()
+    result = sb.rpc(
+        "claim_webhook_jobs",
+        {"p_limit": limit, "p_lock_timeout_s": lock_timeout_s},
+    ).execute()
+    return result.data or []
+
+
+@_with_pool_reset
+def update_webhook_job(job_id: int, fields: dict) -> None:
+    """Update a job's status/bookkeeping columns."""
+    sb = _get_client()
+    sb.table("webhook_jobs").update({
+        **fields,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }).eq("id", job_id).execute()
+
+
+# ── Webhook Event Dedup ──
+
+
+@_with_pool_reset
+def record_webhook_events(event_ids: list[str]) -> set[str]:
+    """Record webhook event ids in one insert. Returns the ids that were new
+    (ids already recorded are skipped by the upsert)."""
+    sb = _get_client()
+    result = (
+        sb.table("webhook_events")
+        .upsert(
+            [{"webhook_event_id": event_id} for event_id in event_ids],
+            on_conflict="webhook_event_id",
+            ignore_duplicates=True,
+        )
+        .execute()
+    )
+    return {row["webhook_event_id"] for row in result.data or []}
+
+
+@_with_pool_reset
+def delete_webhook_events_before(cutoff_iso: str) -> None:
+    """Delete dedup records older than the cutoff timestamp."""
+    sb = _get_client()
+    sb.table("webhook_events").delete().lt("created_at", cutoff_iso).execute()
+
+
+def log_row(user_id: str | None, event_type: str, **kwargs) -> dict:
+    """Build an api_logs row."""
+    return {
+        "user_id": user_id,
+        "event_type": event_type,
+        "latency_ms": kwargs.get("latency_ms"),
+        "token_count": kwargs.get("token_count"),
+        "payload": kwargs.get("payload"),
+    }
+
+
+@_with_pool_reset
+def log_events(rows: list[dict]) -> None:
+    """Bulk-insert api_logs rows in one request."""
+    if not rows:
+        return
+    sb = _get_client()
+    sb.table("api_logs").insert(rows).execute()
+
+
+@_with_pool_reset
+def insert_metrics_rollup(row: dict) -> None:
+    """Write one metrics_rollups row (see metrics.flush_rollup)."""
+    sb = _get_client()
+    sb.table("metrics_rollups").insert(row).execute()
@@ -0,0 +1,254 @@
+"""Lightweight tracing spans for the screenshot pipeline.
+
+A trace is started per screenshot (start_trace) and every client call
+inside it — LINE, Supabase, Gemini — records a span. Spans are plain
+context managers; the current trace and parent span live in context
+variables, so they follow the pipeline into tasks and into the worker
+threads started with asyncio.to_thread. Outside a trace, span() costs one
+context variable lookup.
+
+breakdown() summarises the current trace as milliseconds per top-level
+span name (calls with the same name are summed; nested spans are already
+inside their parent's time and only appear in the exported trace); the
+webhook adds it to the api_logs payload of each screenshot's outcome.
+
+With OTEL_EXPORTER_OTLP_ENDPOINT set (e.g. http://localhost:4318 for a
+local OpenTelemetry collector), finished traces are also sent as OTLP/HTTP
+JSON when the request handler calls flush().
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import logging
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, TypeVar
+
+import httpx
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "snappword"
+# Spans kept per trace; a runaway loop must not grow a trace without bound
+MAX_SPANS = 500
+# Finished traces kept for export; older ones are dropped first
+MAX_PENDING_TRACES = 200
+EXPORT_TIMEOUT = httpx.Timeout(5.0, connect=1.0)
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: str
+    start_ns: int
+    attributes: dict[str, Any]
+    duration_ns: int = 0
+    error: str | None = None
+
+
+@dataclass
+class Trace:
+    name: str
+    attributes: dict[str, Any]
+    trace_id: str = field(default_factory=lambda: secrets.token_hex(16))
+    root_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    start_ns: int = field(default_factory=time.time_ns)
+    duration_ns: int = 0
+    spans: list[Span] = field(default_factory=list)
+
+    def add(self, span: Span) -> None:
+        # list.append is atomic; spans may finish in worker threads
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(span)
+
+    def breakdown(self) -> dict[str, float]:
+        """Milliseconds per top-level span name (direct children of the
+        root), plus the trace's elapsed total_ms."""
+        totals: dict[str, float] = {}
+        for span in list(self.spans):
+            if span.parent_id != self.root_id:
+                continue
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration_ns / 1e6
+        stages = {name: round(ms, 1) for name, ms in totals.items()}
+        stages["total_ms"] = round((time.time_ns() - self.start_ns) / 1e6, 1)
+        return stages
+
+
+_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_parent: ContextVar[str | None] = ContextVar("span_parent", default=None)
+
+_pending: list[Trace] = []
+_pending_lock = threading.Lock()
+
+
+def current() -> Trace | None:
+    return _trace.get()
+
+
+def breakdown() -> dict[str, float] | None:
+    """Stage timings of the current trace so far, or None outside a trace."""
+    trace = _trace.get()
+    return trace.breakdown() if trace is not None else None
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Trace]:
+    """Make a new trace current for the enclosed code (and tasks it starts)."""
+    trace = Trace(name, attributes)
+    trace_token = _trace.set(trace)
+    parent_token = _parent.set(trace.root_id)
+    start = time.perf_counter_ns()
+    try:
+        yield trace
+    finally:
+        trace.duration_ns = time.perf_counter_ns() - start
+        _parent.reset(parent_token)
+        _trace.reset(trace_token)
+        if config.OTEL_EXPORTER_OTLP_ENDPOINT:
+            with _pending_lock:
+                _pending.append(trace)
+                del _pending[:-MAX_PENDING_TRACES]
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """Time the enclosed block as a span of the current trace, if any."""
+    with _span(name, attributes, nest=True):
+        yield
+
+
+@contextmanager
+def leaf_span(name: str, **attributes: Any) -> Iterator[None]:
+    """Like span(), but spans opened inside the block aren't nested under it.
+
+    For blocks that hand control back to their caller while open, such as an
+    async generator between its yields: the caller's own spans must not end
+    up as children of this one.
+    """
+    with _span(name, attributes, nest=False):
+        yield
+
+
+@contextmanager
+def _span(name: str, attributes: dict[str, Any], nest: bool) -> Iterator[None]:
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    record = Span(name, secrets.token_hex(8), _parent.get() or trace.root_id, time.time_ns(), attributes)
+    token = _parent.set(record.span_id) if nest else None
+    start = time.perf_counter_ns()
+    try:
+        yield
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        record.duration_ns = time.perf_counter_ns() - start
+        if token is not None:
+            _parent.reset(token)
+        trace.add(record)
+
+
+def traced(name: str) -> Callable[[_F], _F]:
+    """Decorator: run each call of a sync or async function in a span."""
+    def decorate(func: _F) -> _F:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+# ── OTLP export ──────────────────────────────────────────────────────
+
+
+def _attributes(values: dict[str, Any]) -> list[dict]:
+    result = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            encoded = {"boolValue": value}
+        elif isinstance(value, int):
+            encoded = {"intValue": str(value)}
+        elif isinstance(value, float):
+            encoded = {"doubleValue": value}
+        else:
+            encoded = {"stringValue": str(value)}
+        result.append({"key": key, "value": encoded})
+    return result
+
+
+def _otlp_span(trace: Trace, span_id: str, parent_id: str | None, name: str,
+               start_ns: int, duration_ns: int, attributes: dict, error: str | None) -> dict:
+    encoded = {
+        "traceId": trace.trace_id,
+        "spanId": span_id,
+        "name": name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(start_ns + duration_ns),
+        "attributes": _attributes(attributes),
+        "status": {"code": 2, "message": error} if error else {"code": 1},
+    }
+    if parent_id:
+        encoded["parentSpanId"] = parent_id
+    return encoded
+
+
+def otlp_payload(traces: list[Trace]) -> dict:
+    """Encode traces as an OTLP/HTTP JSON ExportTraceServiceRequest."""
+    spans = []
+    for trace in traces:
+        spans.append(_otlp_span(
+            trace, trace.root_id, None, trace.name,
+            trace.start_ns, trace.duration_ns, trace.attributes, None,
+        ))
+        spans.extend(
+            _otlp_span(trace, s.span_id, s.parent_id, s.name, s.start_ns, s.duration_ns, s.attributes, s.error)
+            for s in trace.spans
+        )
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }],
+    }
+
+
+async def flush() -> None:
+    """Send finished traces to the OTLP endpoint, if configured. Never raises."""
+    if not config.OTEL_EXPORTER_OTLP_ENDPOINT:
+        return
+    with _pending_lock:
+        traces = _pending[:]
+        _pending.clear()
+    if not traces:
+        return
+    url = config.OTEL_EXPORTER_OTLP_ENDPOINT.rstrip("/") + "/v1/traces"
+    try:
+        async with httpx.AsyncClient(timeout=EXPORT_TIMEOUT) as client:
+            resp = await client.post(url, json=otlp_payload(traces))
+        if not resp.is_success:
+            logger.warning("OTLP export failed: %d %s", resp.status_code, resp.text[:200])
+    except Exception:
+        logger.warning("OTLP export to %s failed", url, exc_info=True)
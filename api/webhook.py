@@ -5,20 +5,33 @@ Architecture: Inline async processing
 1. Receive image → reply "analyzing..." instantly (via reply token)
 2. Process inline (await) so Vercel keeps the function alive until completion
 3. Push result via Push Message API; every failure path guarantees a user-facing message
+
+Queue mode (WEBHOOK_QUEUE_MODE=1): events are persisted to webhook_jobs and
+acked immediately; api/worker.py claims and processes them.
 """
 
 from __future__ import annotations
 
 import asyncio
+import hmac
 import logging
-import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime, timezone
 from urllib.parse import parse_qs
 
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 
-from _lib import config
-from _lib.models import ReviewStatus
+from _lib import (
+    admin_alerts, analysis_cache, config, log_buffer, metrics, model_router, resilience, tracing,
+)
+from _lib.concurrency import MicroBatcher, run_keyed
+from _lib.dedup import get_dedup_store
+from _lib.resilience import DependencyUnavailable
+from _lib.analysis_cache import CachedAnalysis
+from _lib.image_processing import PreparedImage, detect_mime_type, prepare_screenshot
+from _lib.models import GeminiParseResult, ParsedWord, ReviewStatus
 from _lib.line_client import (
     verify_signature,
     reply_loading,
@@ -26,21 +39,35 @@ from _lib.line_client import (
     get_message_content,
     get_user_profile,
     reply_text,
+    open_client as open_line_client,
+    close_client as close_line_client,
+)
+from _lib.gemini_client import (
+    ScreenshotStream,
+    analyze_screenshot_async,
+    analyze_screenshots_batch_async,
+    load_sdk,
+    sdk_loaded,
 )
-from _lib.gemini_client import analyze_screenshot
 from _lib.supabase_client import (
     get_or_create_user,
     check_quota,
+    check_quotas,
     upload_image,
     save_vocab_cards,
+    get_known_cards,
+    get_message_card_ids,
+    word_key,
     update_card_status,
-    log_event,
     create_upgrade_request,
     get_pending_upgrade_request,
     complete_upgrade_request,
     upload_upgrade_proof,
+    invalidate_user,
+    enqueue_webhook_jobs,
 )
 from _lib.flex_messages import (
+    MAX_CAROUSEL_BUBBLES,
     build_vocab_carousel,
     build_error_message,
 )
@@ -52,25 +79,52 @@ logger = logging.getLogger(__name__)
 # the error-handling push message if it times out.
 GEMINI_TIMEOUT = 45
 
-app = FastAPI()
+# Max events from one webhook delivery processed at the same time.
+# Events from the same user are still handled in order.
+MAX_CONCURRENT_EVENTS = 8
+
+# Streaming mode: push the first carousel once this many words are parsed;
+# the rest follow in a second carousel.
+STREAM_FIRST_BATCH = 3
+
+# Batching mode: screenshots a user sends together share one Gemini request.
+# The window bounds how long a partial batch waits for its other images.
+BATCH_WINDOW = 1.5  # seconds
+BATCH_MAX_IMAGES = 5
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """Open shared HTTP pools on startup and close them on shutdown."""
+    await open_line_client()
+    try:
+        yield
+    finally:
+        await close_line_client()
+
+
+app = FastAPI(lifespan=_lifespan)
+
+# Dedup LINE webhook redeliveries (backend chosen by DEDUP_BACKEND)
+_dedup = get_dedup_store()
 
-# Simple in-memory dedup to handle LINE webhook retries.
-# Cleared on cold start, which is acceptable.
-_processed_events: dict[str, float] = {}
-_DEDUP_WINDOW = 60  # seconds
+# Shown instead of waiting out timeouts while a dependency's circuit is open
+BUSY_MESSAGE = "SnappWord 目前服務較忙碌 🙏\n請過幾分鐘再傳一次截圖！"
+ERROR_MESSAGE = "處理時發生未預期的錯誤 😅\n請稍後重試一次。"
+SCREENSHOT_ERROR_MESSAGE = "處理截圖時發生錯誤 😅\n請稍後重試，或換一張更清晰的截圖。"
 
+# Set by _handle_event(raise_errors=True). The queue worker retries failed
+# events, so handlers re-raise instead of pushing an error notice; the
+# worker sends it once the job is dead-lettered (notify_event_failed).
+_raise_errors: ContextVar[bool] = ContextVar("raise_errors", default=False)
 
-def _is_duplicate(event_id: str) -> bool:
-    """Return True if this webhook event was already processed recently."""
-    now = time.time()
-    # Clean expired entries
-    expired = [k for k, v in _processed_events.items() if now - v > _DEDUP_WINDOW]
-    for k in expired:
-        del _processed_events[k]
-    if event_id in _processed_events:
-        return True
-    _processed_events[event_id] = now
-    return False
+
+def _on_circuit_open(dependency: str) -> None:
+    admin_alerts.record(None, f"{dependency} 服務異常，已暫停呼叫")
+
+
+for _dependency in resilience.DEPENDENCIES:
+    _dependency.on_open = _on_circuit_open
 
 
 @app.post("/api/webhook")
@@ -90,79 +144,186 @@ async def webhook(request: Request) -> dict:
     payload = await request.json()
     events = payload.get("events", [])
 
+    if config.WEBHOOK_QUEUE_MODE and events:
+        try:
+            queued = await asyncio.to_thread(enqueue_webhook_jobs, events)
+            logger.info("Queued %d/%d webhook events", queued, len(events))
+            return {"status": "queued"}
+        except Exception:
+            # Fall back to inline processing rather than losing the events
+            logger.exception("Failed to enqueue webhook events, processing inline")
+
+    duplicates = await _dedup.duplicates(
+        [event["webhookEventId"] for event in events if event.get("webhookEventId")]
+    )
+    pending = []
     for event in events:
         event_id = event.get("webhookEventId", "")
-        if event_id and _is_duplicate(event_id):
+        if event_id in duplicates:
             logger.info("Skipping duplicate event %s", event_id)
+            metrics.dedup_hits.inc()
             continue
-        await _handle_event(event)
+        pending.append(event)
+
+    try:
+        await run_keyed(
+            _group_image_sets(pending),
+            lambda unit: _event_order_key(unit[0]),
+            _handle_unit,
+            MAX_CONCURRENT_EVENTS,
+        )
+    finally:
+        # Serverless: buffered logs must be written before we return
+        await log_buffer.flush()
+        await admin_alerts.flush()
+        await tracing.flush()
+        await metrics.flush_rollup()
 
     return {"status": "ok"}
 
 
+@app.get("/api/metrics")
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """This instance's metrics in Prometheus text format.
+
+    Each serverless instance only counts its own traffic; fleet-wide numbers
+    come from the metrics_rollups table (METRICS_ROLLUP=1). Disabled (404)
+    unless METRICS_TOKEN is set.
+    """
+    if not config.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {config.METRICS_TOKEN}".encode()
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _event_order_key(event: dict) -> str:
+    """Events from the same user must stay ordered; others may interleave."""
+    user_id = event.get("source", {}).get("userId")
+    return user_id or event.get("webhookEventId") or str(id(event))
+
+
+def _group_image_sets(events: list[dict]) -> list[list[dict]]:
+    """Split a delivery into units for _handle_unit: one event each, except
+    that with GEMINI_BATCHING the images of a LINE imageSet form one unit."""
+    units: list[list[dict]] = []
+    sets: dict[tuple[str, str], list[dict]] = {}
+    for event in events:
+        message = event.get("message", {})
+        image_set = message.get("imageSet")
+        if not (config.GEMINI_BATCHING and image_set and message.get("type") == "image"):
+            units.append([event])
+            continue
+        key = (_event_order_key(event), image_set.get("id"))
+        if key in sets:
+            sets[key].append(event)
+        else:
+            sets[key] = [event]
+            units.append(sets[key])
+    return units
+
+
+async def _handle_unit(unit: list[dict]) -> None:
+    if len(unit) == 1:
+        await _handle_event(unit[0])
+    else:
+        await _handle_image_set(unit)
+
+
 # ── Helpers ──────────────────────────────────────────────────────────
 
 
-async def _safe_push(user_id: str, messages: list[dict]) -> None:
-    """Push message with error suppression — never raises."""
+async def _safe_push(user_id: str, messages: list[dict], coalesce: bool = False) -> None:
+    """Push message with error suppression — never raises.
+
+    coalesce=True for notices many users get verbatim; concurrent ones
+    share a multicast request.
+    """
     try:
-        await push_message(user_id, messages)
+        await push_message(user_id, messages, coalesce=coalesce)
     except Exception:
         logger.exception("Failed to push message to %s", user_id)
 
 
+# Outcome events of a screenshot; their payload gets the trace's stage timings
+_TRACED_EVENTS = frozenset({"parse_success", "parse_fail"})
+
+
 async def _safe_log(user_id: str | None, event_type: str, **kwargs) -> None:
-    """Log event with error suppression — never raises."""
+    """Buffer a log event — never raises, never waits on the database.
+
+    Rows are bulk-inserted by log_buffer; the webhook flushes before returning.
+    """
     try:
-        await asyncio.to_thread(log_event, user_id, event_type, **kwargs)
+        if event_type in _TRACED_EVENTS:
+            stages = tracing.breakdown()
+            if stages:
+                kwargs["payload"] = {**(kwargs.get("payload") or {}), "stages": stages}
+        log_buffer.enqueue(user_id, event_type, **kwargs)
     except Exception:
         logger.exception("Failed to log event %s", event_type)
 
 
-async def _notify_admin_error(user_display: str, error_msg: str) -> None:
-    """Notify admin about a processing failure so no user is left hanging."""
-    if not config.ADMIN_LINE_USER_ID:
-        return
-    try:
-        await push_message(config.ADMIN_LINE_USER_ID, [
-            build_error_message(
-                f"⚠️ 處理失敗通知\n\n"
-                f"用戶：{user_display}\n"
-                f"錯誤：{error_msg[:100]}"
-            )
-        ])
-    except Exception:
-        logger.exception("Failed to notify admin about error")
+def _notify_admin_error(user_display: str, error_msg: str) -> None:
+    """Count a processing failure for the admin's periodic error summary."""
+    admin_alerts.record(user_display, error_msg)
 
 
 # ── Event Router ─────────────────────────────────────────────────────
 
 
-async def _handle_event(event: dict) -> None:
-    """Route event to appropriate handler.
+@asynccontextmanager
+async def _safety_net(line_user_id: str | None, raise_errors: bool = False):
+    """If anything fails, try to send an error message to the user so they
+    are never left with just "正在解析..." and no follow-up. With
+    raise_errors=True failures propagate instead (see _raise_errors)."""
+    token = _raise_errors.set(raise_errors)
+    try:
+        yield
+    except DependencyUnavailable as e:
+        if raise_errors:
+            raise
+        logger.warning("Event dropped while %s", e)
+        if line_user_id:
+            await _safe_push(line_user_id, [build_error_message(BUSY_MESSAGE)], coalesce=True)
+    except Exception:
+        if raise_errors:
+            raise
+        logger.exception("Unhandled error in event handler")
+        # Safety net: notify user so they're not left waiting forever
+        if line_user_id:
+            await _safe_push(line_user_id, [build_error_message(ERROR_MESSAGE)])
+    finally:
+        _raise_errors.reset(token)
 
-    Safety-net: if anything fails, try to send an error message to the
-    user so they are never left with just "正在解析..." and no follow-up.
-    """
+
+async def _handle_event(event: dict, raise_errors: bool = False) -> None:
+    """Route event to appropriate handler, inside the _safety_net."""
     event_type = event.get("type")
     line_user_id = event.get("source", {}).get("userId")
 
-    try:
+    async with _safety_net(line_user_id, raise_errors):
         if event_type == "follow":
             await _handle_follow(event)
         elif event_type == "message":
             await _handle_message(event)
         elif event_type == "postback":
             await _handle_postback(event)
-    except Exception:
-        logger.exception("Unhandled error in event handler")
-        # Safety net: notify user so they're not left waiting forever
-        if line_user_id:
-            await _safe_push(line_user_id, [
-                build_error_message(
-                    "處理時發生未預期的錯誤 😅\n請稍後重試一次。"
-                )
-            ])
+
+
+async def notify_event_failed(event: dict, error: str) -> None:
+    """Tell the user an event could not be processed. Never raises.
+
+    Called by the queue worker when a job is dead-lettered.
+    """
+    line_user_id = event.get("source", {}).get("userId")
+    if not line_user_id:
+        return
+    is_image = event.get("message", {}).get("type") == "image"
+    message = SCREENSHOT_ERROR_MESSAGE if is_image else ERROR_MESSAGE
+    await _safe_push(line_user_id, [build_error_message(message)])
+    _notify_admin_error(line_user_id, error)
 
 
 # ── Follow ───────────────────────────────────────────────────────────
@@ -200,6 +361,27 @@ async def _handle_follow(event: dict) -> None:
 # ── Message ──────────────────────────────────────────────────────────
 
 
+# In-flight background import of the Gemini SDK (see _preload_gemini_sdk)
+_sdk_preload: asyncio.Future | None = None
+
+
+def _preload_gemini_sdk() -> None:
+    """Start importing the lazily loaded Gemini SDK in a worker thread, so it
+    overlaps the LINE and Supabase round trips of an image event. A no-op
+    once the SDK is loaded or while an import is already running."""
+    global _sdk_preload
+    if sdk_loaded() or (_sdk_preload is not None and not _sdk_preload.done()):
+        return
+    _sdk_preload = asyncio.get_running_loop().run_in_executor(None, load_sdk)
+    _sdk_preload.add_done_callback(_log_preload_failure)
+
+
+def _log_preload_failure(future: asyncio.Future) -> None:
+    # The pipeline imports the SDK again on first use and reports that error
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Preloading the Gemini SDK failed", exc_info=future.exception())
+
+
 async def _handle_message(event: dict) -> None:
     """Handle incoming messages (image or text)."""
     message = event.get("message", {})
@@ -212,11 +394,16 @@ async def _handle_message(event: dict) -> None:
         return
 
     if msg_type == "image":
+        _preload_gemini_sdk()
+
         # Step 1: Immediately reply with loading indicator
         await reply_loading(reply_token)
 
         # Step 2: Process — errors are handled inside and always push a message
-        await _process_screenshot(line_user_id, message["id"])
+        # Images sent together carry imageSet.total; lets the batcher
+        # know how many screenshots to wait for.
+        image_count = message.get("imageSet", {}).get("total") or 1
+        await _process_screenshot(line_user_id, message["id"], image_count)
 
     elif msg_type == "text":
         text = message.get("text", "").strip()
@@ -229,15 +416,68 @@ async def _handle_message(event: dict) -> None:
         )
 
 
-async def _process_screenshot(line_user_id: str, message_id: str) -> None:
-    """Full pipeline: download → upload → AI analyze → store → push card.
+async def _handle_image_set(events: list[dict]) -> None:
+    """Images a user sent together (a LINE imageSet), with GEMINI_BATCHING.
+
+    The user is resolved and the quota checked once for the whole set, then
+    the images run concurrently so the batcher can analyze them in one
+    Gemini request.
+    """
+    line_user_id = events[0].get("source", {}).get("userId")
+    if not line_user_id:
+        return
+
+    async with _safety_net(line_user_id):
+        _preload_gemini_sdk()
+        await asyncio.gather(*(reply_loading(e.get("replyToken", "")) for e in events))
+
+        profile = await get_user_profile(line_user_id)
+        display_name = profile["displayName"] if profile else None
+        user = await asyncio.to_thread(get_or_create_user, line_user_id, display_name)
+        quotas = await asyncio.to_thread(check_quotas, user, len(events))
+
+        # Images refused by quota never reach the batcher; don't wait for them
+        total = events[0]["message"]["imageSet"].get("total") or len(events)
+        image_count = max(1, total - sum(not q["allowed"] for q in quotas))
+        await asyncio.gather(*(
+            _process_screenshot(
+                line_user_id, event["message"]["id"], image_count, user=user, quota=quota,
+            )
+            for event, quota in zip(events, quotas)
+        ))
+
+
+async def _process_screenshot(
+    line_user_id: str,
+    message_id: str,
+    image_count: int = 1,
+    user: dict | None = None,
+    quota: dict | None = None,
+) -> None:
+    """Full pipeline: download → (upload ∥ AI analyze) → store → push card.
 
+    `user` and `quota` are passed when already resolved for an image set.
     Guarantees: the user ALWAYS receives a push message (success or error).
+    Runs as one trace; the outcome's api_logs row carries its stage timings.
     """
-    # Fetch LINE profile for display name
-    profile = await get_user_profile(line_user_id)
-    display_name = profile["displayName"] if profile else None
-    user = await asyncio.to_thread(get_or_create_user, line_user_id, display_name)
+    with tracing.start_trace("process_screenshot", message_id=message_id, image_count=image_count):
+        await _screenshot_pipeline(line_user_id, message_id, image_count, user, quota)
+
+
+async def _screenshot_pipeline(
+    line_user_id: str,
+    message_id: str,
+    image_count: int,
+    user: dict | None,
+    quota: dict | None,
+) -> None:
+    if user is None:
+        # Fetch LINE profile for display name
+        profile = await get_user_profile(line_user_id)
+        display_name = profile["displayName"] if profile else None
+        user = await asyncio.to_thread(get_or_create_user, line_user_id, display_name)
+    else:
+        display_name = user.get("display_name")
     user_id = user["id"]
 
     try:
@@ -245,8 +485,12 @@ async def _process_screenshot(line_user_id: str, message_id: str) -> None:
         upgrade_req = await asyncio.to_thread(get_pending_upgrade_request, user_id)
         if upgrade_req:
             image_bytes = await get_message_content(message_id)
-            image_url = await asyncio.to_thread(upload_upgrade_proof, image_bytes, user_id)
+            image_url = await asyncio.to_thread(
+                upload_upgrade_proof, image_bytes, user_id, detect_mime_type(image_bytes)
+            )
             await asyncio.to_thread(complete_upgrade_request, upgrade_req["id"], image_url)
+            # Tier is about to change on approval; don't serve a stale row
+            invalidate_user(line_user_id)
             await push_message(line_user_id, [
                 build_error_message(
                     "已收到你的付款截圖！我們會在 24 小時內為你升級 🎉"
@@ -266,8 +510,11 @@ async def _process_screenshot(line_user_id: str, message_id: str) -> None:
             return
 
         # Check rate limit & monthly quota before processing
-        quota = await asyncio.to_thread(check_quota, user)
+        if quota is None:
+            with tracing.span("quota"):
+                quota = await asyncio.to_thread(check_quota, user)
         if not quota["allowed"]:
+            metrics.quota_rejections.inc(reason=quota["reason"])
             if quota["reason"] == "daily_quota":
                 await push_message(line_user_id, [
                     build_error_message(
@@ -292,80 +539,344 @@ async def _process_screenshot(line_user_id: str, message_id: str) -> None:
                 ])
             return
 
-        # Download image from LINE
-        image_bytes = await get_message_content(message_id)
+        # Download image from LINE, then crop/downscale/re-encode it
+        raw_bytes = await get_message_content(message_id)
+        with tracing.span("prepare"):
+            image = await asyncio.to_thread(prepare_screenshot, raw_bytes)
 
         await _safe_log(
             user_id, "image_received",
-            payload={"message_id": message_id},
+            payload={
+                "message_id": message_id,
+                "bytes_in": image.original_size,
+                "bytes_out": len(image.data),
+            },
         )
 
-        # Upload to Supabase Storage
-        image_url = await asyncio.to_thread(upload_image, image_bytes, user_id)
+        # Upload and AI analysis are independent; run them concurrently
+        # and join on the upload only to save cards.
+        upload_task = asyncio.create_task(_upload_screenshot(image, user_id))
+        delivery = _CardDelivery(line_user_id, user_id, message_id, upload_task)
 
-        # AI analysis — with explicit timeout so we never hang forever
         try:
-            parse_result, metadata = await asyncio.wait_for(
-                asyncio.to_thread(analyze_screenshot, image_bytes),
-                timeout=GEMINI_TIMEOUT,
+            # AI analysis — explicit timeout so we never hang forever.
+            # In streaming mode the first cards may be delivered in here.
+            try:
+                with tracing.span("analyze"):
+                    parse_result, metadata, cached = await _analyze_image(
+                        user_id, image, delivery, image_count
+                    )
+            except asyncio.TimeoutError:
+                logger.error("Gemini API timed out for user %s", user_id)
+                if delivery.cards_saved:
+                    # The user already has the first carousel; count it.
+                    await _safe_log(
+                        user_id, "parse_success",
+                        payload={"cards_saved": delivery.cards_saved, "partial": True},
+                    )
+                    return
+                await _safe_log(user_id, "parse_fail", payload={"error": "Gemini timeout"})
+                if _raise_errors.get():
+                    raise
+                await _safe_push(line_user_id, [
+                    build_error_message(
+                        "AI 分析超時了 ⏱\n請稍後重試一次！"
+                    )
+                ])
+                _notify_admin_error(display_name or line_user_id, "Gemini API timeout")
+                return
+
+            if not parse_result.words:
+                await push_message(line_user_id, [
+                    build_error_message(
+                        "我在這張截圖中沒有發現你在學習的單字 🤔\n"
+                        "試試傳送 Duolingo、Netflix 字幕或文章的截圖！"
+                    )
+                ])
+                return
+
+            # Save and push whatever wasn't delivered while streaming
+            remaining = parse_result.words[delivery.words_delivered:]
+            if remaining:
+                await delivery.deliver(parse_result.model_copy(update={"words": remaining}))
+
+            if not delivery.batches:
+                # Every word was already a card: don't push the same bubbles again
+                await push_message(line_user_id, [
+                    build_error_message(
+                        "這張截圖的單字都已經在你的單字本裡了 📚\n"
+                        "傳一張新的截圖來學更多單字吧！"
+                    )
+                ])
+
+            await _safe_log(
+                user_id, "parse_success",
+                payload={
+                    "cards_saved": delivery.cards_saved,
+                    "known_words": delivery.known_words,
+                    "source_app": parse_result.source_app,
+                    "has_image": delivery.image_url is not None,
+                    "batches": delivery.batches,
+                },
             )
-        except asyncio.TimeoutError:
-            logger.error("Gemini API timed out for user %s", user_id)
-            await _safe_log(user_id, "parse_fail", payload={"error": "Gemini timeout"})
-            await _safe_push(line_user_id, [
-                build_error_message(
-                    "AI 分析超時了 ⏱\n請稍後重試一次！"
+
+            if not cached:
+                await asyncio.to_thread(
+                    analysis_cache.store, metadata["cache_key"], parse_result,
+                    metadata.get("token_count") or 0,
                 )
-            ])
-            await _notify_admin_error(display_name or line_user_id, "Gemini API timeout")
-            return
+        finally:
+            # Never leave background work running when the function returns
+            await upload_task
 
-        await _safe_log(
-            user_id, "gemini_call",
-            latency_ms=metadata.get("latency_ms"),
-            token_count=metadata.get("token_count"),
-            payload={"word_count": len(parse_result.words)},
-        )
+    except DependencyUnavailable as e:
+        # A dependency is tripped: tell the user now instead of waiting out timeouts
+        logger.warning("Skipping screenshot for user %s: %s", user_id, e)
+        await _safe_log(user_id, "parse_fail", payload={"error": str(e)})
+        if _raise_errors.get():
+            raise
+        await _safe_push(line_user_id, [build_error_message(BUSY_MESSAGE)], coalesce=True)
+        _notify_admin_error(display_name or line_user_id, str(e))
 
-        if not parse_result.words:
-            await push_message(line_user_id, [
-                build_error_message(
-                    "我在這張截圖中沒有發現你在學習的單字 🤔\n"
-                    "試試傳送 Duolingo、Netflix 字幕或文章的截圖！"
-                )
-            ])
+    except Exception as e:
+        logger.exception("Failed to process screenshot for user %s", user_id)
+        await _safe_log(user_id, "parse_fail", payload={"error": str(e)})
+        if _raise_errors.get():
+            raise
+        await _safe_push(line_user_id, [build_error_message(SCREENSHOT_ERROR_MESSAGE)])
+        _notify_admin_error(display_name or line_user_id, str(e))
+
+    finally:
+        # Write this screenshot's logs (incl. parse_success, which feeds the
+        # quota counters) before the user's next event is checked.
+        await log_buffer.flush()
+
+
+class _CardDelivery:
+    """Saves and pushes the cards of one screenshot, possibly in batches.
+
+    Cards are tagged with the LINE message id, so a retry of the same
+    message (e.g. a queued job whose push failed) sends the cards its
+    earlier attempt saved instead of treating them as already known.
+    """
+
+    def __init__(
+        self, line_user_id: str, user_id: str, message_id: str, upload_task: asyncio.Task
+    ) -> None:
+        self.line_user_id = line_user_id
+        self.user_id = user_id
+        self.message_id = message_id
+        self.upload_task = upload_task
+        self.image_url: str | None = None
+        self.early: asyncio.Task | None = None
+        self.words_delivered = 0
+        self.cards_saved = 0
+        self.known_words = 0
+        self.batches = 0
+
+    def deliver_early(self, parse_result: GeminiParseResult) -> None:
+        """Start delivering the first streamed words in the background, so
+        saving and pushing them isn't charged to the Gemini timeout."""
+        self.early = asyncio.create_task(self.deliver(parse_result))
+
+    async def settle(self) -> None:
+        """Wait for the early delivery, if one was started."""
+        if self.early is not None:
+            await self.early
+
+    async def deliver(self, parse_result: GeminiParseResult) -> None:
+        # Cards are still saved if the upload failed (image_url is None)
+        self.image_url = await self.upload_task
+        self.words_delivered += len(parse_result.words)
+
+        # Words the user already has skip the insert
+        keys = {word_key(w.word, parse_result.target_lang) for w in parse_result.words}
+        known = await asyncio.to_thread(get_known_cards, self.user_id, keys)
+        new_words, known_pairs = _split_known_words(parse_result, known)
+        resent_pairs = []
+        if known_pairs:
+            own = await asyncio.to_thread(get_message_card_ids, self.user_id, self.message_id)
+            resent_pairs = [(w, card_id) for w, card_id in known_pairs if card_id in own]
+            known_pairs = [(w, card_id) for w, card_id in known_pairs if card_id not in own]
+        saved_cards = []
+        if new_words:
+            saved_cards = await asyncio.to_thread(
+                save_vocab_cards, self.user_id, self.image_url,
+                parse_result.model_copy(update={"words": new_words}), self.message_id,
+            )
+        card_ids = {(c["word_key"], c["target_lang"]): c["id"] for c in saved_cards}
+
+        # A word the upsert skipped was saved meanwhile (another screenshot,
+        # the web app): show its existing card instead of dropping it
+        skipped = {word_key(w.word, parse_result.target_lang) for w in new_words} - card_ids.keys()
+        if skipped:
+            existing = await asyncio.to_thread(get_known_cards, self.user_id, skipped)
+            known_pairs += [
+                (w, existing[key])
+                for w in new_words
+                if (key := word_key(w.word, parse_result.target_lang)) in existing
+            ]
+
+        self.known_words += len(known_pairs)
+        self.cards_saved += len(saved_cards) + len(resent_pairs)
+        if not saved_cards and not resent_pairs:
             return
+        self.batches += 1
 
-        # Save to database
-        saved_cards = await asyncio.to_thread(
-            save_vocab_cards, user_id, image_url, parse_result
-        )
+        # New words first; known ones only fill the bubbles left over
+        word_card_pairs = [
+            (w, card_ids[key])
+            for w in new_words
+            if (key := word_key(w.word, parse_result.target_lang)) in card_ids
+        ]
+        word_card_pairs += resent_pairs + known_pairs
+
+        # Build and send Flex Message
+        flex_msg = build_vocab_carousel(word_card_pairs[:MAX_CAROUSEL_BUBBLES], parse_result.source_app)
+        await push_message(self.line_user_id, [flex_msg])
+
+
+def _split_known_words(
+    parse_result: GeminiParseResult,
+    known: dict[tuple[str, str], str],
+) -> tuple[list[ParsedWord], list[tuple[ParsedWord, str]]]:
+    """Split words into new ones and (word, existing card id) pairs.
+
+    Repeats within the screenshot are dropped.
+    """
+    new_words: list[ParsedWord] = []
+    known_pairs: list[tuple[ParsedWord, str]] = []
+    seen: set[tuple[str, str]] = set()
+    for w in parse_result.words:
+        key = word_key(w.word, parse_result.target_lang)
+        if key in seen:
+            continue
+        seen.add(key)
+        if key in known:
+            known_pairs.append((w, known[key]))
+        else:
+            new_words.append(w)
+    return new_words, known_pairs
+
+
+async def _upload_screenshot(image: PreparedImage, user_id: str) -> str | None:
+    """Upload to Supabase Storage — returns None instead of raising."""
+    try:
+        return await asyncio.to_thread(upload_image, image.data, user_id, image.mime_type)
+    except Exception:
+        logger.exception("Screenshot upload failed for user %s", user_id)
+        return None
+
+
+async def _analyze_image(
+    user_id: str,
+    image: PreparedImage,
+    delivery: _CardDelivery,
+    image_count: int = 1,
+) -> tuple[GeminiParseResult, dict, CachedAnalysis | None]:
+    """Analyze a screenshot, serving from the content-hash cache when possible.
 
+    With GEMINI_STREAMING enabled the first STREAM_FIRST_BATCH words are
+    delivered through `delivery` as soon as Gemini has produced them. With
+    GEMINI_BATCHING enabled, screenshots the user sent together (image_count
+    of them) share one Gemini request.
+
+    Returns (parse_result, metadata, cached); metadata carries the cache key.
+    Raises asyncio.TimeoutError if Gemini exceeds GEMINI_TIMEOUT.
+    """
+    cache_key = await asyncio.to_thread(analysis_cache.cache_key, image.data, user_id)
+    cached = await asyncio.to_thread(analysis_cache.lookup, cache_key)
+    if cached:
         await _safe_log(
-            user_id, "parse_success",
+            user_id, "cache_hit",
             payload={
-                "cards_saved": len(saved_cards),
-                "source_app": parse_result.source_app,
+                "tier": cached.tier,
+                "tokens_saved": cached.token_count,
+                "word_count": len(cached.result.words),
             },
         )
+        return cached.result, {"cache_key": cache_key}, cached
+
+    # At most one mode is enabled (checked by config at startup)
+    if config.GEMINI_STREAMING:
+        analysis = _stream_analysis(ScreenshotStream(image.data, image.mime_type), delivery)
+    elif config.GEMINI_BATCHING:
+        analysis = _gemini_batcher.submit(user_id, image, expected=image_count)
+    elif config.GEMINI_ROUTING:
+        analysis = model_router.analyze(image)
+    else:
+        analysis = analyze_screenshot_async(image.data, image.mime_type)
+    try:
+        parse_result, metadata = await asyncio.wait_for(analysis, timeout=GEMINI_TIMEOUT)
+    finally:
+        # Only the stream is timed; the first carousel finishes regardless
+        await delivery.settle()
+
+    await _safe_log(
+        user_id, "gemini_call",
+        latency_ms=metadata.get("latency_ms"),
+        token_count=metadata.get("token_count"),
+        payload={
+            "word_count": len(parse_result.words),
+            "cache": "miss",
+            "first_word_ms": metadata.get("first_word_ms"),
+            "batch_size": metadata.get("batch_size", 1),
+            "model": metadata.get("model"),
+            "escalated": metadata.get("escalated", False),
+            "hedged": metadata.get("hedged", False),
+            "cached_tokens": metadata.get("cached_tokens"),
+            "uncached_tokens": metadata.get("uncached_tokens"),
+        },
+    )
+    metadata["cache_key"] = cache_key
+    return parse_result, metadata, None
+
+
+async def _stream_analysis(
+    stream: ScreenshotStream,
+    delivery: _CardDelivery,
+) -> tuple[GeminiParseResult, dict]:
+    """Consume a streamed analysis, starting an early carousel for the first
+    words; the caller awaits it with delivery.settle()."""
+    first_batch: list[ParsedWord] = []
+    async for word in stream:
+        if delivery.early is not None:
+            continue
+        first_batch.append(word)
+        if len(first_batch) >= STREAM_FIRST_BATCH:
+            delivery.deliver_early(GeminiParseResult(**stream.parser.header, words=first_batch))
+    return stream.result, stream.metadata
 
-        # Build and send Flex Message
-        word_card_pairs = [
-            (w, card["id"])
-            for w, card in zip(parse_result.words, saved_cards)
-        ]
-        flex_msg = build_vocab_carousel(word_card_pairs, parse_result.source_app)
-        await push_message(line_user_id, [flex_msg])
 
-    except Exception as e:
-        logger.exception("Failed to process screenshot for user %s", user_id)
-        await _safe_log(user_id, "parse_fail", payload={"error": str(e)})
-        await _safe_push(line_user_id, [
-            build_error_message(
-                "處理截圖時發生錯誤 😅\n請稍後重試，或換一張更清晰的截圖。"
-            )
-        ])
-        await _notify_admin_error(display_name or line_user_id, str(e))
+async def _run_gemini_batch(
+    images: list[PreparedImage],
+) -> list[tuple[GeminiParseResult, dict] | Exception]:
+    """Analyze a micro-batch; images the batch call missed are retried singly."""
+    if len(images) == 1:
+        return [await analyze_screenshot_async(images[0].data, images[0].mime_type)]
+
+    try:
+        results = await analyze_screenshots_batch_async(
+            [(image.data, image.mime_type) for image in images]
+        )
+    except Exception:
+        logger.exception("Batched Gemini call failed, falling back to single requests")
+        results = [None] * len(images)
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        singles = await asyncio.gather(
+            *(analyze_screenshot_async(images[i].data, images[i].mime_type) for i in missing),
+            return_exceptions=True,
+        )
+        for i, single in zip(missing, singles):
+            results[i] = single
+    return results
+
+
+_gemini_batcher: MicroBatcher[PreparedImage, tuple[GeminiParseResult, dict]] = MicroBatcher(
+    _run_gemini_batch, window=BATCH_WINDOW, max_size=BATCH_MAX_IMAGES
+)
 
 
 # ── Text Commands ────────────────────────────────────────────────────
@@ -0,0 +1,166 @@
+"""
+Queue-mode worker for SnappWord 截詞.
+
+Claims jobs persisted by the webhook (WEBHOOK_QUEUE_MODE=1) from the
+webhook_jobs table using FOR UPDATE SKIP LOCKED, runs them through the same
+event handlers as the inline webhook, and requeues failures with backoff
+until they are dead-lettered.
+
+Failed jobs are retried without telling the user; the error notice is
+pushed only once a job is dead-lettered. Each run also deletes expired
+webhook dedup records (DEDUP_BACKEND=postgres), keeping that sweep off the
+webhook's request path.
+
+Run as:
+- HTTP: GET/POST /api/worker/run drains jobs for up to RUN_BUDGET seconds.
+  On Vercel the `crons` entry in vercel.json calls it every minute (Vercel
+  sends CRON_SECRET as the bearer token, which is required); elsewhere,
+  point any scheduler at it. Nothing wakes the worker on enqueue, so with
+  the cron alone a queued screenshot can wait up to a minute before
+  processing starts — run the CLI poller for lower latency.
+- CLI:  `python api/worker.py` to poll continuously, `--once` for one batch
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hmac
+import logging
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+
+from _lib import admin_alerts, config, job_queue, log_buffer, metrics, tracing
+from _lib.concurrency import run_keyed
+from _lib.dedup import get_dedup_store
+from _lib.line_client import close_client as close_line_client
+from _lib.supabase_client import claim_webhook_jobs
+from webhook import GEMINI_TIMEOUT, MAX_CONCURRENT_EVENTS, _handle_event, _lifespan, notify_event_failed
+
+logger = logging.getLogger(__name__)
+
+# One claim runs in a single round of concurrent jobs (the claim RPC
+# returns at most one job per LINE user)
+BATCH_SIZE = MAX_CONCURRENT_EVENTS
+# Per-job budget: the Gemini timeout plus download, save and push
+JOB_TIMEOUT = GEMINI_TIMEOUT + 5
+# Time one HTTP invocation spends on jobs. Vercel's maxDuration is 60 s;
+# the rest covers claiming, marking jobs and flushing logs. No new batch is
+# claimed once less than JOB_TIMEOUT remains.
+RUN_BUDGET = 52
+# Jobs locked longer than this are assumed orphaned and reclaimed
+LOCK_TIMEOUT_S = 120
+POLL_INTERVAL = 1.0
+
+app = FastAPI(lifespan=_lifespan)
+
+_dedup = get_dedup_store()
+
+
+async def _run_job(job: dict, timeout: float) -> str:
+    try:
+        await asyncio.wait_for(_handle_event(job["event"], raise_errors=True), timeout=timeout)
+    except Exception as e:
+        logger.exception("Job %s failed", job["id"])
+        status = await asyncio.to_thread(job_queue.mark_failed, job, repr(e))
+        if status == "dead":
+            await notify_event_failed(job["event"], repr(e))
+        return status
+    await asyncio.to_thread(job_queue.mark_done, job)
+    return "done"
+
+
+async def run_batch(limit: int = BATCH_SIZE, deadline: float | None = None) -> dict:
+    """Claim and process up to `limit` jobs. Returns per-status counts.
+
+    With a `deadline` (time.monotonic()), jobs are cut off at it and
+    requeued like any other failure.
+    """
+    jobs = await asyncio.to_thread(claim_webhook_jobs, limit, LOCK_TIMEOUT_S)
+    counts = {"claimed": len(jobs), "done": 0, "queued": 0, "dead": 0}
+
+    async def _run(job: dict) -> None:
+        timeout = JOB_TIMEOUT
+        if deadline is not None:
+            timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+        status = await _run_job(job, timeout)
+        counts[status] += 1
+
+    try:
+        await run_keyed(
+            jobs,
+            lambda job: job.get("line_user_id") or job["id"],
+            _run,
+            MAX_CONCURRENT_EVENTS,
+        )
+    finally:
+        await log_buffer.flush()
+        await admin_alerts.flush()
+        await tracing.flush()
+        await metrics.flush_rollup()
+    return counts
+
+
+async def drain(budget: float = RUN_BUDGET) -> dict:
+    """Run batches until the queue is empty or less than JOB_TIMEOUT of
+    `budget` seconds remains. Returns the summed counts."""
+    deadline = time.monotonic() + budget
+    totals = {"claimed": 0, "done": 0, "queued": 0, "dead": 0}
+    while deadline - time.monotonic() >= JOB_TIMEOUT:
+        counts = await run_batch(deadline=deadline)
+        for status, n in counts.items():
+            totals[status] += n
+        if not counts["claimed"]:
+            break
+    return totals
+
+
+@app.api_route("/api/worker/run", methods=["GET", "POST"])
+async def run(request: Request) -> dict:
+    """Drain queued webhook jobs within one invocation's time budget.
+    Disabled (404) unless CRON_SECRET is set."""
+    if not config.CRON_SECRET:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {config.CRON_SECRET}".encode()
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        return await drain()
+    finally:
+        await _dedup.cleanup()
+
+
+async def _poll(once: bool) -> None:
+    try:
+        await _poll_loop(once)
+    finally:
+        await close_line_client()
+
+
+async def _poll_loop(once: bool) -> None:
+    while True:
+        try:
+            counts = await run_batch()
+        except Exception:
+            logger.exception("Worker batch failed")
+            counts = {"claimed": 0}
+        if counts["claimed"]:
+            logger.info("Worker batch: %s", counts)
+        await _dedup.cleanup()
+        if once:
+            return
+        if not counts["claimed"]:
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Process queued LINE webhook jobs.")
+    parser.add_argument("--once", action="store_true", help="process one batch and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_poll(args.once))
+
+
+if __name__ == "__main__":
+    main()
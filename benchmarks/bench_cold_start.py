@@ -0,0 +1,97 @@
+"""Cold start: how long a fresh instance takes to import the webhook.
+
+Each run starts a new interpreter (from api/, as Vercel does), times
+`import webhook`, and then times gemini_client.load_sdk() — the import the
+first screenshot pays, off the path of follow/text/postback events. It
+also checks that the heavy SDKs stayed unloaded after `import webhook`.
+
+Exits non-zero when the median import exceeds --max-ms or a --forbid
+module was loaded, so it can run as a CI check.
+
+Usage:
+    python -m benchmarks.bench_cold_start --runs 10 --max-ms 800
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from benchmarks.profile_imports import API_DIR, child_env
+
+DEFAULT_FORBID = ("google.genai", "supabase")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import webhook
+imported = time.perf_counter()
+loaded = [m for m in {forbid!r} if m in sys.modules]
+from _lib import gemini_client
+gemini_client.load_sdk()
+sdk = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "sdk_ms": (sdk - imported) * 1000,
+    "loaded": loaded,
+}}))
+"""
+
+
+def probe(forbid: tuple[str, ...]) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(forbid=list(forbid))],
+        cwd=API_DIR,
+        env=child_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main(runs: int, max_ms: float | None, forbid: tuple[str, ...]) -> int:
+    results = [probe(forbid) for _ in range(runs)]
+    imports = [r["import_ms"] for r in results]
+    sdk = [r["sdk_ms"] for r in results]
+    loaded = sorted({m for r in results for m in r["loaded"]})
+
+    print(f"{runs} fresh interpreters")
+    print(
+        f"  import webhook       p50 {statistics.median(imports):7.1f} ms"
+        f"  p95 {_percentile(imports, 0.95):7.1f} ms"
+    )
+    print(
+        f"  + load_sdk (images)  p50 {statistics.median(sdk):7.1f} ms"
+        f"  p95 {_percentile(sdk, 0.95):7.1f} ms"
+    )
+
+    failed = False
+    if loaded:
+        print(f"FAIL: import webhook loaded {', '.join(loaded)}")
+        failed = True
+    if max_ms is not None and statistics.median(imports) > max_ms:
+        print(f"FAIL: median import {statistics.median(imports):.1f} ms > {max_ms:.0f} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail above this median import time")
+    parser.add_argument(
+        "--forbid",
+        default=",".join(DEFAULT_FORBID),
+        help="comma-separated modules that must not be loaded by `import webhook`",
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.runs, args.max_ms, tuple(m for m in args.forbid.split(",") if m)))
@@ -0,0 +1,83 @@
+"""10-bubble carousel: build + serialize cost per push.
+
+Compares the Flex dicts encoded with stdlib json (what httpx does with
+`json=`) and with orjson, which is what line_client now sends.
+
+Usage:
+    python -m benchmarks.bench_flex --repeat 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+
+for _key in (
+    "LINE_CHANNEL_SECRET",
+    "LINE_CHANNEL_ACCESS_TOKEN",
+    "SUPABASE_URL",
+    "SUPABASE_SERVICE_KEY",
+    "GEMINI_API_KEY",
+):
+    os.environ.setdefault(_key, "bench")
+
+import orjson  # noqa: E402
+
+from api._lib.flex_messages import MAX_CAROUSEL_BUBBLES, build_vocab_carousel  # noqa: E402
+from api._lib.models import ParsedWord  # noqa: E402
+
+
+def _words(n: int) -> list[tuple[ParsedWord, str]]:
+    return [
+        (
+            ParsedWord(
+                word=f"ephemeral{i}",
+                pronunciation="/ɪˈfem.ər.əl/",
+                translation="短暫的",
+                context_sentence="The beauty of cherry blossoms is \"ephemeral\".",
+                context_trans="櫻花之美是短暫的。",
+                tags=["Adjective", "Advanced", "Extra"],
+                ai_example="Fame can be ephemeral.",
+            ),
+            f"00000000-0000-0000-0000-{i:012d}",
+        )
+        for i in range(n)
+    ]
+
+
+def _json_push(words) -> bytes:
+    payload = {"to": "U1", "messages": [build_vocab_carousel(words, "Netflix")]}
+    return json.dumps(payload).encode()
+
+
+def _orjson_push(words) -> bytes:
+    payload = {"to": "U1", "messages": [build_vocab_carousel(words, "Netflix")]}
+    return orjson.dumps(payload)
+
+
+def _bench(fn, words, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(words)
+    return (time.perf_counter() - start) * 1e6 / repeat
+
+
+def main(repeat: int) -> None:
+    words = _words(MAX_CAROUSEL_BUBBLES)
+    # Same message either way
+    assert json.loads(_json_push(words)) == orjson.loads(_orjson_push(words))
+
+    print(f"{MAX_CAROUSEL_BUBBLES}-bubble carousel push body, {repeat} runs:")
+    for label, fn in (
+        ("dict + json", _json_push),
+        ("dict + orjson", _orjson_push),
+    ):
+        print(f"  {label:<14} {_bench(fn, words, repeat):8.1f} µs/push")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    main(parser.parse_args().repeat)
@@ -0,0 +1,134 @@
+"""Per-event LINE API latency: one client per call vs. the shared pool.
+
+Runs a local keep-alive HTTP server that sleeps on every new connection to
+emulate the TCP+TLS handshake to api.line.me, then replays the calls made
+for one image event (reply, profile, content download, push).
+
+Usage:
+    python -m benchmarks.bench_line_latency --events 50 --handshake-ms 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+# config validates these at import time
+for _key in (
+    "LINE_CHANNEL_SECRET",
+    "LINE_CHANNEL_ACCESS_TOKEN",
+    "SUPABASE_URL",
+    "SUPABASE_SERVICE_KEY",
+    "GEMINI_API_KEY",
+):
+    os.environ.setdefault(_key, "bench")
+
+import httpx  # noqa: E402
+
+from api._lib import line_client  # noqa: E402
+
+_PROFILE_BODY = b'{"displayName": "bench", "pictureUrl": null}'
+_IMAGE_BODY = b"\xff\xd8" + b"\x00" * 200_000
+
+
+async def _serve(handshake_s: float) -> tuple[asyncio.AbstractServer, int]:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await asyncio.sleep(handshake_s)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                length = 0
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                if length:
+                    await reader.readexactly(length)
+                path = request_line.split(" ")[1]
+                if path.endswith("/content"):
+                    body = _IMAGE_BODY
+                elif "/profile/" in path:
+                    body = _PROFILE_BODY
+                else:
+                    body = b"{}"
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def _legacy_event(base: str) -> None:
+    """The pre-pooling behaviour: a fresh AsyncClient for every call."""
+    headers = line_client._headers()
+    async with httpx.AsyncClient(timeout=line_client._TIMEOUT) as client:
+        await client.post(f"{base}/message/reply", headers=headers, json={"replyToken": "t", "messages": []})
+    async with httpx.AsyncClient(timeout=line_client._TIMEOUT) as client:
+        await client.get(f"{base}/profile/U1", headers=headers)
+    async with httpx.AsyncClient(timeout=line_client._CONTENT_TIMEOUT) as client:
+        await client.get(f"{base}/message/1/content", headers=headers)
+    async with httpx.AsyncClient(timeout=line_client._TIMEOUT) as client:
+        await client.post(f"{base}/message/push", headers=headers, json={"to": "U1", "messages": []})
+
+
+async def _pooled_event(base: str) -> None:
+    await line_client.reply_message("t", [])
+    await line_client.get_user_profile("U1")
+    await line_client.get_message_content("1")
+    await line_client.push_message("U1", [])
+
+
+async def _measure(fn, base: str, events: int) -> list[float]:
+    samples = []
+    for _ in range(events):
+        start = time.perf_counter()
+        await fn(base)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(name: str, samples: list[float]) -> None:
+    ordered = sorted(samples)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(
+        f"{name:<10} mean={statistics.mean(samples):8.2f} ms  "
+        f"p50={statistics.median(samples):8.2f} ms  p95={p95:8.2f} ms"
+    )
+
+
+async def main(events: int, handshake_ms: float) -> None:
+    server, port = await _serve(handshake_ms / 1000)
+    base = f"http://127.0.0.1:{port}/v2/bot"
+    line_client.LINE_API_BASE = base
+    line_client.LINE_DATA_API_BASE = base
+    line_client._HTTP2 = False  # local server speaks plain HTTP/1.1
+
+    async with server:
+        legacy = await _measure(_legacy_event, base, events)
+        await line_client.open_client()
+        pooled = await _measure(_pooled_event, base, events)
+        await line_client.close_client()
+
+    print(f"{events} image events, {handshake_ms:.0f} ms simulated handshake per connection")
+    _report("per-call", legacy)
+    _report("pooled", pooled)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--handshake-ms", type=float, default=60.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.events, args.handshake_ms))
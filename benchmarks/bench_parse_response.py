@@ -0,0 +1,101 @@
+"""_parse_response throughput on the malformed-output corpus.
+
+Compares the current single-pass parser against the previous three-attempt
+json.loads + regex implementation, including large truncated outputs where
+the old greedy `\\{[\\s\\S]*\\}` fallback had to backtrack.
+
+Usage:
+    python -m benchmarks.bench_parse_response --repeat 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import time
+
+for _key in (
+    "LINE_CHANNEL_SECRET",
+    "LINE_CHANNEL_ACCESS_TOKEN",
+    "SUPABASE_URL",
+    "SUPABASE_SERVICE_KEY",
+    "GEMINI_API_KEY",
+):
+    os.environ.setdefault(_key, "bench")
+
+import logging  # noqa: E402
+
+from pydantic import ValidationError  # noqa: E402
+
+from api._lib.gemini_client import _parse_response  # noqa: E402
+from api._lib.models import GeminiParseResult  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "gemini_malformed.json")
+
+
+def _legacy_parse(raw: str) -> GeminiParseResult:
+    """The pre-rewrite implementation, kept here for comparison only."""
+    try:
+        return GeminiParseResult(**json.loads(raw))
+    except (json.JSONDecodeError, ValidationError, TypeError):
+        pass
+    match = re.search(r"```(?:json)?\s*(\{[\s\S]*?\})\s*```", raw)
+    if match:
+        try:
+            return GeminiParseResult(**json.loads(match.group(1)))
+        except (json.JSONDecodeError, ValidationError, TypeError):
+            pass
+    match = re.search(r"\{[\s\S]*\}", raw)
+    if match:
+        try:
+            return GeminiParseResult(**json.loads(match.group(0)))
+        except (json.JSONDecodeError, ValidationError, TypeError):
+            pass
+    return GeminiParseResult(words=[])
+
+
+def _large_truncated(n_words: int) -> str:
+    words = [
+        {
+            "word": f"word{i}",
+            "translation": "翻譯 {with braces}",
+            "context_sentence": "A sentence with {braces} and \"quotes\".",
+            "tags": ["Noun", "Topic"],
+        }
+        for i in range(n_words)
+    ]
+    raw = json.dumps({"source_app": "General", "words": words}, ensure_ascii=False)
+    return "```json\n" + raw[: int(len(raw) * 0.9)]
+
+
+def _bench(fn, samples: list[str], repeat: int) -> tuple[float, int]:
+    start = time.perf_counter()
+    words = 0
+    for _ in range(repeat):
+        for raw in samples:
+            words += len(fn(raw).words)
+    elapsed = time.perf_counter() - start
+    return elapsed * 1e6 / (repeat * len(samples)), words // repeat
+
+
+def main(repeat: int) -> None:
+    logging.disable(logging.WARNING)  # the corpus trips parse warnings on purpose
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = [case["raw"] for case in json.load(f)]
+    suites = {
+        "corpus": corpus,
+        "large truncated (200 words)": [_large_truncated(200)],
+    }
+    for name, samples in suites.items():
+        print(f"{name}:")
+        for label, fn in (("legacy", _legacy_parse), ("current", _parse_response)):
+            per_call_us, words = _bench(fn, samples, repeat)
+            print(f"  {label:<8} {per_call_us:10.1f} µs/call   words salvaged: {words}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    main(parser.parse_args().repeat)
@@ -0,0 +1,13 @@
+"""Offline load testing for the webhook pipeline.
+
+- fakes: local stand-ins for the LINE, Gemini and Supabase APIs with
+  configurable latency and outputs, served from a separate process;
+- replay: signed LINE webhook deliveries (generated or replayed from a
+  file) sent to the FastAPI app at a fixed arrival rate;
+- __main__: ramps the arrival rate and reports throughput, per-stage
+  p50/p95/p99 latency and the highest concurrency that stays within the
+  function's 60 s budget.
+
+Usage:
+    python -m benchmarks.load --rates 2,5,10,20 --duration 20 --gemini-ms 4000
+"""
@@ -0,0 +1,237 @@
+"""Ramp the webhook through increasing arrival rates against the fake APIs.
+
+Starts the fakes in a child process, points the LINE, Gemini and Supabase
+clients at them and drives the FastAPI app in-process (ASGI, no network
+hop) with signed deliveries. Each rate runs for --duration seconds; the
+ramp stops at the first rate where a delivery took longer than --budget
+seconds (Vercel's maxDuration) or failed, or where more than
+--max-degraded of the screenshots got a busy/error notice instead of cards.
+
+Per-stage latencies come from timing the pipeline steps the webhook calls
+(LINE profile/content/push, user and quota lookups, preprocessing,
+upload, analysis, card saving); "webhook" is the whole delivery.
+
+Usage:
+    python -m benchmarks.load --rates 1,2,5,10 --duration 20
+    python -m benchmarks.load --rates 5 --gemini-ms 8000 --gemini-error-rate 0.05
+    python -m benchmarks.load --replay deliveries.jsonl --rates 2,4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+
+for _key in (
+    "LINE_CHANNEL_SECRET",
+    "LINE_CHANNEL_ACCESS_TOKEN",
+    "SUPABASE_URL",
+    "SUPABASE_SERVICE_KEY",
+    "GEMINI_API_KEY",
+):
+    os.environ.setdefault(_key, "bench")
+
+import httpx  # noqa: E402
+
+from benchmarks.load import fakes, replay  # noqa: E402
+
+# The app imports its helpers as `_lib`, so patch that copy, not `api._lib`
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "api"))
+
+import webhook  # noqa: E402
+from _lib import config, gemini_client, line_client, supabase_client  # noqa: E402
+
+# Stage name → function the webhook module calls for it
+STAGES = {
+    "line_reply": "reply_loading",
+    "line_profile": "get_user_profile",
+    "user_lookup": "get_or_create_user",
+    "quota": "check_quota",
+    "line_content": "get_message_content",
+    "prepare": "prepare_screenshot",
+    "upload": "upload_image",
+    "analyze": "_analyze_image",
+    "save_cards": "save_vocab_cards",
+    "line_push": "push_message",
+}
+
+
+class StageTimer:
+    """Collects per-stage latencies (ms) of the instrumented functions."""
+
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def wrap(self, stage: str, func):
+        samples = self.samples[stage]
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    samples.append((time.perf_counter() - start) * 1000)
+            return timed_async
+
+        # Sync stages run in worker threads; list.append is thread-safe
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                samples.append((time.perf_counter() - start) * 1000)
+        return timed
+
+    def install(self) -> None:
+        for stage, name in STAGES.items():
+            setattr(webhook, name, self.wrap(stage, getattr(webhook, name)))
+
+    def reset(self) -> None:
+        for samples in self.samples.values():
+            samples.clear()
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _row(name: str, samples: list[float]) -> str:
+    ordered = sorted(samples)
+    return (
+        f"  {name:<13} n={len(ordered):<6} p50={percentile(ordered, 0.50):9.1f} "
+        f"p95={percentile(ordered, 0.95):9.1f} p99={percentile(ordered, 0.99):9.1f} "
+        f"max={ordered[-1] if ordered else 0.0:9.1f} ms"
+    )
+
+
+def _point_at_fakes(root: str) -> None:
+    from google import genai
+    from google.genai import types
+
+    urls = fakes.base_urls(root)
+    line_client.LINE_API_BASE = urls["line"]
+    line_client.LINE_DATA_API_BASE = urls["line"]
+    line_client._HTTP2 = False  # the fake speaks plain HTTP/1.1
+    config.SUPABASE_URL = urls["supabase"]
+    supabase_client.reset_client()
+    gemini_client._client = genai.Client(
+        api_key=config.GEMINI_API_KEY,
+        http_options=types.HttpOptions(base_url=urls["gemini"]),
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    root = f"http://127.0.0.1:{args.port}"
+    _point_at_fakes(root)
+    timer = StageTimer()
+    timer.install()
+
+    if args.replay:
+        deliveries = replay.replay(args.replay)
+    else:
+        deliveries = replay.generate(args.users, args.images_per_delivery)
+
+    budget_ms = args.budget * 1000
+    sustained = None
+    transport = httpx.ASGITransport(app=webhook.app)
+    async with webhook.app.router.lifespan_context(webhook.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://webhook", timeout=None) as client, \
+            httpx.AsyncClient(base_url=root) as fake:
+        replayer = replay.Replayer(client, config.LINE_CHANNEL_SECRET)
+        for rate in args.rates:
+            timer.reset()
+            await fake.post("/_reset")
+            result = await replayer.run(deliveries, rate, args.duration)
+            stats = (await fake.get("/_stats")).json()
+
+            slowest = max(result.latencies_ms, default=0.0)
+            failed = result.errors + sum(n for status, n in result.statuses.items() if status != 200)
+            pushed = stats["pushed"]
+            notices = pushed.get("busy", 0) + pushed.get("other", 0)
+            degraded = notices / max(1, notices + pushed.get("cards", 0))
+            if slowest > budget_ms:
+                verdict = f"OVER the {args.budget:g} s budget"
+            elif failed:
+                verdict = "FAILED deliveries"
+            elif degraded > args.max_degraded:
+                verdict = f"DEGRADED ({degraded:.0%} notices)"
+            else:
+                verdict = "ok"
+            print(
+                f"\nrate {rate:g}/s: {result.sent} deliveries, "
+                f"{result.throughput:.2f} completed/s, peak concurrency {result.peak_in_flight}, "
+                f"{failed} failed — {verdict}"
+            )
+            print(
+                f"  pushed: {pushed.get('cards', 0)} card messages, "
+                f"{pushed.get('busy', 0)} busy notices, {pushed.get('other', 0)} other"
+            )
+            print(_row("webhook", result.latencies_ms))
+            for stage in STAGES:
+                if timer.samples[stage]:
+                    print(_row(stage, timer.samples[stage]))
+            if verdict != "ok":
+                break
+            sustained = result
+
+    print()
+    if sustained is None:
+        print(f"No tested rate stayed within the {args.budget:g} s budget.")
+    else:
+        print(
+            f"Max sustained: {sustained.rate:g} deliveries/s at peak concurrency "
+            f"{sustained.peak_in_flight} (slowest {max(sustained.latencies_ms) / 1000:.1f} s)."
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", type=lambda s: [float(r) for r in s.split(",")], default=[1, 2, 5, 10])
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per rate")
+    parser.add_argument("--budget", type=float, default=60.0, help="seconds per delivery")
+    parser.add_argument("--max-degraded", type=float, default=0.01,
+                        help="tolerated fraction of busy/error notices")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--images-per-delivery", type=int, default=1)
+    parser.add_argument("--replay", help="JSONL file of recorded webhook bodies")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--line-ms", type=float, default=30.0)
+    parser.add_argument("--supabase-ms", type=float, default=20.0)
+    parser.add_argument("--storage-ms", type=float, default=120.0)
+    parser.add_argument("--gemini-ms", type=float, default=4000.0)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=1500.0)
+    parser.add_argument("--gemini-words", type=int, default=5)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true", help="show the app's warnings")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.CRITICAL)
+    profile = fakes.FakeProfile(
+        line_ms=args.line_ms,
+        supabase_ms=args.supabase_ms,
+        storage_ms=args.storage_ms,
+        gemini_ms=args.gemini_ms,
+        gemini_jitter_ms=args.gemini_jitter_ms,
+        gemini_words=args.gemini_words,
+        gemini_error_rate=args.gemini_error_rate,
+    )
+    server = fakes.start(profile, args.port)
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Local stand-ins for the LINE, Gemini and Supabase APIs.
+
+One FastAPI app serves all three under path prefixes, so the pipeline only
+needs its base URLs pointed here (see base_urls()):
+
+- /line/v2/bot: reply, push, multicast, profile and message content (a
+  generated screenshot JPEG, distinct per message id);
+- /gemini/v1beta/models/{model}:generateContent (and the streamed and
+  batched variants): returns `gemini_words` words after a latency drawn
+  from `gemini_ms` ± `gemini_jitter_ms`, or a 503 at `gemini_error_rate`;
+- /supabase/rest/v1 and /supabase/storage/v1: PostgREST and Storage.
+  Users exist for any line_user_id (free tier, no usage), inserts echo
+  their rows with ids, every other read comes back empty (so analyses
+  never hit the cache).
+
+The server runs in its own process (start()) so its work doesn't skew the
+latencies measured in the process under test. GET /_stats returns request
+counts per route and what users were pushed (cards, busy notices, errors).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import multiprocessing
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+# Pushed altText prefixes, see flex_messages and webhook.BUSY_MESSAGE
+_CARDS_PREFIX = "📖"
+_BUSY_PREFIX = "SnappWord 目前服務較忙碌"
+
+_SAMPLE_WORDS = [
+    ("gato", "貓"), ("perro", "狗"), ("casa", "房子"), ("libro", "書"),
+    ("agua", "水"), ("ciudad", "城市"), ("tiempo", "時間"), ("amigo", "朋友"),
+    ("comer", "吃"), ("hablar", "說話"), ("rápido", "快的"), ("noche", "夜晚"),
+]
+
+
+@dataclass
+class FakeProfile:
+    """Latencies (ms) and outputs of the fake APIs."""
+
+    line_ms: float = 30.0
+    content_ms: float = 80.0
+    supabase_ms: float = 20.0
+    storage_ms: float = 120.0
+    gemini_ms: float = 4000.0
+    gemini_jitter_ms: float = 1500.0
+    gemini_words: int = 5
+    gemini_error_rate: float = 0.0
+    image_variants: int = 8
+
+
+def base_urls(root: str) -> dict[str, str]:
+    """Base URLs of the three fakes served at `root` (e.g. http://127.0.0.1:8787)."""
+    return {
+        "line": f"{root}/line/v2/bot",
+        "gemini": f"{root}/gemini/",
+        "supabase": f"{root}/supabase",
+    }
+
+
+def _screenshot(seed: int):
+    """A phone-screenshot-like page: white, grey text lines, a banner."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (1080, 2340), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 1080, 220), fill=(88, 204, 2))
+    y = 320
+    while y < 2100:
+        width = rng.randint(300, 960)
+        draw.rectangle((60, y, 60 + width, y + 34), fill=(60, 60, 60))
+        y += rng.choice((70, 70, 70, 140))
+    return image
+
+
+def _encode(page, message_id: str) -> bytes:
+    """JPEG of `page` with the message id drawn into the banner, so every
+    message is a distinct image and never hits the analysis cache."""
+    from PIL import ImageDraw
+
+    image = page.copy()
+    draw = ImageDraw.Draw(image)
+    for i, digit in enumerate(message_id[-18:]):
+        x = 60 + i * 50
+        draw.rectangle((x, 80, x + 40, 80 + 6 * (int(digit) + 1)), fill="white")
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _parse_result(words: int, offset: int = 0) -> dict:
+    picked = [_SAMPLE_WORDS[(offset + i) % len(_SAMPLE_WORDS)] for i in range(words)]
+    return {
+        "source_app": "Duolingo",
+        "target_lang": "es",
+        "source_lang": "zh-TW",
+        "words": [
+            {
+                "word": word,
+                "translation": translation,
+                "pronunciation": "",
+                "context_sentence": f"Mi {word} es nuevo.",
+                "context_trans": f"我的{translation}是新的。",
+                "ai_example": f"El {word} está aquí.",
+                "tags": ["Noun"],
+            }
+            for word, translation in picked
+        ],
+    }
+
+
+def _gemini_response(text: str, images: int) -> dict:
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": 1200 + 260 * images,
+            "candidatesTokenCount": len(text) // 3,
+            "totalTokenCount": 1200 + 260 * images + len(text) // 3,
+        },
+        "modelVersion": "fake",
+    }
+
+
+def create_app(profile: FakeProfile) -> FastAPI:
+    app = FastAPI()
+    pages = [_screenshot(seed) for seed in range(profile.image_variants)]
+    requests: Counter[str] = Counter()
+    pushed: Counter[str] = Counter()
+
+    async def sleep_ms(ms: float) -> None:
+        if ms > 0:
+            await asyncio.sleep(ms / 1000)
+
+    def record_pushed(payload: dict) -> None:
+        recipients = payload.get("to")
+        count = len(recipients) if isinstance(recipients, list) else 1
+        for message in payload.get("messages", []):
+            alt = message.get("altText") or message.get("text") or ""
+            if alt.startswith(_CARDS_PREFIX):
+                kind = "cards"
+            elif alt.startswith(_BUSY_PREFIX):
+                kind = "busy"
+            else:
+                kind = "other"
+            pushed[kind] += count
+
+    @app.get("/_stats")
+    async def stats() -> dict:
+        return {"requests": dict(requests), "pushed": dict(pushed), "profile": asdict(profile)}
+
+    @app.post("/_reset")
+    async def reset() -> dict:
+        requests.clear()
+        pushed.clear()
+        return {}
+
+    # ── LINE ──
+
+    @app.post("/line/v2/bot/message/{endpoint}")
+    async def line_message(endpoint: str, request: Request) -> dict:
+        requests[f"line.{endpoint}"] += 1
+        payload = json.loads(await request.body())
+        await sleep_ms(profile.line_ms)
+        if endpoint in ("push", "multicast"):
+            record_pushed(payload)
+        return {}
+
+    @app.get("/line/v2/bot/profile/{user_id}")
+    async def line_profile(user_id: str) -> dict:
+        requests["line.profile"] += 1
+        await sleep_ms(profile.line_ms)
+        return {"userId": user_id, "displayName": f"load-{user_id[-6:]}", "pictureUrl": None}
+
+    @app.get("/line/v2/bot/message/{message_id}/content")
+    async def line_content(message_id: str) -> Response:
+        requests["line.content"] += 1
+        start = time.perf_counter()
+        page = pages[int(message_id) % len(pages)] if message_id.isdigit() else pages[0]
+        image = await asyncio.to_thread(_encode, page, message_id)
+        await sleep_ms(profile.content_ms - (time.perf_counter() - start) * 1000)
+        return Response(image, media_type="image/jpeg")
+
+    # ── Gemini ──
+
+    @app.post("/gemini/{version}/models/{model_method:path}")
+    async def gemini(version: str, model_method: str, request: Request) -> Response:
+        model, _, method = model_method.partition(":")
+        requests[f"gemini.{method}"] += 1
+        body = json.loads(await request.body())
+        await sleep_ms(max(0.0, random.gauss(profile.gemini_ms, profile.gemini_jitter_ms)))
+        if random.random() < profile.gemini_error_rate:
+            return Response(
+                json.dumps({"error": {"code": 503, "message": "overloaded", "status": "UNAVAILABLE"}}),
+                status_code=503,
+                media_type="application/json",
+            )
+
+        image_count = sum(
+            1 for content in body.get("contents", [])
+            for part in content.get("parts", []) if "inlineData" in part or "inline_data" in part
+        )
+        if image_count > 1:
+            text = json.dumps({"results": [
+                {"image_index": i, **_parse_result(profile.gemini_words, i)}
+                for i in range(image_count)
+            ]}, ensure_ascii=False)
+        else:
+            text = json.dumps(_parse_result(profile.gemini_words), ensure_ascii=False)
+
+        if method == "streamGenerateContent":
+            # Server-sent events, a few chunks per response
+            step = max(1, len(text) // 4)
+            chunks = [text[i:i + step] for i in range(0, len(text), step)]
+            events = "".join(
+                f"data: {json.dumps(_gemini_response(chunk, image_count), ensure_ascii=False)}\r\n\r\n"
+                for chunk in chunks
+            )
+            return Response(events, media_type="text/event-stream")
+        return Response(
+            json.dumps(_gemini_response(text, image_count), ensure_ascii=False),
+            media_type="application/json",
+        )
+
+    # ── Supabase ──
+
+    @app.api_route("/supabase/rest/v1/rpc/{function}", methods=["GET", "POST"])
+    async def supabase_rpc(function: str) -> list:
+        requests[f"supabase.rpc.{function}"] += 1
+        await sleep_ms(profile.supabase_ms)
+        if function == "get_usage":
+            return [{"daily_used": 0, "monthly_used": 0}]
+        return []
+
+    @app.api_route("/supabase/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+    async def supabase_table(table: str, request: Request) -> Response:
+        requests[f"supabase.{request.method.lower()}.{table}"] += 1
+        await sleep_ms(profile.supabase_ms)
+        rows: list = []
+        if request.method == "POST":
+            body = json.loads(await request.body() or b"[]")
+            rows = [
+                {"id": str(uuid.uuid4()), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), **row}
+                for row in (body if isinstance(body, list) else [body])
+            ]
+        elif request.method == "GET" and table == "users":
+            line_user_id = request.query_params.get("line_user_id", "").removeprefix("eq.")
+            if line_user_id:
+                rows = [{
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, line_user_id)),
+                    "line_user_id": line_user_id,
+                    "display_name": f"load-{line_user_id[-6:]}",
+                    "subscription_tier": "free",
+                    "is_premium": False,
+                }]
+        return Response(json.dumps(rows, ensure_ascii=False), media_type="application/json")
+
+    @app.post("/supabase/storage/v1/object/{bucket}/{path:path}")
+    async def supabase_upload(bucket: str, path: str, request: Request) -> dict:
+        requests["supabase.storage.upload"] += 1
+        await request.body()
+        await sleep_ms(profile.storage_ms)
+        return {"Key": f"{bucket}/{path}", "Id": str(uuid.uuid4())}
+
+    return app
+
+
+def _serve(profile: FakeProfile, port: int) -> None:
+    import uvicorn
+
+    uvicorn.run(create_app(profile), host="127.0.0.1", port=port, log_level="warning")
+
+
+def start(profile: FakeProfile, port: int = 8787, timeout: float = 30.0) -> multiprocessing.Process:
+    """Serve the fakes from a child process; returns once it answers /_stats."""
+    process = multiprocessing.get_context("spawn").Process(
+        target=_serve, args=(profile, port), daemon=True
+    )
+    process.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/_stats", timeout=1.0).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            if not process.is_alive() or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(f"Fake API server did not start on port {port}")
+            time.sleep(0.1)
@@ -0,0 +1,150 @@
+"""Signed LINE webhook deliveries, generated or replayed from a file.
+
+Deliveries are sent open-loop at a fixed arrival rate — the next one
+doesn't wait for earlier ones to finish, as with real LINE traffic — so a
+pipeline that falls behind shows up as growing concurrency and latency
+instead of a quietly lower request rate.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Iterator
+
+import httpx
+
+
+def sign(body: bytes, channel_secret: str) -> str:
+    """X-Line-Signature for `body`: base64 HMAC-SHA256 with the channel secret."""
+    mac = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256)
+    return base64.b64encode(mac.digest()).decode("utf-8")
+
+
+def image_event(user_id: str, image_set: dict | None = None) -> dict:
+    message = {"type": "image", "id": str(random.randrange(10**17, 10**18))}
+    if image_set:
+        message["imageSet"] = image_set
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "webhookEventId": uuid.uuid4().hex.upper(),
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "source": {"type": "user", "userId": user_id},
+        "message": message,
+    }
+
+
+def generate(users: int, images_per_delivery: int = 1) -> Iterator[list[dict]]:
+    """Endless image deliveries, round-robin over `users` distinct users.
+
+    With images_per_delivery > 1 each delivery is one LINE imageSet.
+    """
+    user_ids = [f"U{uuid.uuid5(uuid.NAMESPACE_OID, str(i)).hex}" for i in range(users)]
+    for user_id in itertools.cycle(user_ids):
+        if images_per_delivery == 1:
+            yield [image_event(user_id)]
+            continue
+        set_id = uuid.uuid4().hex
+        yield [
+            image_event(user_id, {"id": set_id, "index": i + 1, "total": images_per_delivery})
+            for i in range(images_per_delivery)
+        ]
+
+
+def replay(path: str) -> Iterator[list[dict]]:
+    """Endless deliveries from a JSONL file of webhook bodies (or single events).
+
+    Event ids and reply tokens are refreshed on every pass so dedup doesn't
+    drop the repeats.
+    """
+    with open(path, encoding="utf-8") as f:
+        recorded = [json.loads(line) for line in f if line.strip()]
+    if not recorded:
+        raise ValueError(f"No deliveries in {path}")
+    for body in itertools.cycle(recorded):
+        events = body.get("events", [body]) if isinstance(body, dict) else body
+        yield [
+            {**event, "webhookEventId": uuid.uuid4().hex.upper(), "replyToken": uuid.uuid4().hex}
+            for event in events
+        ]
+
+
+@dataclass
+class RunResult:
+    """End-to-end outcome of one fixed-rate run."""
+
+    rate: float
+    sent: int = 0
+    latencies_ms: list[float] = field(default_factory=list)
+    statuses: dict[int, int] = field(default_factory=dict)
+    errors: int = 0
+    peak_in_flight: int = 0
+    elapsed_s: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Completed deliveries per second."""
+        return len(self.latencies_ms) / self.elapsed_s if self.elapsed_s else 0.0
+
+
+class Replayer:
+    """Sends signed deliveries to the webhook through `client`."""
+
+    def __init__(self, client: httpx.AsyncClient, channel_secret: str, path: str = "/api/webhook") -> None:
+        self.client = client
+        self.channel_secret = channel_secret
+        self.path = path
+
+    async def send(self, events: list[dict]) -> httpx.Response:
+        body = json.dumps({"destination": "Uload", "events": events}).encode("utf-8")
+        return await self.client.post(
+            self.path,
+            content=body,
+            headers={
+                "Content-Type": "application/json",
+                "X-Line-Signature": sign(body, self.channel_secret),
+            },
+        )
+
+    async def run(self, deliveries: Iterator[list[dict]], rate: float, duration: float) -> RunResult:
+        """Send rate × duration deliveries at even intervals; wait for all of them."""
+        result = RunResult(rate=rate)
+        in_flight = 0
+
+        async def one(events: list[dict]) -> None:
+            nonlocal in_flight
+            in_flight += 1
+            result.peak_in_flight = max(result.peak_in_flight, in_flight)
+            start = time.perf_counter()
+            try:
+                resp = await self.send(events)
+                result.statuses[resp.status_code] = result.statuses.get(resp.status_code, 0) + 1
+            except Exception:
+                result.errors += 1
+            else:
+                result.latencies_ms.append((time.perf_counter() - start) * 1000)
+            finally:
+                in_flight -= 1
+
+        tasks = []
+        start = time.perf_counter()
+        for i in range(max(1, round(rate * duration))):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(next(deliveries))))
+            result.sent += 1
+        await asyncio.gather(*tasks)
+        result.elapsed_s = time.perf_counter() - start
+        return result
@@ -0,0 +1,105 @@
+"""Import-time profile of a module, from `python -X importtime`.
+
+Imports the module in a fresh interpreter (from api/, as Vercel does) and
+lists the slowest imports by self and cumulative time, plus the total per
+top-level package — the quickest way to see what a cold start pays for
+before the first event is handled.
+
+Usage:
+    python -m benchmarks.profile_imports --module webhook --top 15
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+
+# config validates these at import time
+BENCH_ENV = {
+    key: "bench"
+    for key in (
+        "LINE_CHANNEL_SECRET",
+        "LINE_CHANNEL_ACCESS_TOKEN",
+        "SUPABASE_URL",
+        "SUPABASE_SERVICE_KEY",
+        "GEMINI_API_KEY",
+    )
+}
+
+
+def child_env() -> dict[str, str]:
+    """Environment for a fresh interpreter importing the api/ modules."""
+    return {**BENCH_ENV, **os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def import_times(code: str) -> list[ImportTiming]:
+    """Run `code` under -X importtime in a fresh interpreter and parse it."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=API_DIR,
+        env=child_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header row
+        timings.append(ImportTiming(module.strip(), int(self_us), int(cumulative_us)))
+    return timings
+
+
+def by_package(timings: list[ImportTiming]) -> dict[str, int]:
+    """Self time summed per top-level package, in microseconds."""
+    totals: dict[str, int] = {}
+    for t in timings:
+        package = t.module.split(".")[0]
+        totals[package] = totals.get(package, 0) + t.self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def _table(title: str, rows: list[tuple[str, int]]) -> None:
+    print(f"\n{title}")
+    for name, us in rows:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+def main(module: str, top: int) -> None:
+    timings = import_times(f"import {module}")
+    total = sum(t.self_us for t in timings)
+    print(f"import {module}: {total / 1000:.1f} ms across {len(timings)} modules")
+    _table("Top packages (self time):", list(by_package(timings).items())[:top])
+    _table(
+        "Top modules (self time):",
+        [(t.module, t.self_us) for t in sorted(timings, key=lambda t: t.self_us, reverse=True)[:top]],
+    )
+    _table(
+        "Top modules (cumulative):",
+        [(t.module, t.cumulative_us) for t in sorted(timings, key=lambda t: t.cumulative_us, reverse=True)[:top]],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="webhook")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    main(args.module, args.top)
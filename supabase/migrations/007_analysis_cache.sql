@@ -0,0 +1,21 @@
+-- Content-hash cache for Gemini screenshot analyses.
+-- Identical (or perceptually identical) screenshots reuse the stored result
+-- instead of calling Gemini again.
+CREATE TABLE analysis_cache (
+    image_hash TEXT PRIMARY KEY,          -- SHA-256 of the image bytes
+    phash TEXT,                           -- optional perceptual dHash
+    result JSONB NOT NULL,                -- serialized GeminiParseResult
+    token_count INT,                      -- tokens the original call cost
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_analysis_cache_phash ON analysis_cache(phash)
+  WHERE phash IS NOT NULL;
+
+-- RLS: service role has full access (same pattern as other tables)
+ALTER TABLE analysis_cache ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on analysis_cache"
+    ON analysis_cache FOR ALL
+    USING (TRUE)
+    WITH CHECK (TRUE);
@@ -0,0 +1,5 @@
+-- Screenshots are now re-encoded to WebP before upload.
+-- Allow it on the screenshot bucket (previously jpeg/png only).
+UPDATE storage.buckets
+SET allowed_mime_types = ARRAY['image/jpeg', 'image/png', 'image/webp']
+WHERE id = 'user_screenshots';
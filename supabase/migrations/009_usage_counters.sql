@@ -0,0 +1,90 @@
+-- Per-user usage counters for quota checks.
+-- check_quota used to COUNT(*) api_logs twice per screenshot with no
+-- supporting index. Counters are now bumped by a trigger whenever a
+-- parse_success row is logged and read back in one RPC call.
+
+CREATE TABLE usage_counters (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    period_type TEXT NOT NULL,   -- 'day' | 'month'
+    period_start DATE NOT NULL,  -- UTC day, or first day of the UTC month
+    count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, period_type, period_start)
+);
+
+-- RLS: service role has full access (same pattern as other tables)
+ALTER TABLE usage_counters ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on usage_counters"
+    ON usage_counters FOR ALL
+    USING (TRUE)
+    WITH CHECK (TRUE);
+
+-- Supporting index for the remaining api_logs lookups (admin stats etc.)
+CREATE INDEX IF NOT EXISTS idx_api_logs_user_event_created
+    ON api_logs(user_id, event_type, created_at);
+
+-- ============================================
+-- Trigger: bump counters atomically on parse_success
+-- ============================================
+CREATE OR REPLACE FUNCTION bump_usage_counters() RETURNS TRIGGER AS $$
+DECLARE
+    utc_day DATE := (NEW.created_at AT TIME ZONE 'UTC')::DATE;
+BEGIN
+    IF NEW.event_type <> 'parse_success' OR NEW.user_id IS NULL THEN
+        RETURN NEW;
+    END IF;
+
+    INSERT INTO usage_counters (user_id, period_type, period_start, count)
+    VALUES
+        (NEW.user_id, 'day', utc_day, 1),
+        (NEW.user_id, 'month', DATE_TRUNC('month', utc_day)::DATE, 1)
+    ON CONFLICT (user_id, period_type, period_start)
+    DO UPDATE SET count = usage_counters.count + 1;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_api_logs_usage_counters
+    AFTER INSERT ON api_logs
+    FOR EACH ROW
+    WHEN (NEW.event_type = 'parse_success')
+    EXECUTE FUNCTION bump_usage_counters();
+
+-- ============================================
+-- RPC: current day + month usage in one round trip
+-- ============================================
+CREATE OR REPLACE FUNCTION get_usage(p_user_id UUID)
+RETURNS TABLE (daily_used INT, monthly_used INT) AS $$
+    SELECT
+        COALESCE(MAX(count) FILTER (
+            WHERE period_type = 'day'
+              AND period_start = (NOW() AT TIME ZONE 'UTC')::DATE
+        ), 0)::INT,
+        COALESCE(MAX(count) FILTER (
+            WHERE period_type = 'month'
+              AND period_start = DATE_TRUNC('month', NOW() AT TIME ZONE 'UTC')::DATE
+        ), 0)::INT
+    FROM usage_counters
+    WHERE user_id = p_user_id
+      AND period_start >= DATE_TRUNC('month', NOW() AT TIME ZONE 'UTC')::DATE;
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- Backfill from existing api_logs
+-- ============================================
+INSERT INTO usage_counters (user_id, period_type, period_start, count)
+SELECT user_id, 'day', (created_at AT TIME ZONE 'UTC')::DATE, COUNT(*)
+FROM api_logs
+WHERE event_type = 'parse_success' AND user_id IS NOT NULL
+GROUP BY 1, 3
+ON CONFLICT (user_id, period_type, period_start)
+DO UPDATE SET count = EXCLUDED.count;
+
+INSERT INTO usage_counters (user_id, period_type, period_start, count)
+SELECT user_id, 'month', DATE_TRUNC('month', created_at AT TIME ZONE 'UTC')::DATE, COUNT(*)
+FROM api_logs
+WHERE event_type = 'parse_success' AND user_id IS NOT NULL
+GROUP BY 1, 3
+ON CONFLICT (user_id, period_type, period_start)
+DO UPDATE SET count = EXCLUDED.count;
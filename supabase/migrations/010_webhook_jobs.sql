@@ -0,0 +1,67 @@
+-- Durable work queue for webhook events (queue mode).
+-- The webhook persists events here and acks immediately; api/worker.py
+-- claims jobs with FOR UPDATE SKIP LOCKED and runs the pipeline.
+CREATE TABLE webhook_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    webhook_event_id TEXT NOT NULL UNIQUE,  -- LINE redeliveries collapse here
+    line_user_id TEXT,
+    event JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    -- 'queued'  → waiting to run (after run_after)
+    -- 'running' → claimed by a worker (reclaimed if locked_at is stale)
+    -- 'done'    → processed
+    -- 'dead'    → gave up after max_attempts
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_at TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_webhook_jobs_runnable ON webhook_jobs(status, run_after)
+    WHERE status IN ('queued', 'running');
+CREATE INDEX idx_webhook_jobs_user_status ON webhook_jobs(line_user_id, status);
+
+-- RLS: service role has full access (same pattern as other tables)
+ALTER TABLE webhook_jobs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on webhook_jobs"
+    ON webhook_jobs FOR ALL
+    USING (TRUE)
+    WITH CHECK (TRUE);
+
+-- ============================================
+-- RPC: claim up to p_limit runnable jobs
+-- ============================================
+-- Skips jobs locked by other workers, reclaims jobs whose worker died
+-- (locked longer than p_lock_timeout_s), and never claims a job while an
+-- earlier job of the same LINE user is still running, so a user's events
+-- stay ordered.
+CREATE OR REPLACE FUNCTION claim_webhook_jobs(p_limit INT, p_lock_timeout_s INT DEFAULT 120)
+RETURNS SETOF webhook_jobs AS $$
+    UPDATE webhook_jobs
+    SET status = 'running',
+        attempts = attempts + 1,
+        locked_at = NOW(),
+        updated_at = NOW()
+    WHERE id IN (
+        SELECT j.id
+        FROM webhook_jobs j
+        WHERE (
+            (j.status = 'queued' AND j.run_after <= NOW())
+            OR (j.status = 'running' AND j.locked_at < NOW() - make_interval(secs => p_lock_timeout_s))
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM webhook_jobs r
+            WHERE r.line_user_id = j.line_user_id
+              AND r.id < j.id
+              AND r.status IN ('queued', 'running')
+        )
+        ORDER BY j.id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING *;
+$$ LANGUAGE sql;
@@ -0,0 +1,17 @@
+-- Shared dedup store for LINE webhook events (DEDUP_BACKEND=postgres).
+-- The primary key rejects redeliveries across instances and cold starts;
+-- rows older than the dedup window are deleted by the webhook.
+CREATE TABLE webhook_events (
+    webhook_event_id TEXT PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_webhook_events_created ON webhook_events(created_at);
+
+-- RLS: service role has full access (same pattern as other tables)
+ALTER TABLE webhook_events ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on webhook_events"
+    ON webhook_events FOR ALL
+    USING (TRUE)
+    WITH CHECK (TRUE);
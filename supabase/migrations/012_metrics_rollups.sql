@@ -0,0 +1,23 @@
+-- Per-instance metric rollups (METRICS_ROLLUP=1).
+-- Each serverless instance periodically writes the counter and histogram
+-- changes since its previous row; summing rows over a time range gives
+-- fleet-wide totals. metrics: {metric: {"label=value,...": delta}}, with
+-- histogram series "count", "sum" and "le=<bucket upper bound>".
+CREATE TABLE metrics_rollups (
+    id BIGSERIAL PRIMARY KEY,
+    instance_id TEXT NOT NULL,
+    window_start TIMESTAMPTZ NOT NULL,
+    window_end TIMESTAMPTZ NOT NULL,
+    metrics JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_metrics_rollups_window_end ON metrics_rollups(window_end);
+
+-- RLS: service role has full access (same pattern as other tables)
+ALTER TABLE metrics_rollups ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on metrics_rollups"
+    ON metrics_rollups FOR ALL
+    USING (TRUE)
+    WITH CHECK (TRUE);
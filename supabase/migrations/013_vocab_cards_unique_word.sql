@@ -0,0 +1,32 @@
+-- One card per user and word: re-screenshotting a lesson must not pile up
+-- duplicate vocab_cards. Words are compared normalized (whitespace
+-- collapsed, lower-cased) through the generated word_key column; inserts
+-- upsert on (user_id, word_key, target_lang) and skip existing words.
+
+-- Language codes are written lower-cased by the app; make old rows match
+UPDATE vocab_cards
+SET target_lang = lower(btrim(coalesce(target_lang, 'en')))
+WHERE target_lang IS DISTINCT FROM lower(btrim(coalesce(target_lang, 'en')));
+
+ALTER TABLE vocab_cards
+  ALTER COLUMN target_lang SET NOT NULL;
+
+ALTER TABLE vocab_cards
+  ADD COLUMN word_key TEXT GENERATED ALWAYS AS (
+    lower(btrim(regexp_replace(word, '\s+', ' ', 'g')))
+  ) STORED;
+
+-- Drop existing duplicates, keeping the card with the most review progress
+-- (then the oldest one)
+DELETE FROM vocab_cards v
+USING (
+  SELECT id, ROW_NUMBER() OVER (
+    PARTITION BY user_id, word_key, target_lang
+    ORDER BY review_status DESC, created_at ASC
+  ) AS rn
+  FROM vocab_cards
+) d
+WHERE v.id = d.id AND d.rn > 1;
+
+ALTER TABLE vocab_cards
+  ADD CONSTRAINT vocab_cards_user_word_key UNIQUE (user_id, word_key, target_lang);
@@ -0,0 +1,13 @@
+-- word_key becomes a plain column written by the app (api/_lib/supabase_client.py
+-- word_key(), web/lib/server/supabase-server.ts normalizeWord()).
+-- The generated expression from 013 used Postgres' locale-dependent '\s' and
+-- lower(), which could disagree with the app's normalization: the app's
+-- known-word lookup then missed, and the upsert silently skipped the word.
+-- Now the key the app computes is exactly the key that is stored and
+-- compared. Existing rows keep the values 013 computed.
+ALTER TABLE vocab_cards
+  ALTER COLUMN word_key DROP EXPRESSION;
+
+-- Writers must supply the key; a NULL would escape the unique constraint
+ALTER TABLE vocab_cards
+  ALTER COLUMN word_key SET NOT NULL;
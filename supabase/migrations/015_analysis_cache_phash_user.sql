@@ -0,0 +1,14 @@
+-- Perceptual-hash matches in analysis_cache are limited to the screenshots
+-- of the user who stored them: a dHash can't tell apart screenshots that
+-- differ only in their text, so a collision must never serve one user's
+-- words to another. Exact image_hash matches stay shared.
+
+ALTER TABLE analysis_cache
+  ADD COLUMN user_id UUID REFERENCES users(id) ON DELETE CASCADE;
+
+-- Existing perceptual hashes have no owner; keep their exact-hash entries
+UPDATE analysis_cache SET phash = NULL WHERE phash IS NOT NULL;
+
+DROP INDEX IF EXISTS idx_analysis_cache_phash;
+CREATE INDEX idx_analysis_cache_user_phash ON analysis_cache(user_id, phash)
+  WHERE phash IS NOT NULL;
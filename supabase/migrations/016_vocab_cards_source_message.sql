@@ -0,0 +1,10 @@
+-- The LINE message a card was created from. A queued screenshot job that
+-- is retried after its card push failed finds its own cards among the
+-- user's existing words; this lets it send them again instead of telling
+-- the user they were already in the vocab book.
+
+ALTER TABLE vocab_cards
+  ADD COLUMN source_message_id TEXT;
+
+CREATE INDEX idx_vocab_cards_source_message ON vocab_cards(user_id, source_message_id)
+  WHERE source_message_id IS NOT NULL;
@@ -0,0 +1,101 @@
+"""Tests for the screenshot analysis cache."""
+
+import io
+from unittest.mock import patch
+
+import pytest
+
+from api._lib import analysis_cache
+from api._lib.models import GeminiParseResult, ParsedWord
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    analysis_cache.clear_local()
+    yield
+    analysis_cache.clear_local()
+
+
+def _result() -> GeminiParseResult:
+    return GeminiParseResult(source_app="Duolingo", words=[ParsedWord(word="gato")])
+
+
+def test_store_then_lookup_hits_local_tier():
+    key = analysis_cache.cache_key(b"image-bytes")
+    with patch.object(analysis_cache, "save_cached_analysis") as mock_save, \
+            patch.object(analysis_cache, "get_cached_analysis") as mock_get:
+        analysis_cache.store(key, _result(), 1200)
+        hit = analysis_cache.lookup(key)
+    assert hit.tier == "local"
+    assert hit.token_count == 1200
+    assert hit.result.words[0].word == "gato"
+    mock_save.assert_called_once()
+    mock_get.assert_not_called()
+
+
+def test_lookup_falls_back_to_db_and_warms_local():
+    key = analysis_cache.cache_key(b"other-bytes")
+    row = {"image_hash": key.image_hash, "result": _result().model_dump(), "token_count": 900}
+    with patch.object(analysis_cache, "get_cached_analysis", return_value=row) as mock_get:
+        first = analysis_cache.lookup(key)
+        second = analysis_cache.lookup(key)
+    assert first.tier == "db"
+    assert second.tier == "local"
+    assert mock_get.call_count == 1
+
+
+def test_miss_and_db_error_return_none():
+    key = analysis_cache.cache_key(b"missing")
+    with patch.object(analysis_cache, "get_cached_analysis", return_value=None):
+        assert analysis_cache.lookup(key) is None
+    with patch.object(analysis_cache, "get_cached_analysis", side_effect=RuntimeError("db down")):
+        assert analysis_cache.lookup(key) is None
+
+
+def test_empty_results_are_not_cached():
+    key = analysis_cache.cache_key(b"blank")
+    with patch.object(analysis_cache, "save_cached_analysis") as mock_save:
+        analysis_cache.store(key, GeminiParseResult(words=[]), 100)
+    mock_save.assert_not_called()
+
+
+def test_perceptual_hash_survives_reencoding():
+    Image = pytest.importorskip("PIL.Image")
+    img = Image.new("RGB", (320, 640), "white")
+    for y in range(0, 640, 80):
+        img.paste((30, 30, 30), (20, y, 300, y + 30))
+
+    png, jpeg = io.BytesIO(), io.BytesIO()
+    img.save(png, format="PNG")
+    img.save(jpeg, format="JPEG", quality=70)
+
+    assert analysis_cache.perceptual_hash(png.getvalue()) == analysis_cache.perceptual_hash(jpeg.getvalue())
+    assert analysis_cache.perceptual_hash(b"not an image") is None
+
+
+def test_perceptual_matches_are_limited_to_the_same_user():
+    with patch.object(analysis_cache.config, "ANALYSIS_CACHE_PHASH", True), \
+            patch.object(analysis_cache, "perceptual_hash", return_value="ab" * 32), \
+            patch.object(analysis_cache, "save_cached_analysis"):
+        analysis_cache.store(analysis_cache.cache_key(b"png", "u1"), _result(), 100)
+        own = analysis_cache.cache_key(b"jpeg", "u1")
+        other = analysis_cache.cache_key(b"jpeg", "u2")
+        with patch.object(analysis_cache, "get_cached_analysis", return_value=None) as mock_get:
+            assert analysis_cache.lookup(own).tier == "local"
+            assert analysis_cache.lookup(other) is None
+        assert analysis_cache.cache_key(b"jpeg").phash is None  # no user: exact hash only
+    mock_get.assert_called_once_with(other.image_hash, "ab" * 32, "u2")
+
+
+def test_perceptual_db_hit_is_not_shared_under_the_exact_hash():
+    with patch.object(analysis_cache.config, "ANALYSIS_CACHE_PHASH", True), \
+            patch.object(analysis_cache, "perceptual_hash", return_value="ab" * 32):
+        own = analysis_cache.cache_key(b"jpeg", "u1")
+        other = analysis_cache.cache_key(b"jpeg", "u2")
+    row = {"image_hash": "png-hash", "result": _result().model_dump(), "token_count": 100}
+    with patch.object(analysis_cache, "get_cached_analysis", return_value=row):
+        assert analysis_cache.lookup(own).tier == "db"
+    with patch.object(analysis_cache, "get_cached_analysis", return_value=None) as mock_get:
+        assert analysis_cache.lookup(own).tier == "local"
+        assert analysis_cache.lookup(other) is None
+    mock_get.assert_called_once()
@@ -0,0 +1,124 @@
+"""Tests for keyed concurrent event dispatch and micro-batching."""
+
+import asyncio
+
+from api._lib import tracing
+from api._lib.concurrency import MicroBatcher, run_keyed
+
+
+def test_same_key_runs_in_order():
+    order: list[str] = []
+
+    async def handler(item: tuple[str, int, float]) -> None:
+        user, seq, delay = item
+        await asyncio.sleep(delay)
+        order.append(f"{user}{seq}")
+
+    items = [("a", 1, 0.03), ("b", 1, 0.0), ("a", 2, 0.0), ("b", 2, 0.01)]
+    asyncio.run(run_keyed(items, lambda i: i[0], handler, limit=4))
+    assert order.index("a1") < order.index("a2")
+    assert order.index("b1") < order.index("b2")
+    assert order.index("b2") < order.index("a1")  # b did not wait for a
+
+
+def test_limit_bounds_in_flight():
+    in_flight = 0
+    peak = 0
+
+    async def handler(item: int) -> None:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    asyncio.run(run_keyed(range(10), lambda i: i, handler, limit=3))
+    assert peak == 3
+
+
+def test_failure_is_isolated():
+    done: list[int] = []
+
+    async def handler(item: int) -> None:
+        if item == 1:
+            raise RuntimeError("boom")
+        done.append(item)
+
+    asyncio.run(run_keyed([1, 2, 3], lambda i: "same", handler, limit=2))
+    assert done == [2, 3]
+
+
+def _recording_batcher(window: float = 5.0, max_size: int = 5):
+    batches: list[list[int]] = []
+
+    async def run_batch(items: list[int]) -> list:
+        batches.append(items)
+        return [ValueError(i) if i < 0 else i * 10 for i in items]
+
+    return MicroBatcher(run_batch, window=window, max_size=max_size), batches
+
+
+def test_batcher_dispatches_when_expected_count_arrives():
+    batcher, batches = _recording_batcher()
+
+    async def _run():
+        return await asyncio.gather(*(batcher.submit("u", i, expected=3) for i in (1, 2, 3)))
+
+    assert asyncio.run(_run()) == [10, 20, 30]
+    assert batches == [[1, 2, 3]]
+
+
+def test_batcher_single_item_is_immediate_and_keys_are_separate():
+    batcher, batches = _recording_batcher()
+
+    async def _run():
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.submit("a", 1), batcher.submit("b", 2)), timeout=1
+        )
+
+    assert asyncio.run(_run()) == [10, 20]
+    assert batches == [[1], [2]]
+
+
+def test_batcher_window_flushes_partial_batch():
+    batcher, batches = _recording_batcher(window=0.02, max_size=3)
+
+    async def _run():
+        return await asyncio.gather(*(batcher.submit("u", i, expected=4) for i in (1, 2, 3, 4)))
+
+    assert asyncio.run(_run()) == [10, 20, 30, 40]
+    assert batches == [[1, 2, 3], [4]]  # capped at max_size, rest after the window
+
+
+def test_batcher_item_exception_only_hits_its_submitter():
+    batcher, _ = _recording_batcher()
+
+    async def _run():
+        return await asyncio.gather(
+            batcher.submit("u", -1, expected=2),
+            batcher.submit("u", 2, expected=2),
+            return_exceptions=True,
+        )
+
+    bad, good = asyncio.run(_run())
+    assert isinstance(bad, ValueError)
+    assert good == 20
+
+
+def test_batch_spans_are_not_charged_to_the_dispatching_request():
+    async def run_batch(items):
+        with tracing.span("gemini.batch"):
+            return items
+
+    batcher = MicroBatcher(run_batch, window=1.0, max_size=2)
+
+    async def request(item):
+        with tracing.start_trace("screenshot") as trace:
+            await batcher.submit("u", item, expected=2)
+        return trace
+
+    async def _run():
+        return await asyncio.gather(request(1), request(2))
+
+    traces = asyncio.run(_run())
+    assert all(not trace.spans for trace in traces)
@@ -0,0 +1,46 @@
+"""Tests for webhook event dedup backends."""
+
+import asyncio
+from unittest.mock import patch
+
+from api._lib import dedup
+
+
+def test_memory_store_marks_and_detects():
+    store = dedup.MemoryDedupStore()
+    assert asyncio.run(store.duplicates(["evt-1"])) == set()
+    assert asyncio.run(store.duplicates(["evt-1", "evt-2"])) == {"evt-1"}
+
+
+def test_postgres_store_checks_a_delivery_in_one_insert():
+    store = dedup.PostgresDedupStore()
+    with patch.object(dedup, "record_webhook_events", return_value={"evt-2"}) as mock_record, \
+            patch.object(dedup, "delete_webhook_events_before") as mock_cleanup:
+        # evt-1 was seen by another instance: the insert skipped it
+        assert asyncio.run(store.duplicates(["evt-1", "evt-2"])) == {"evt-1"}
+        # Seen locally: no database round trip
+        assert asyncio.run(store.duplicates(["evt-1", "evt-2"])) == {"evt-1", "evt-2"}
+    mock_record.assert_called_once_with(["evt-1", "evt-2"])
+    mock_cleanup.assert_not_called()  # only the worker sweeps
+
+
+def test_postgres_cleanup_is_rate_limited():
+    store = dedup.PostgresDedupStore()
+    with patch.object(dedup, "delete_webhook_events_before") as mock_cleanup:
+        asyncio.run(store.cleanup())
+        asyncio.run(store.cleanup())
+    mock_cleanup.assert_called_once()
+
+
+def test_postgres_store_falls_back_when_db_fails():
+    store = dedup.PostgresDedupStore()
+    with patch.object(dedup, "record_webhook_events", side_effect=RuntimeError("db down")):
+        assert asyncio.run(store.duplicates(["evt-9"])) == set()
+        assert asyncio.run(store.duplicates(["evt-9"])) == {"evt-9"}
+
+
+def test_backend_selection():
+    with patch.object(dedup.config, "DEDUP_BACKEND", "postgres"):
+        assert isinstance(dedup.get_dedup_store(), dedup.PostgresDedupStore)
+    with patch.object(dedup.config, "DEDUP_BACKEND", "memory"):
+        assert isinstance(dedup.get_dedup_store(), dedup.MemoryDedupStore)
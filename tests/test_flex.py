@@ -52,3 +52,10 @@ def test_card_without_optional_fields():
     card = build_vocab_card(word, "card-456")
     assert card["type"] == "bubble"
     assert card["header"]["contents"][0]["text"] == "📖 hola"
+
+
+def test_tags_deduplicated_against_source_app():
+    word = ParsedWord(word="hola", tags=["Duolingo", "Noun", "Food"])
+    card = build_vocab_card(word, "card-1", "Duolingo")
+    tags = [box["contents"][0]["text"] for box in card["body"]["contents"][-1]["contents"]]
+    assert tags == ["🏷 Duolingo", "🏷 Noun"]
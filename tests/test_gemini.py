@@ -1,6 +1,22 @@
 """Tests for Gemini response parsing logic."""
 
-from api._lib.gemini_client import _parse_response
+import asyncio
+import json
+import os
+import random
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+
+from api._lib import gemini_client, resilience, tracing
+from api._lib.gemini_client import (
+    ScreenshotStream,
+    _parse_response,
+    analyze_screenshot_async,
+    analyze_screenshots_batch_async,
+)
 from api._lib.models import GeminiParseResult
 
 
@@ -46,3 +62,242 @@ def test_parse_multiple_words():
     result = _parse_response(raw)
     assert len(result.words) == 3
     assert result.words[2].word == "casa"
+
+
+def _fake_response(text: str) -> SimpleNamespace:
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=42))
+
+
+def test_get_client_is_cached():
+    gemini_client._client = None
+    with patch.object(gemini_client.genai, "Client") as mock_client:
+        first = gemini_client._get_client()
+        second = gemini_client._get_client()
+    gemini_client._client = None
+    assert first is second
+    assert mock_client.call_count == 1
+
+
+def test_analyze_screenshot_async_uses_aio():
+    client = MagicMock()
+    client.aio.models.generate_content = AsyncMock(
+        return_value=_fake_response('{"words": [{"word": "hola"}]}')
+    )
+    with patch.object(gemini_client, "_get_client", return_value=client):
+        result, metadata = asyncio.run(analyze_screenshot_async(b"img", "image/gif"))
+    assert result.words[0].word == "hola"
+    assert metadata["token_count"] == 42
+    part = client.aio.models.generate_content.call_args.kwargs["contents"][0]
+    assert part.inline_data.mime_type == "image/jpeg"  # unsupported type falls back
+    client.models.generate_content.assert_not_called()
+
+
+def test_analyze_screenshot_async_timeout_cancels_request():
+    cancelled = asyncio.Event()
+
+    async def _slow(**kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    client = MagicMock()
+    client.aio.models.generate_content = _slow
+
+    async def _run():
+        try:
+            await asyncio.wait_for(analyze_screenshot_async(b"img"), timeout=0.01)
+        except asyncio.TimeoutError:
+            pass
+        return cancelled.is_set()
+
+    with patch.object(gemini_client, "_get_client", return_value=client):
+        assert asyncio.run(_run()) is True
+
+
+def test_batch_maps_results_by_index():
+    text = json.dumps({"results": [
+        {"image_index": 1, "source_app": "Netflix", "words": [{"word": "b"}]},
+        {"image_index": 0, "words": [{"word": "a"}, {"nope": 1}]},
+    ]})
+    client = MagicMock()
+    client.aio.models.generate_content = AsyncMock(return_value=_fake_response(text))
+    images = [(b"0", "image/png"), (b"1", "image/webp"), (b"2", "image/png")]
+    with patch.object(gemini_client, "_get_client", return_value=client):
+        results = asyncio.run(analyze_screenshots_batch_async(images))
+
+    assert [w.word for w in results[0][0].words] == ["a"]
+    assert results[1][0].source_app == "Netflix"
+    assert results[2] is None  # missing from the response
+    assert results[0][1]["token_count"] == 14
+    assert results[0][1]["batch_size"] == 3
+    contents = client.aio.models.generate_content.call_args.kwargs["contents"]
+    assert contents[0] == "Image 0:" and "3 screenshots" in contents[-1]
+    assert client.aio.models.generate_content.await_count == 1
+
+
+def test_batch_garbage_returns_all_none():
+    client = MagicMock()
+    client.aio.models.generate_content = AsyncMock(return_value=_fake_response("not json"))
+    with patch.object(gemini_client, "_get_client", return_value=client):
+        results = asyncio.run(analyze_screenshots_batch_async([(b"0", "image/png")] * 2))
+    assert results == [None, None]
+
+
+def test_batch_salvages_complete_results_from_truncated_response():
+    text = json.dumps({"results": [
+        {"image_index": 0, "words": [{"word": "a"}]},
+        {"image_index": 1, "words": [{"word": "b"}]},
+    ]})[:-30]
+    client = MagicMock()
+    client.aio.models.generate_content = AsyncMock(return_value=_fake_response(text))
+    with patch.object(gemini_client, "_get_client", return_value=client):
+        results = asyncio.run(analyze_screenshots_batch_async([(b"0", "image/png")] * 2))
+    assert [w.word for w in results[0][0].words] == ["a"]
+    assert results[1] is None
+
+
+def test_large_batch_is_split_to_keep_each_image_budget():
+    def respond(**kwargs):
+        count = sum(1 for part in kwargs["contents"] if isinstance(part, str) and part.startswith("Image "))
+        items = [{"image_index": i, "words": [{"word": f"w{i}"}]} for i in range(count)]
+        return _fake_response(json.dumps({"results": items}))
+
+    client = MagicMock()
+    client.aio.models.generate_content = AsyncMock(side_effect=respond)
+    with patch.object(gemini_client, "_get_client", return_value=client):
+        results = asyncio.run(analyze_screenshots_batch_async([(b"0", "image/png")] * 6))
+
+    assert client.aio.models.generate_content.await_count == 2
+    assert [r[0].words[0].word for r in results] == ["w0", "w1", "w2", "w3", "w0", "w1"]
+    for call in client.aio.models.generate_content.call_args_list:
+        assert call.kwargs["config"].max_output_tokens <= gemini_client.BATCH_MAX_OUTPUT_TOKENS
+
+
+def test_prompt_is_sent_inline_and_usage_split_is_reported():
+    usage = SimpleNamespace(
+        total_token_count=1500, prompt_token_count=1200, cached_content_token_count=1000
+    )
+    client = MagicMock()
+    client.aio.models.generate_content = AsyncMock(
+        return_value=SimpleNamespace(text='{"words": []}', usage_metadata=usage)
+    )
+    with patch.object(gemini_client, "_get_client", return_value=client):
+        _, metadata = asyncio.run(analyze_screenshot_async(b"img"))
+    config = client.aio.models.generate_content.call_args.kwargs["config"]
+    assert config.system_instruction == gemini_client.SYSTEM_PROMPT
+    assert (metadata["cached_tokens"], metadata["uncached_tokens"]) == (1000, 200)
+
+
+def _fake_stream(chunks: list[str]):
+    async def _gen():
+        for i, text in enumerate(chunks):
+            usage = SimpleNamespace(total_token_count=99) if i == len(chunks) - 1 else None
+            yield SimpleNamespace(text=text, usage_metadata=usage)
+
+    client = MagicMock()
+    client.aio.models.generate_content_stream = AsyncMock(return_value=_gen())
+    return client
+
+
+def test_screenshot_stream_yields_words_incrementally():
+    chunks = ['{"source_app": "Netflix", "words": [{"word": "a"}, ', '{"word": "b"}', "]}"]
+    seen: list[tuple[str, int]] = []
+
+    async def _run():
+        stream = ScreenshotStream(b"img")
+        async for word in stream:
+            seen.append((word.word, stream.parser.words_seen))
+        return stream
+
+    with patch.object(gemini_client, "_get_client", return_value=_fake_stream(chunks)):
+        stream = asyncio.run(_run())
+    assert seen == [("a", 1), ("b", 2)]
+    assert stream.result.source_app == "Netflix"
+    assert stream.metadata["token_count"] == 99
+
+
+def test_failing_streams_open_the_gemini_breaker():
+    async def _broken():
+        raise httpx.ConnectError("reset mid-stream")
+        yield  # pragma: no cover
+
+    client = MagicMock()
+    client.aio.models.generate_content_stream = AsyncMock(side_effect=lambda **kw: _broken())
+    dependency = resilience.Dependency("gemini", initial_limit=2, max_limit=4, slow_after=30.0)
+
+    async def _consume():
+        async for _ in ScreenshotStream(b"img"):
+            pass
+
+    with patch.object(gemini_client, "_get_client", return_value=client), \
+            patch.object(resilience, "gemini", dependency):
+        for _ in range(resilience.FAILURE_THRESHOLD):
+            with pytest.raises(httpx.ConnectError):
+                asyncio.run(_consume())
+        assert dependency.breaker.state == "open"
+        with pytest.raises(resilience.DependencyUnavailable):
+            asyncio.run(_consume())
+
+
+def test_stream_span_covers_the_iteration():
+    chunks = ['{"words": [{"word": "a"}]}']
+
+    async def _run():
+        with tracing.start_trace("screenshot") as trace:
+            async for _ in ScreenshotStream(b"img"):
+                with tracing.span("deliver"):
+                    pass
+        return trace
+
+    with patch.object(gemini_client, "_get_client", return_value=_fake_stream(chunks)):
+        trace = asyncio.run(_run())
+    spans = {s.name: s for s in trace.spans}
+    assert spans["gemini.generate"].attributes["streamed"] is True
+    # The consumer's own work between words isn't nested under the stream
+    assert spans["deliver"].parent_id == trace.root_id
+
+
+def test_screenshot_stream_falls_back_to_full_parse():
+    chunks = ['{"source_app": "General", "target_lang": "en", "words": []}']
+
+    async def _run():
+        stream = ScreenshotStream(b"img")
+        return [w async for w in stream], stream
+
+    with patch.object(gemini_client, "_get_client", return_value=_fake_stream(chunks)):
+        words, stream = asyncio.run(_run())
+    assert words == []
+    assert stream.result.words == []
+
+
+def _malformed_corpus() -> list[dict]:
+    path = os.path.join(os.path.dirname(__file__), "fixtures", "gemini_malformed.json")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("case", _malformed_corpus(), ids=lambda c: c["name"])
+def test_parse_malformed_corpus(case):
+    result = _parse_response(case["raw"])
+    assert [w.word for w in result.words] == case["expected_words"]
+
+
+def test_parse_truncated_keeps_header():
+    raw = '{"source_app": "Netflix", "target_lang": "ja", "words": [{"word": "桜"}, {"word": "花'
+    result = _parse_response(raw)
+    assert result.source_app == "Netflix"
+    assert result.target_lang == "ja"
+    assert [w.word for w in result.words] == ["桜"]
+
+
+def test_parse_fuzz_truncation_salvages_prefix():
+    """Any truncation yields (a prefix of) the words of the full output."""
+    rng = random.Random(1234)
+    for case in _malformed_corpus():
+        raw, expected = case["raw"], case["expected_words"]
+        for _ in range(50):
+            cut = rng.randint(0, len(raw))
+            words = [w.word for w in _parse_response(raw[:cut]).words]
+            assert words == expected[:len(words)], (case["name"], cut)
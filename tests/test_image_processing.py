@@ -0,0 +1,70 @@
+"""Tests for screenshot preprocessing."""
+
+import io
+
+import pytest
+
+from api._lib.image_processing import (
+    MAX_PIXELS,
+    MIN_SHORT_EDGE,
+    detect_mime_type,
+    prepare_screenshot,
+)
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _png(width: int, height: int, bars: bool = False) -> bytes:
+    img = Image.new("RGB", (width, height), "white")
+    for y in range(0, height, 60):
+        img.paste((20, 120, 40), (30, y, width - 30, y + 20))
+    if bars:
+        # Flat status and navigation bars with a few small icons
+        status, nav = int(height * 0.04), int(height * 0.03)
+        img.paste((240, 240, 240), (0, 0, width, status))
+        img.paste((240, 240, 240), (0, height - nav, width, height))
+        img.paste((0, 0, 0), (40, status // 3, 120, 2 * status // 3))
+        img.paste((0, 0, 0), (width // 2 - 20, height - 2 * nav // 3, width // 2 + 20, height - nav // 3))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_detect_mime_type():
+    assert detect_mime_type(b"\xff\xd8\xff\xe0rest") == "image/jpeg"
+    assert detect_mime_type(b"\x89PNG\r\n\x1a\nrest") == "image/png"
+    assert detect_mime_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert detect_mime_type(b"unknown") == "image/jpeg"
+
+
+def test_large_phone_screenshot_is_shrunk():
+    raw = _png(1170, 2532, bars=True)
+    prepared = prepare_screenshot(raw)
+    assert prepared.original_size == len(raw)
+    assert len(prepared.data) < len(raw)
+    with Image.open(io.BytesIO(prepared.data)) as img:
+        assert img.size[0] * img.size[1] <= MAX_PIXELS * 1.01
+        assert img.format.lower() in prepared.mime_type
+        # Status/nav bar cropped: aspect ratio shrinks slightly
+        assert img.size[1] / img.size[0] < 2532 / 1170 * 0.95
+        assert (prepared.width, prepared.height) == img.size
+
+
+def test_screenshot_without_bars_keeps_its_edges():
+    prepared = prepare_screenshot(_png(1170, 2532))
+    assert prepared.height / prepared.width == pytest.approx(2532 / 1170, rel=0.01)
+
+
+def test_tall_scroll_capture_stays_legible():
+    prepared = prepare_screenshot(_png(1080, 10000))
+    assert prepared.width >= MIN_SHORT_EDGE
+    # Not cropped: a scroll capture has no system bars at its ends
+    assert prepared.height / prepared.width == pytest.approx(10000 / 1080, rel=0.01)
+
+
+def test_undecodable_bytes_pass_through():
+    raw = b"\x89PNG\r\n\x1a\ncorrupt"
+    prepared = prepare_screenshot(raw)
+    assert prepared.data == raw
+    assert prepared.mime_type == "image/png"
+    assert prepared.width == prepared.height == 0
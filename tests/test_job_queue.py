@@ -0,0 +1,82 @@
+"""Tests for the queue-mode retry policy and worker."""
+
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+
+from api._lib import job_queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import worker  # noqa: E402
+
+
+def test_backoff_grows_and_is_capped():
+    assert 2.5 <= job_queue.backoff_seconds(1) <= 5
+    assert 5 <= job_queue.backoff_seconds(2) <= 10
+    assert job_queue.backoff_seconds(20) <= job_queue.MAX_BACKOFF_S
+
+
+def test_failed_job_is_requeued_then_dead_lettered():
+    with patch.object(job_queue, "update_webhook_job") as mock_update:
+        status = job_queue.mark_failed({"id": 1, "attempts": 1, "max_attempts": 3}, "boom")
+        assert status == "queued"
+        fields = mock_update.call_args.args[1]
+        assert fields["status"] == "queued" and "run_after" in fields
+
+        status = job_queue.mark_failed({"id": 1, "attempts": 3, "max_attempts": 3}, "boom")
+        assert status == "dead"
+        assert mock_update.call_args.args[1]["status"] == "dead"
+
+
+def test_worker_runs_claimed_jobs():
+    jobs = [
+        {"id": 1, "line_user_id": "U1", "event": {"type": "follow"}},
+        {"id": 2, "line_user_id": "U2", "event": {"type": "boom"}},
+    ]
+
+    async def handle(event, raise_errors=False):
+        if event["type"] == "boom":
+            raise RuntimeError("handler crashed")
+
+    with patch.object(worker, "claim_webhook_jobs", return_value=jobs), \
+            patch.object(worker, "_handle_event", AsyncMock(side_effect=handle)), \
+            patch.object(worker.job_queue, "mark_done") as mock_done, \
+            patch.object(worker.job_queue, "mark_failed", return_value="queued") as mock_failed, \
+            patch.object(worker.log_buffer.buffer, "_writer", MagicMock()):
+        counts = asyncio.run(worker.run_batch())
+
+    assert counts == {"claimed": 2, "done": 1, "queued": 1, "dead": 0}
+    assert mock_done.call_args.args[0]["id"] == 1
+    assert mock_failed.call_args.args[0]["id"] == 2
+
+
+def test_drain_stops_claiming_near_the_deadline():
+    batch = AsyncMock(return_value={"claimed": 1, "done": 1, "queued": 0, "dead": 0})
+    with patch.object(worker, "run_batch", batch):
+        counts = asyncio.run(worker.drain(budget=worker.JOB_TIMEOUT - 1))
+    batch.assert_not_awaited()
+    assert counts["claimed"] == 0
+
+
+def test_worker_trigger_requires_the_cron_secret():
+    async def get(headers=None):
+        transport = httpx.ASGITransport(app=worker.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/worker/run", headers=headers)
+
+    counts = {"claimed": 0, "done": 0, "queued": 0, "dead": 0}
+    with patch.object(worker, "drain", AsyncMock(return_value=counts)) as mock_drain, \
+            patch.object(worker._dedup, "cleanup", AsyncMock()):
+        with patch.object(worker.config, "CRON_SECRET", ""):
+            assert asyncio.run(get({"Authorization": "Bearer "})).status_code == 404
+        with patch.object(worker.config, "CRON_SECRET", "s3cret"):
+            assert asyncio.run(get()).status_code == 401
+            assert asyncio.run(get({"Authorization": "Bearer wrong"})).status_code == 401
+            mock_drain.assert_not_awaited()
+            resp = asyncio.run(get({"Authorization": "Bearer s3cret"}))
+    assert resp.status_code == 200
+    assert resp.json() == counts
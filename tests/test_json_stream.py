@@ -0,0 +1,47 @@
+"""Tests for the incremental vocabulary JSON parser."""
+
+from api._lib.json_stream import IncrementalWordParser
+
+RAW = (
+    '```json\n{"source_app": "Duolingo", "target_lang": "es", "source_lang": "zh-TW", '
+    '"words": [{"word": "ga}to", "tags": ["Noun", "Animal"]}, '
+    '{"word": "say \\"hi\\"", "translation": "說嗨"}, {"word": "casa"}]}\n```'
+)
+
+
+def _feed_in_chunks(parser: IncrementalWordParser, text: str, size: int) -> list[dict]:
+    found = []
+    for i in range(0, len(text), size):
+        found.extend(parser.feed(text[i:i + size]))
+    return found
+
+
+def test_words_yielded_as_objects_close():
+    parser = IncrementalWordParser()
+    cut = RAW.index('{"word": "casa"}')
+    first = parser.feed(RAW[:cut])
+    assert [w["word"] for w in first] == ["ga}to", 'say "hi"']
+    rest = parser.feed(RAW[cut:])
+    assert [w["word"] for w in rest] == ["casa"]
+    assert parser.complete
+
+
+def test_chunk_size_does_not_matter():
+    for size in (1, 3, 17, len(RAW)):
+        parser = IncrementalWordParser()
+        words = _feed_in_chunks(parser, RAW, size)
+        assert [w["word"] for w in words] == ["ga}to", 'say "hi"', "casa"]
+        assert parser.header == {"source_app": "Duolingo", "target_lang": "es", "source_lang": "zh-TW"}
+
+
+def test_truncated_output_keeps_complete_words():
+    parser = IncrementalWordParser()
+    words = parser.feed('{"words": [{"word": "uno"}, {"word": "dos", "translation": "二')
+    assert [w["word"] for w in words] == ["uno"]
+    assert not parser.complete
+
+
+def test_nested_arrays_outside_words_are_ignored():
+    parser = IncrementalWordParser()
+    words = parser.feed('{"notes": [{"word": "nope"}], "words": [{"word": "yes"}]}')
+    assert [w["word"] for w in words] == ["yes"]
@@ -0,0 +1,37 @@
+"""Tests for deferred SDK imports."""
+
+import json
+import os
+import subprocess
+import sys
+
+from api._lib.lazy_import import LazyModule
+
+API_DIR = os.path.join(os.path.dirname(__file__), "..", "api")
+
+
+def test_lazy_module_imports_on_first_attribute():
+    module = LazyModule("colorsys")
+    assert "not loaded" in repr(module)
+    assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert module.loaded and "colorsys" in sys.modules
+
+
+def test_importing_webhook_leaves_heavy_sdks_unloaded():
+    code = (
+        "import json, sys; import webhook; "
+        "print(json.dumps([m for m in ('google.genai', 'supabase') if m in sys.modules]))"
+    )
+    env = {
+        **os.environ,
+        "LINE_CHANNEL_SECRET": "test",
+        "LINE_CHANNEL_ACCESS_TOKEN": "test",
+        "SUPABASE_URL": "https://test.supabase.co",
+        "SUPABASE_SERVICE_KEY": "test",
+        "GEMINI_API_KEY": "test",
+    }
+    proc = subprocess.run(
+        [sys.executable, "-c", code], cwd=API_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    assert json.loads(proc.stdout) == []
@@ -0,0 +1,127 @@
+"""Tests for rate-limited LINE delivery, retries and multicast coalescing."""
+
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from api._lib import line_push
+from api._lib.line_push import PushDispatcher, TokenBucket
+
+MESSAGES = [{"type": "text", "text": "hi"}]
+
+
+class FakeLine:
+    """Records requests and answers with queued status codes (default 200)."""
+
+    def __init__(self, statuses: list = ()) -> None:
+        self.statuses = list(statuses)
+        self.calls: list[tuple[str, dict, dict]] = []
+        self.will_retry: list[bool] = []
+
+    async def __call__(self, endpoint, payload, headers, will_retry):
+        self.calls.append((endpoint, headers, payload))
+        self.will_retry.append(will_retry)
+        status = self.statuses.pop(0) if self.statuses else 200
+        if isinstance(status, Exception):
+            raise status
+        return httpx.Response(status, headers={"Retry-After": "0"} if status == 429 else {})
+
+
+@pytest.fixture(autouse=True)
+def no_backoff():
+    with patch.object(line_push, "BASE_BACKOFF_S", 0.0):
+        yield
+
+
+def test_retries_429_and_5xx_with_one_retry_key():
+    line = FakeLine([429, 503])
+    dispatcher = PushDispatcher(line)
+    asyncio.run(dispatcher.push("U1", MESSAGES))
+
+    assert len(line.calls) == 3
+    keys = {headers["X-Line-Retry-Key"] for _, headers, _ in line.calls}
+    assert len(keys) == 1
+    assert line.will_retry == [True, True, True]
+
+
+def test_conflict_on_retry_means_already_delivered():
+    line = FakeLine([500, 409])
+    dispatcher = PushDispatcher(line)
+    asyncio.run(dispatcher.push("U1", MESSAGES))
+    assert len(line.calls) == 2
+
+
+def test_client_error_is_not_retried_and_not_raised():
+    line = FakeLine([400])
+    dispatcher = PushDispatcher(line)
+    asyncio.run(dispatcher.push("U1", MESSAGES))
+    assert len(line.calls) == 1
+
+
+def test_transport_error_raised_after_max_attempts():
+    line = FakeLine([httpx.ConnectError("down")] * line_push.MAX_ATTEMPTS)
+    dispatcher = PushDispatcher(line)
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(dispatcher.push("U1", MESSAGES))
+    assert len(line.calls) == line_push.MAX_ATTEMPTS
+    # only the last attempt may count against the circuit breaker
+    assert line.will_retry == [True] * (line_push.MAX_ATTEMPTS - 1) + [False]
+
+
+def test_retries_stop_at_the_time_budget():
+    class SlowLine(FakeLine):
+        async def __call__(self, endpoint, payload, headers, will_retry):
+            clock[0] += 3.0
+            return await super().__call__(endpoint, payload, headers, will_retry)
+
+    clock = [0.0]
+    slept: list[float] = []
+
+    async def sleep(delay):
+        slept.append(delay)
+        clock[0] += delay
+
+    line = SlowLine([503] * line_push.MAX_ATTEMPTS)
+    with patch.object(line_push.time, "monotonic", lambda: clock[0]), \
+            patch.object(line_push.asyncio, "sleep", sleep), \
+            patch.object(line_push, "backoff_seconds", return_value=line_push.MAX_BACKOFF_S):
+        asyncio.run(PushDispatcher(line).push("U1", MESSAGES))
+
+    # 3 s attempt + 2 s clamped sleep exhausts the 5 s budget: one final try
+    assert slept == [line_push.RETRY_BUDGET_S - 3.0]
+    assert line.will_retry == [True, False]
+
+
+def test_identical_pushes_coalesce_into_multicast():
+    line = FakeLine()
+    dispatcher = PushDispatcher(line)
+
+    async def run():
+        await asyncio.gather(
+            dispatcher.push("U1", MESSAGES, coalesce=True),
+            dispatcher.push("U2", MESSAGES, coalesce=True),
+            dispatcher.push("U3", MESSAGES, coalesce=True),
+            dispatcher.push("U4", [{"type": "text", "text": "other"}], coalesce=True),
+        )
+
+    asyncio.run(run())
+    endpoints = sorted((endpoint, len(payload["to"]) if endpoint == "multicast" else 1)
+                       for endpoint, _, payload in line.calls)
+    assert endpoints == [("multicast", 3), ("push", 1)]
+
+
+def test_multicast_is_chunked():
+    line = FakeLine()
+    dispatcher = PushDispatcher(line)
+    asyncio.run(dispatcher.multicast([f"U{i}" for i in range(1200)], MESSAGES))
+    assert sorted(len(payload["to"]) for _, _, payload in line.calls) == [200, 500, 500]
+
+
+def test_token_bucket_spaces_out_bursts():
+    bucket = TokenBucket(rate=10, capacity=2)
+    waits = [bucket._reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[3] == pytest.approx(0.2, abs=0.01)
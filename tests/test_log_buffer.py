@@ -0,0 +1,75 @@
+"""Tests for the batched api_logs writer."""
+
+import asyncio
+from unittest.mock import MagicMock
+
+from api._lib.log_buffer import LogBuffer
+
+
+def test_flush_writes_single_batch():
+    writer = MagicMock()
+    buf = LogBuffer(writer, max_batch=10)
+
+    async def run():
+        for i in range(3):
+            buf.add({"event_type": f"e{i}"})
+        await buf.flush()
+
+    asyncio.run(run())
+    writer.assert_called_once()
+    assert len(writer.call_args.args[0]) == 3
+    assert len(buf) == 0
+
+
+def test_size_threshold_triggers_background_flush():
+    writer = MagicMock()
+    buf = LogBuffer(writer, max_batch=2)
+
+    async def run():
+        buf.add({"event_type": "a"})
+        buf.add({"event_type": "b"})  # hits max_batch
+        buf.add({"event_type": "c"})
+        await buf.flush()
+
+    asyncio.run(run())
+    batches = [call.args[0] for call in writer.call_args_list]
+    assert sorted(len(b) for b in batches) == [1, 2]
+
+
+def test_full_buffer_drops_new_rows():
+    writer = MagicMock()
+    buf = LogBuffer(writer, max_batch=100, max_pending=2)
+    for i in range(5):
+        buf.add({"event_type": f"e{i}"})  # no running loop: nothing flushes
+    assert len(buf) == 2
+    assert buf.dropped == 3
+
+    asyncio.run(buf.flush())
+    assert [r["event_type"] for r in writer.call_args.args[0]] == ["e0", "e1"]
+    assert buf.dropped == 0
+
+
+def test_writer_errors_are_swallowed():
+    buf = LogBuffer(MagicMock(side_effect=RuntimeError("db down")))
+    buf.add({"event_type": "a"})
+    asyncio.run(buf.flush())
+    assert len(buf) == 0
+
+
+def test_failed_batch_is_retried_once_on_next_flush():
+    writer = MagicMock(side_effect=[RuntimeError("db down"), None, None])
+    buf = LogBuffer(writer)
+    buf.add({"event_type": "parse_success"})
+    asyncio.run(buf.flush())
+    buf.add({"event_type": "b"})
+    asyncio.run(buf.flush())
+    batches = [[r["event_type"] for r in call.args[0]] for call in writer.call_args_list]
+    assert batches == [["parse_success"], ["parse_success"], ["b"]]
+
+    writer.reset_mock(side_effect=True)
+    writer.side_effect = RuntimeError("still down")
+    buf.add({"event_type": "c"})
+    asyncio.run(buf.flush())
+    asyncio.run(buf.flush())
+    asyncio.run(buf.flush())
+    assert writer.call_count == 2  # written once, retried once, then dropped
@@ -0,0 +1,117 @@
+"""Tests for the metrics registry, Prometheus rendering and rollups."""
+
+import asyncio
+import os
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+
+from api._lib import metrics
+from api._lib.gemini_client import _parse_response
+
+
+def test_counter_sums_shards_from_all_threads():
+    counter = metrics.Counter("test_total", "Test.", ["kind"])
+
+    def work():
+        for _ in range(1000):
+            counter.inc(kind="a")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    counter.inc(2, kind="b")
+    assert counter.value(kind="a") == 4000
+    assert counter.value(kind="b") == 2
+
+
+def test_histogram_quantiles_are_within_bucket_precision():
+    histogram = metrics.Histogram("test_seconds", "Test.")
+    for ms in range(1, 1001):
+        histogram.observe(ms / 1000)
+    assert histogram.quantile(0.5) == pytest.approx(0.5, rel=0.07)
+    assert histogram.quantile(0.99) == pytest.approx(0.99, rel=0.07)
+
+
+def test_render_prometheus_text():
+    histogram = metrics.Histogram("test_latency_seconds", "Latency.", ["model"], bounds=(1, 10))
+    histogram.observe(0.2, model="flash")
+    histogram.observe(4, model="flash")
+    counter = metrics.Counter("test_hits_total", 'Hits with "quotes".')
+    counter.inc()
+    with patch.object(metrics, "_registry", {m.name: m for m in (histogram, counter)}):
+        text = metrics.render()
+
+    assert '# TYPE test_latency_seconds histogram' in text
+    assert 'test_latency_seconds_bucket{model="flash",le="1"} 1' in text
+    assert 'test_latency_seconds_bucket{model="flash",le="10"} 2' in text
+    assert 'test_latency_seconds_bucket{model="flash",le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count{model="flash"} 2' in text
+    assert "test_hits_total 1\n" in text
+
+
+def test_render_buckets_count_exactly_at_the_bounds():
+    # 1.01 shares a log-linear bucket with values <= 1; `le` must not count it
+    histogram = metrics.Histogram("test_edge_seconds", "Edge.", bounds=(1, 2))
+    for value in (1, 1.01, 2, 2.5):
+        histogram.observe(value)
+    with patch.object(metrics, "_registry", {histogram.name: histogram}):
+        text = metrics.render()
+
+    assert 'test_edge_seconds_bucket{le="1"} 1' in text
+    assert 'test_edge_seconds_bucket{le="2"} 3' in text
+    assert 'test_edge_seconds_bucket{le="+Inf"} 4' in text
+
+
+def test_parse_outcomes_are_counted():
+    before = metrics.parse_outcomes.value(outcome="truncated")
+    _parse_response('{"words": [{"word": "gato"}, {"word": "pe')
+    assert metrics.parse_outcomes.value(outcome="truncated") == before + 1
+
+
+def test_rollup_writes_only_changes_and_retries_after_failure():
+    counter = metrics.Counter("test_rollup_total", "Test.", ["kind"])
+    rollup = metrics.Rollup(interval=0)
+    writer = MagicMock(side_effect=[RuntimeError("db down"), None, None])
+
+    with patch.object(metrics, "_registry", {counter.name: counter}), \
+            patch.object(metrics, "rollup", rollup), \
+            patch.object(metrics, "insert_metrics_rollup", writer), \
+            patch.object(metrics.config, "METRICS_ROLLUP", True):
+        counter.inc(3, kind="a")
+        asyncio.run(metrics.flush_rollup())  # fails: baseline kept
+        asyncio.run(metrics.flush_rollup())
+        counter.inc(kind="a")
+        asyncio.run(metrics.flush_rollup())
+        asyncio.run(metrics.flush_rollup())  # nothing changed: no row
+
+    rows = [call.args[0] for call in writer.call_args_list]
+    assert len(rows) == 3
+    assert rows[1]["metrics"] == {"test_rollup_total": {"kind=a": 3}}
+    assert rows[2]["metrics"] == {"test_rollup_total": {"kind=a": 1}}
+    assert rows[2]["window_start"] == rows[1]["window_end"]
+
+
+def test_metrics_endpoint_requires_token():
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+    import webhook
+
+    async def get(headers=None):
+        transport = httpx.ASGITransport(app=webhook.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/metrics", headers=headers)
+
+    with patch.object(webhook.config, "METRICS_TOKEN", ""):
+        assert asyncio.run(get({"Authorization": "Bearer "})).status_code == 404
+    with patch.object(webhook.config, "METRICS_TOKEN", "s3cret"):
+        assert asyncio.run(get()).status_code == 401
+        assert asyncio.run(get({"Authorization": "Bearer wrong"})).status_code == 401
+        resp = asyncio.run(get({"Authorization": "Bearer s3cret"}))
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE snappword_gemini_latency_seconds histogram" in resp.text
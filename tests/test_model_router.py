@@ -0,0 +1,119 @@
+"""Tests for fast-model routing, escalation and hedging."""
+
+import asyncio
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from api._lib import model_router
+from api._lib.image_processing import PreparedImage
+from api._lib.model_router import FAST_MODEL, GEMINI_MODEL, LatencyTracker, is_simple
+from api._lib.models import GeminiParseResult, ParsedWord
+
+SIMPLE = PreparedImage(data=b"x" * 1000, mime_type="image/webp", original_size=5000, width=400, height=400)
+DENSE = PreparedImage(data=b"x" * 100_000, mime_type="image/webp", original_size=900_000, width=800, height=800)
+
+
+def _words(*words: str) -> GeminiParseResult:
+    return GeminiParseResult(words=[ParsedWord(word=w) for w in words])
+
+
+@pytest.fixture(autouse=True)
+def fresh_trackers():
+    with patch.object(model_router, "_latency", {}):
+        yield
+
+
+def _fake_gemini(behaviour: dict):
+    """behaviour maps model -> (delay, result or exception)."""
+    calls: list[str] = []
+
+    async def analyze(data, mime_type, model):
+        calls.append(model)
+        delay, outcome = behaviour[model]
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome, {"model": model, "token_count": 10}
+
+    return analyze, calls
+
+
+def test_is_simple_uses_size_and_density():
+    assert is_simple(SIMPLE)
+    assert not is_simple(DENSE)  # 1.25 bits per pixel
+    assert not is_simple(PreparedImage(data=b"x", mime_type="image/png", original_size=1))
+
+
+def test_simple_image_served_by_fast_model():
+    analyze, calls = _fake_gemini({FAST_MODEL: (0, _words("hola"))})
+    with patch.object(model_router, "analyze_screenshot_async", analyze):
+        result, metadata = asyncio.run(model_router.analyze(SIMPLE))
+    assert calls == [FAST_MODEL]
+    assert metadata["model"] == FAST_MODEL
+    assert metadata["escalated"] is False and metadata["hedged"] is False
+
+
+def test_dense_image_goes_straight_to_full_model():
+    analyze, calls = _fake_gemini({GEMINI_MODEL: (0, _words("hola"))})
+    with patch.object(model_router, "analyze_screenshot_async", analyze):
+        asyncio.run(model_router.analyze(DENSE))
+    assert calls == [GEMINI_MODEL]
+
+
+@pytest.mark.parametrize("fast_outcome", [_words(), RuntimeError("model unavailable")])
+def test_fast_model_escalates_on_empty_or_error(fast_outcome):
+    analyze, calls = _fake_gemini({
+        FAST_MODEL: (0, fast_outcome),
+        GEMINI_MODEL: (0, _words("hola")),
+    })
+    with patch.object(model_router, "analyze_screenshot_async", analyze):
+        result, metadata = asyncio.run(model_router.analyze(SIMPLE))
+    assert calls == [FAST_MODEL, GEMINI_MODEL]
+    assert result.words[0].word == "hola"
+    assert metadata["model"] == GEMINI_MODEL and metadata["escalated"] is True
+    expected_tokens = 20 if isinstance(fast_outcome, GeminiParseResult) else 10
+    assert metadata["token_count"] == expected_tokens
+
+
+def test_slow_request_is_hedged_and_loser_cancelled():
+    analyze, calls = _fake_gemini({
+        FAST_MODEL: (5, _words("late")),
+        GEMINI_MODEL: (0.01, _words("hola")),
+    })
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await model_router.analyze(SIMPLE)
+        return result, loop.time() - start
+
+    with patch.object(model_router, "analyze_screenshot_async", analyze), \
+            patch.object(model_router, "HEDGE_DEFAULT_S", 0.05):
+        (result, metadata), elapsed = asyncio.run(run())
+    assert calls == [FAST_MODEL, GEMINI_MODEL]
+    assert metadata["model"] == GEMINI_MODEL and metadata["hedged"] is True
+    assert elapsed < 1
+
+
+def test_hedge_budget_follows_observed_p95():
+    tracker = LatencyTracker()
+    assert tracker.hedge_after() == model_router.HEDGE_DEFAULT_S
+    for i in range(1, 101):
+        tracker.record(i / 10)
+    assert tracker.percentile(0.95) == 9.5
+    assert tracker.hedge_after() == 9.5
+
+
+def test_config_rejects_routing_combined_with_another_mode():
+    api_dir = os.path.join(os.path.dirname(__file__), "..", "api")
+    env = {**os.environ, "GEMINI_ROUTING": "1", "GEMINI_STREAMING": "1"}
+    proc = subprocess.run(
+        [sys.executable, "-c", "import _lib.config"], cwd=api_dir, env=env,
+        capture_output=True, text=True,
+    )
+    assert proc.returncode != 0
+    assert "Enable at most one of GEMINI_STREAMING, GEMINI_ROUTING" in proc.stderr
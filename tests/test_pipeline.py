@@ -0,0 +1,327 @@
+"""Tests for the screenshot pipeline in api/webhook.py.
+
+The webhook module imports `_lib` the way Vercel runs it (api/ on sys.path),
+so it is loaded here the same way and its collaborators are patched.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import orjson
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import webhook  # noqa: E402
+import worker  # noqa: E402
+from _lib.image_processing import PreparedImage  # noqa: E402
+from _lib.models import GeminiParseResult, ParsedWord  # noqa: E402
+
+
+def _result() -> GeminiParseResult:
+    return GeminiParseResult(source_app="Duolingo", words=[ParsedWord(word="gato")])
+
+
+@pytest.fixture
+def pipeline():
+    """Patch every external call made by _process_screenshot."""
+    mocks = {
+        "get_user_profile": AsyncMock(return_value={"displayName": "Amy"}),
+        "get_or_create_user": MagicMock(return_value={"id": "u1"}),
+        "get_pending_upgrade_request": MagicMock(return_value=None),
+        "check_quota": MagicMock(return_value={"allowed": True}),
+        "get_message_content": AsyncMock(return_value=b"raw"),
+        "prepare_screenshot": MagicMock(
+            return_value=PreparedImage(data=b"img", mime_type="image/webp", original_size=3)
+        ),
+        "upload_image": MagicMock(return_value="https://img"),
+        "analyze_screenshot_async": AsyncMock(return_value=(_result(), {"token_count": 10})),
+        "get_known_cards": MagicMock(return_value={}),
+        "get_message_card_ids": MagicMock(return_value=set()),
+        "save_vocab_cards": MagicMock(side_effect=lambda user_id, url, result, message_id: [
+            {"id": f"c-{w.word}", "word": w.word, "word_key": w.word.lower(), "target_lang": result.target_lang}
+            for w in result.words
+        ]),
+        "push_message": AsyncMock(),
+    }
+    log_writer = MagicMock()
+    cache_lookup = patch.object(webhook.analysis_cache, "lookup", return_value=None)
+    cache_store = patch.object(webhook.analysis_cache, "store")
+    log_patch = patch.object(webhook.log_buffer.buffer, "_writer", log_writer)
+    with cache_lookup, cache_store, log_patch, patch.multiple(webhook, **mocks):
+        mocks["log_writer"] = log_writer
+        yield mocks
+
+
+def test_pipeline_pushes_carousel(pipeline):
+    asyncio.run(webhook._process_screenshot("U1", "m1"))
+    pipeline["save_vocab_cards"].assert_called_once()
+    assert pipeline["save_vocab_cards"].call_args.args[1] == "https://img"
+    flex = pipeline["push_message"].call_args.args[1][0]
+    assert flex["type"] == "flex"
+
+
+def test_pipeline_logs_are_written_in_one_batch(pipeline):
+    asyncio.run(webhook._process_screenshot("U1", "m1"))
+    pipeline["log_writer"].assert_called_once()
+    rows = pipeline["log_writer"].call_args.args[0]
+    assert [r["event_type"] for r in rows] == ["image_received", "gemini_call", "parse_success"]
+
+
+def test_outcome_log_carries_stage_timings(pipeline):
+    asyncio.run(webhook._process_screenshot("U1", "m1"))
+    rows = pipeline["log_writer"].call_args.args[0]
+    stages = rows[-1]["payload"]["stages"]
+    assert {"quota", "prepare", "analyze", "total_ms"} <= set(stages)
+    assert "stages" not in rows[0]["payload"]
+
+
+def test_upload_failure_still_saves_cards(pipeline):
+    pipeline["upload_image"].side_effect = RuntimeError("storage down")
+    asyncio.run(webhook._process_screenshot("U1", "m1"))
+    assert pipeline["save_vocab_cards"].call_args.args[1] is None
+    flex = pipeline["push_message"].call_args.args[1][0]
+    assert flex["type"] == "flex"
+    assert "單字卡" in flex["altText"]
+
+
+def test_upload_runs_concurrently_with_gemini(pipeline):
+    upload_started = threading.Event()
+    gemini_done = threading.Event()
+    overlapped = []
+
+    def slow_upload(*args):
+        upload_started.set()
+        # Only finishes early if Gemini completes while the upload is running
+        overlapped.append(gemini_done.wait(timeout=1))
+        return "https://img"
+
+    async def analyze(*args):
+        # Gemini starts before the upload has finished
+        assert await asyncio.to_thread(upload_started.wait, 1)
+        gemini_done.set()
+        return _result(), {"token_count": 10}
+
+    pipeline["upload_image"].side_effect = slow_upload
+    pipeline["analyze_screenshot_async"].side_effect = analyze
+
+    asyncio.run(webhook._process_screenshot("U1", "m1"))
+    assert overlapped == [True]
+    assert pipeline["save_vocab_cards"].call_args.args[1] == "https://img"
+
+
+def test_sdk_preload_is_skipped_once_loaded_and_logs_failures(caplog):
+    async def run(loaded):
+        with patch.object(webhook, "sdk_loaded", return_value=loaded):
+            webhook._preload_gemini_sdk()
+            webhook._preload_gemini_sdk()  # already in flight
+            if webhook._sdk_preload is not None:
+                await asyncio.gather(webhook._sdk_preload, return_exceptions=True)
+
+    load = MagicMock(side_effect=ImportError("no google.genai"))
+    with patch.object(webhook, "load_sdk", load), patch.object(webhook, "_sdk_preload", None):
+        asyncio.run(run(loaded=True))
+        load.assert_not_called()
+        asyncio.run(run(loaded=False))
+    load.assert_called_once()
+    assert "Preloading the Gemini SDK failed" in caplog.text
+
+
+def test_streaming_pushes_first_cards_early(pipeline):
+    words = [ParsedWord(word=w) for w in ("uno", "dos", "tres", "cuatro", "cinco")]
+
+    class FakeStream:
+        def __init__(self, *args):
+            self.parser = MagicMock(header={"source_app": "Duolingo"})
+            self.result = GeminiParseResult(source_app="Duolingo", words=words)
+            self.metadata = {"token_count": 10}
+
+        async def __aiter__(self):
+            for word in words:
+                yield word
+
+    with patch.object(webhook.config, "GEMINI_STREAMING", True), \
+            patch.object(webhook, "ScreenshotStream", FakeStream):
+        asyncio.run(webhook._process_screenshot("U1", "m1"))
+
+    batches = [call.args[2].words for call in pipeline["save_vocab_cards"].call_args_list]
+    assert [[w.word for w in b] for b in batches] == [["uno", "dos", "tres"], ["cuatro", "cinco"]]
+    assert pipeline["push_message"].call_count == 2
+    pipeline["analyze_screenshot_async"].assert_not_called()
+
+
+def test_first_streamed_batch_is_not_charged_to_the_gemini_timeout(pipeline):
+    words = [ParsedWord(word=w) for w in ("uno", "dos", "tres", "cuatro")]
+    saved = pipeline["save_vocab_cards"].side_effect
+
+    def slow_save(*args):
+        time.sleep(0.1)  # longer than the whole Gemini budget below
+        return saved(*args)
+
+    class FakeStream:
+        def __init__(self, *args):
+            self.parser = MagicMock(header={"source_app": "Duolingo"})
+            self.result = GeminiParseResult(source_app="Duolingo", words=words)
+            self.metadata = {"token_count": 10}
+
+        async def __aiter__(self):
+            for word in words:
+                yield word
+
+    pipeline["save_vocab_cards"].side_effect = slow_save
+    with patch.object(webhook.config, "GEMINI_STREAMING", True), \
+            patch.object(webhook, "GEMINI_TIMEOUT", 0.05), \
+            patch.object(webhook, "ScreenshotStream", FakeStream):
+        asyncio.run(webhook._process_screenshot("U1", "m1"))
+
+    batches = [call.args[2].words for call in pipeline["save_vocab_cards"].call_args_list]
+    assert [[w.word for w in b] for b in batches] == [["uno", "dos", "tres"], ["cuatro"]]
+    rows = pipeline["log_writer"].call_args.args[0]
+    assert rows[-1]["event_type"] == "parse_success"
+
+
+def test_known_words_are_not_saved_again_and_follow_new_ones(pipeline):
+    words = [ParsedWord(word=w) for w in ("Gato", "perro", "gato ", "casa")]
+    pipeline["analyze_screenshot_async"].return_value = (
+        GeminiParseResult(source_app="Duolingo", target_lang="es", words=words), {"token_count": 10},
+    )
+    pipeline["get_known_cards"].return_value = {("gato", "es"): "old-gato"}
+    asyncio.run(webhook._process_screenshot("U1", "m1"))
+
+    saved = pipeline["save_vocab_cards"].call_args.args[2].words
+    assert [w.word for w in saved] == ["perro", "casa"]
+    flex = pipeline["push_message"].call_args.args[1][0]
+    buttons = orjson.dumps(flex).decode()
+    assert buttons.index("c-perro") < buttons.index("c-casa") < buttons.index("old-gato")
+    payload = pipeline["log_writer"].call_args.args[0][-1]["payload"]
+    assert payload["cards_saved"] == 2 and payload["known_words"] == 1
+
+
+def test_word_saved_meanwhile_shows_its_existing_card(pipeline):
+    # The upsert skips "gato" (saved by another screenshot since the lookup)
+    pipeline["save_vocab_cards"].side_effect = None
+    pipeline["save_vocab_cards"].return_value = []
+    pipeline["get_known_cards"].side_effect = [{}, {("gato", "en"): "other-gato"}]
+    asyncio.run(webhook._process_screenshot("U1", "m1"))
+
+    keys = pipeline["get_known_cards"].call_args.args[1]
+    assert keys == {("gato", "en")}
+    message = pipeline["push_message"].call_args.args[1][0]
+    assert "單字本" in message["altText"]
+
+
+def test_screenshot_of_only_known_words_pushes_a_notice(pipeline):
+    pipeline["get_known_cards"].return_value = {("gato", "en"): "old-gato"}
+    asyncio.run(webhook._process_screenshot("U1", "m1"))
+
+    pipeline["save_vocab_cards"].assert_not_called()
+    message = pipeline["push_message"].call_args.args[1][0]
+    assert "單字本" in message["altText"]
+    assert pipeline["push_message"].call_count == 1
+
+
+def test_retry_resends_the_cards_its_failed_attempt_saved(pipeline):
+    # The first attempt saved "gato" from m1, then its push failed
+    pipeline["get_known_cards"].return_value = {("gato", "en"): "c-gato"}
+    pipeline["get_message_card_ids"].return_value = {"c-gato"}
+    asyncio.run(webhook._process_screenshot("U1", "m1"))
+
+    pipeline["get_message_card_ids"].assert_called_once_with("u1", "m1")
+    pipeline["save_vocab_cards"].assert_not_called()
+    flex = pipeline["push_message"].call_args.args[1][0]
+    assert flex["type"] == "flex" and "c-gato" in orjson.dumps(flex).decode()
+    payload = pipeline["log_writer"].call_args.args[0][-1]["payload"]
+    assert payload["cards_saved"] == 1 and payload["known_words"] == 0
+
+
+def test_batching_shares_one_gemini_call_for_an_image_set(pipeline):
+    batch = AsyncMock(return_value=[(_result(), {"token_count": 5, "batch_size": 2}), None])
+    pipeline["get_message_content"].side_effect = [b"raw0", b"raw1"]
+
+    async def run():
+        await asyncio.gather(
+            webhook._process_screenshot("U1", "m1", image_count=2),
+            webhook._process_screenshot("U1", "m2", image_count=2),
+        )
+
+    with patch.object(webhook.config, "GEMINI_BATCHING", True), \
+            patch.object(webhook, "analyze_screenshots_batch_async", batch):
+        asyncio.run(run())
+
+    batch.assert_awaited_once()
+    assert len(batch.call_args.args[0]) == 2
+    # The image the batch call missed falls back to a single request
+    pipeline["analyze_screenshot_async"].assert_awaited_once()
+    assert pipeline["push_message"].call_count == 2
+
+
+def test_tripped_dependency_fails_fast_with_busy_message(pipeline):
+    pipeline["analyze_screenshot_async"].side_effect = webhook.DependencyUnavailable(
+        "gemini", "circuit open"
+    )
+    with patch.object(webhook.admin_alerts, "record") as record:
+        asyncio.run(webhook._process_screenshot("U1", "m1"))
+    message = pipeline["push_message"].call_args.args[1][0]
+    assert message["altText"] == webhook.BUSY_MESSAGE
+    record.assert_called_once()
+
+
+def test_image_set_resolves_user_and_quota_once(pipeline):
+    batch = AsyncMock(return_value=[(_result(), {"token_count": 5}), (_result(), {"token_count": 5})])
+    pipeline["get_message_content"].side_effect = [b"raw0", b"raw1"]
+    events = [
+        {
+            "type": "message", "replyToken": f"r{i}", "source": {"userId": "U1"},
+            "message": {"type": "image", "id": f"m{i}", "imageSet": {"id": "s1", "index": i + 1, "total": 2}},
+        }
+        for i in range(2)
+    ]
+    quotas = MagicMock(return_value=[{"allowed": True}, {"allowed": False, "reason": "daily_quota"}])
+
+    with patch.object(webhook.config, "GEMINI_BATCHING", True), \
+            patch.object(webhook, "analyze_screenshots_batch_async", batch), \
+            patch.object(webhook, "check_quotas", quotas), \
+            patch.object(webhook, "reply_loading", AsyncMock()), \
+            patch.object(webhook, "load_sdk"):
+        units = webhook._group_image_sets(events)
+        assert len(units) == 1
+        asyncio.run(webhook._handle_unit(units[0]))
+
+    pipeline["get_or_create_user"].assert_called_once()
+    quotas.assert_called_once_with({"id": "u1"}, 2)
+    pipeline["check_quota"].assert_not_called()
+    # The second image is over quota: only the first is analyzed
+    assert pipeline["save_vocab_cards"].call_count == 1
+
+
+def _image_job(attempts: int) -> dict:
+    event = {
+        "type": "message",
+        "replyToken": "r1",
+        "source": {"userId": "U1"},
+        "message": {"type": "image", "id": "m1"},
+    }
+    return {"id": 7, "line_user_id": "U1", "event": event, "attempts": attempts, "max_attempts": 3}
+
+
+@pytest.mark.parametrize("attempts, status", [(1, "queued"), (3, "dead")])
+def test_worker_retries_pipeline_failures_and_notifies_when_dead(pipeline, attempts, status):
+    pipeline["save_vocab_cards"].side_effect = RuntimeError("db down")
+    update = MagicMock()
+    with patch.object(worker, "claim_webhook_jobs", return_value=[_image_job(attempts)]), \
+            patch.object(worker.job_queue, "update_webhook_job", update), \
+            patch.object(webhook, "reply_loading", AsyncMock()), \
+            patch.object(webhook, "load_sdk"):
+        counts = asyncio.run(worker.run_batch())
+
+    assert counts[status] == 1
+    assert update.call_args.args[1]["status"] == status
+    pushed = [call.args[1][0]["altText"] for call in pipeline["push_message"].call_args_list]
+    if status == "queued":
+        assert pushed == []  # retried silently
+    else:
+        assert pushed == [webhook.SCREENSHOT_ERROR_MESSAGE]
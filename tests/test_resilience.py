@@ -0,0 +1,192 @@
+"""Tests for circuit breakers, AIMD limits and coalesced admin alerts."""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from api._lib import admin_alerts
+from api._lib.resilience import AIMDLimiter, CircuitBreaker, Dependency, DependencyUnavailable
+
+
+def _dependency(**kwargs) -> Dependency:
+    options = {"initial_limit": 2, "max_limit": 4, "slow_after": 10.0, "max_wait": 0.05}
+    options.update(kwargs)
+    return Dependency("test", **options)
+
+
+async def _fail(dependency: Dependency) -> None:
+    with pytest.raises(httpx.ConnectError):
+        async with dependency.aguard():
+            raise httpx.ConnectError("down")
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    dependency = _dependency()
+    opened = []
+    dependency.on_open = opened.append
+
+    async def run():
+        for _ in range(5):
+            await _fail(dependency)
+        async with dependency.aguard():
+            pass
+
+    with pytest.raises(DependencyUnavailable, match="circuit open"):
+        asyncio.run(run())
+    assert opened == ["test"]
+
+
+def test_half_open_probe_closes_breaker_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow() is True
+    assert breaker.allow() is False  # one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_non_failure_errors_do_not_trip():
+    dependency = _dependency(is_failure=lambda e: False)
+
+    async def run():
+        for _ in range(10):
+            with pytest.raises(ValueError):
+                async with dependency.aguard():
+                    raise ValueError("bad input")
+
+    asyncio.run(run())
+    assert dependency.breaker.state == "closed"
+
+
+def test_reported_failure_without_exception_counts():
+    dependency = _dependency()
+
+    async def run():
+        for _ in range(5):
+            async with dependency.aguard() as call:
+                call.fail()  # e.g. HTTP 503
+
+    asyncio.run(run())
+    assert dependency.breaker.state == "open"
+
+
+def test_retried_attempts_count_once_against_the_breaker():
+    dependency = _dependency()
+
+    async def run():
+        for _ in range(4):  # one logical call: three retried attempts, then the last
+            for attempt in range(3):
+                async with dependency.aguard() as call:
+                    call.will_retry()
+                    call.fail()
+            async with dependency.aguard():
+                pass
+
+    asyncio.run(run())
+    assert dependency.breaker.state == "closed"
+    assert dependency.breaker.failures == 0
+
+
+def test_aimd_limit_grows_slowly_and_halves_on_failure():
+    limiter = AIMDLimiter(initial=4, max_limit=8)
+    for _ in range(4):
+        assert limiter.try_acquire()
+        limiter.release(True)
+    assert limiter.limit == pytest.approx(4.93, abs=0.01)
+    limiter.try_acquire()
+    limiter.release(False)
+    assert limiter.limit == pytest.approx(2.46, abs=0.01)
+
+
+def test_saturated_dependency_fails_fast_after_max_wait():
+    dependency = _dependency(initial_limit=1)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with dependency.aguard():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        try:
+            async with dependency.aguard():
+                pass
+        finally:
+            release.set()
+            await holder
+
+    with pytest.raises(DependencyUnavailable, match="in flight"):
+        asyncio.run(run())
+
+
+def test_sync_guard_trips_from_worker_threads():
+    dependency = _dependency()
+    for _ in range(5):
+        with pytest.raises(httpx.ReadTimeout):
+            with dependency.guard():
+                raise httpx.ReadTimeout("slow")
+    with pytest.raises(DependencyUnavailable):
+        with dependency.guard():
+            pass
+
+
+def test_admin_digest_coalesces_errors():
+    digest = admin_alerts.AdminDigest(interval=300)
+    digest.record("Amy", "Gemini API timeout")
+    # Never sent: due at once, even on a host up for less than the interval
+    with patch("api._lib.admin_alerts.time.monotonic", return_value=10.0):
+        first = digest.take_summary()
+        assert "Amy" in first.text and "Gemini API timeout ×1" in first.text
+        digest.done(first, sent=True)
+
+        for user in ("Amy", "Bob", "Cat"):
+            digest.record(user, "Gemini API timeout")
+        assert digest.take_summary() is None  # within the interval
+        summary = digest.take_summary(force=True)
+        assert "（3 次）" in summary.text and "3 位" in summary.text
+        digest.done(summary, sent=True)
+        assert digest.take_summary(force=True) is None
+
+
+def test_admin_digest_keeps_counts_until_the_push_succeeds():
+    digest = admin_alerts.AdminDigest()
+    digest.record("Amy", "boom")
+    failed = digest.take_summary()
+    assert digest.take_summary() is None  # one summary out at a time
+    digest.done(failed, sent=False)
+    digest.record("Bob", "boom")
+    retry = digest.take_summary()
+    assert "boom ×2" in retry.text
+    digest.done(retry, sent=True)
+    assert digest.take_summary(force=True) is None
+
+
+def test_admin_flush_pushes_one_summary():
+    digest = admin_alerts.AdminDigest()
+    push = AsyncMock()
+    with patch.object(admin_alerts, "digest", digest), \
+            patch.object(admin_alerts, "push_message", push), \
+            patch.object(admin_alerts.config, "ADMIN_LINE_USER_ID", "Uadmin"):
+        for _ in range(20):
+            admin_alerts.record("Amy", "boom")
+        asyncio.run(admin_alerts.flush())
+        asyncio.run(admin_alerts.flush())
+    push.assert_awaited_once()
+    assert push.call_args.args[0] == "Uadmin"
+
+
+def test_admin_flush_keeps_summary_when_push_fails():
+    digest = admin_alerts.AdminDigest()
+    push = AsyncMock(side_effect=[DependencyUnavailable("line", "circuit open"), None])
+    with patch.object(admin_alerts, "digest", digest), \
+            patch.object(admin_alerts, "push_message", push), \
+            patch.object(admin_alerts.config, "ADMIN_LINE_USER_ID", "Uadmin"):
+        admin_alerts.record("Amy", "boom")
+        asyncio.run(admin_alerts.flush())
+        asyncio.run(admin_alerts.flush())
+    assert push.await_count == 2
@@ -0,0 +1,137 @@
+"""Tests for the pooled Supabase client registry."""
+
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+
+from api._lib import supabase_client
+from api._lib.models import GeminiParseResult, ParsedWord
+
+
+@pytest.fixture(autouse=True)
+def _fresh_pool():
+    supabase_client.reset_client()
+    yield
+    supabase_client.reset_client()
+
+
+def test_get_client_is_reused():
+    with patch.object(supabase_client, "create_client") as mock_create:
+        first = supabase_client._get_client()
+        second = supabase_client._get_client()
+    assert first is second
+    assert mock_create.call_count == 1
+
+
+def test_reset_client_rebuilds_pool():
+    with patch.object(supabase_client, "create_client", side_effect=[object(), object()]):
+        first = supabase_client._get_client()
+        supabase_client.reset_client()
+        second = supabase_client._get_client()
+    assert first is not second
+
+
+def test_transport_error_resets_pool():
+    @supabase_client._with_pool_reset
+    def broken():
+        raise httpx.ConnectError("connection reset")
+
+    with patch.object(supabase_client, "create_client"):
+        supabase_client._get_client()
+        assert supabase_client._client is not None
+        with pytest.raises(httpx.ConnectError):
+            broken()
+    assert supabase_client._client is None
+
+
+def _patch_usage(daily: int, monthly: int):
+    return patch.object(
+        supabase_client, "get_usage",
+        return_value={"daily_used": daily, "monthly_used": monthly},
+    )
+
+
+def test_check_quota_monthly_limit():
+    with _patch_usage(daily=3, monthly=30):
+        quota = supabase_client.check_quota({"id": "u1", "subscription_tier": "free"})
+    assert quota["allowed"] is False
+    assert quota["reason"] == "monthly_quota"
+    assert quota["monthly_used"] == 30
+
+
+def test_check_quota_daily_cap_for_unlimited_tier():
+    with _patch_usage(daily=500, monthly=1200):
+        quota = supabase_client.check_quota({"id": "u1", "subscription_tier": "bloom"})
+    assert quota["allowed"] is False
+    assert quota["reason"] == "daily_quota"
+
+
+def test_check_quota_allowed_single_lookup():
+    with _patch_usage(daily=1, monthly=5) as mock_usage:
+        quota = supabase_client.check_quota({"id": "u1", "is_premium": True})
+    assert quota == {"allowed": True, "tier": "sprout", "monthly_used": 5, "monthly_limit": 200}
+    mock_usage.assert_called_once_with("u1")
+
+
+def test_check_quotas_counts_earlier_images_of_a_set():
+    with _patch_usage(daily=3, monthly=28) as mock_usage:
+        quotas = supabase_client.check_quotas({"id": "u1", "subscription_tier": "free"}, 3)
+    assert [q["allowed"] for q in quotas] == [True, True, False]
+    assert quotas[2]["reason"] == "monthly_quota"
+    mock_usage.assert_called_once_with("u1")
+
+
+def test_check_quotas_rereads_a_cached_user_before_refusing():
+    supabase_client._user_cache.clear()
+    stale = {"id": "u1", "line_user_id": "U1", "subscription_tier": "free"}
+    upgraded = {**stale, "subscription_tier": "sprout"}
+    with patch.object(supabase_client, "_fetch_or_create_user", return_value=upgraded) as mock_fetch, \
+            _patch_usage(daily=3, monthly=30):
+        quota = supabase_client.check_quota(stale)
+        assert supabase_client.check_quota(upgraded)["allowed"] is True
+    assert quota["allowed"] is True and quota["tier"] == "sprout"
+    mock_fetch.assert_called_once()
+
+
+def test_get_or_create_user_is_cached():
+    supabase_client._user_cache.clear()
+    user = {"id": "u1", "line_user_id": "U1", "display_name": "Amy"}
+    with patch.object(supabase_client, "_fetch_or_create_user", return_value=user) as mock_fetch:
+        first = supabase_client.get_or_create_user("U1", "Amy")
+        second = supabase_client.get_or_create_user("U1", "Amy")
+        supabase_client.invalidate_user("U1")
+        supabase_client.get_or_create_user("U1")
+    assert first == second == user
+    assert mock_fetch.call_count == 2
+
+
+def test_save_vocab_cards_upserts_and_extends_known_words():
+    supabase_client._known_cards.clear()
+    sb = MagicMock()
+    sb.table.return_value.upsert.return_value.execute.return_value.data = [
+        {"id": "c2", "word": "Perro", "word_key": "perro", "target_lang": "es"},
+    ]
+    result = GeminiParseResult(target_lang=" ES", words=[ParsedWord(word="Perro"), ParsedWord(word="gato")])
+    fetch = MagicMock(return_value={("gato", "es"): "c1"})
+    with patch.object(supabase_client, "_get_client", return_value=sb), \
+            patch.object(supabase_client, "_fetch_known_cards", fetch):
+        keys = {("gato", "es"), ("perro", "es")}
+        assert supabase_client.get_known_cards("u1", keys) == {("gato", "es"): "c1"}
+        saved = supabase_client.save_vocab_cards("u1", None, result)
+        known = supabase_client.get_known_cards("u1", keys)
+
+    rows = sb.table.return_value.upsert.call_args.args[0]
+    assert [(r["word_key"], r["target_lang"]) for r in rows] == [("perro", "es"), ("gato", "es")]
+    assert sb.table.return_value.upsert.call_args.kwargs == {
+        "on_conflict": "user_id,word_key,target_lang", "ignore_duplicates": True,
+    }
+    assert saved[0]["id"] == "c2"
+    assert known == {("gato", "es"): "c1", ("perro", "es"): "c2"}
+    # Only the keys the cache lacked were queried, and the second lookup was cached
+    assert fetch.call_count == 1
+    assert fetch.call_args.args[1] == keys
+
+
+def test_word_key_collapses_unicode_whitespace():
+    assert supabase_client.word_key("  Buenos\xa0\u3000días\n", None) == ("buenos días", "en")
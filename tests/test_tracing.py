@@ -0,0 +1,99 @@
+"""Tests for tracing spans, stage breakdowns and the OTLP exporter."""
+
+import asyncio
+import json
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from api._lib import tracing
+
+
+def test_spans_follow_tasks_and_worker_threads():
+    def blocking():
+        with tracing.span("db"):
+            pass
+
+    async def child():
+        with tracing.span("push"):
+            await asyncio.sleep(0)
+
+    async def run():
+        with tracing.start_trace("screenshot") as trace:
+            with tracing.span("analyze"):
+                await asyncio.to_thread(blocking)
+                await asyncio.create_task(child())
+            with tracing.span("push"):
+                pass
+        return trace
+
+    trace = asyncio.run(run())
+    spans = {s.name: s for s in trace.spans}
+    assert [s.name for s in trace.spans].count("push") == 2
+    assert spans["db"].parent_id == spans["analyze"].span_id
+    assert spans["analyze"].parent_id == trace.root_id
+    # Nested spans (db, the child task's push) are inside analyze already
+    assert set(trace.breakdown()) == {"push", "analyze", "total_ms"}
+    top_push = next(s for s in trace.spans if s.name == "push" and s.parent_id == trace.root_id)
+    assert trace.breakdown()["push"] == round(top_push.duration_ns / 1e6, 1)
+
+
+def test_span_outside_trace_is_a_no_op():
+    with tracing.span("db"):
+        pass
+    assert tracing.current() is None
+    assert tracing.breakdown() is None
+
+
+def test_span_records_error_and_reraises():
+    with tracing.start_trace("screenshot") as trace:
+        with pytest.raises(ValueError):
+            with tracing.span("db"):
+                raise ValueError("boom")
+    assert trace.spans[0].error == "ValueError"
+
+
+def test_traced_decorator_wraps_sync_and_async():
+    @tracing.traced("sync")
+    def sync():
+        return 1
+
+    @tracing.traced("async")
+    async def async_():
+        return 2
+
+    async def run():
+        with tracing.start_trace("t") as trace:
+            assert sync() == 1
+            assert await async_() == 2
+        return trace
+
+    assert [s.name for s in asyncio.run(run()).spans] == ["sync", "async"]
+
+
+def test_flush_exports_otlp_json():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200)
+
+    transport = httpx.MockTransport(handler)
+    real_client = httpx.AsyncClient
+    client = lambda **kwargs: real_client(transport=transport, **kwargs)  # noqa: E731
+    with patch.object(tracing.config, "OTEL_EXPORTER_OTLP_ENDPOINT", "http://collector:4318"), \
+            patch.object(tracing.httpx, "AsyncClient", client):
+        with tracing.start_trace("screenshot", message_id="m1"):
+            with tracing.span("gemini.generate", model="flash"):
+                pass
+        asyncio.run(tracing.flush())
+        asyncio.run(tracing.flush())  # nothing pending: no request
+
+    assert len(requests) == 1
+    assert str(requests[0].url) == "http://collector:4318/v1/traces"
+    spans = json.loads(requests[0].content)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root, child = spans
+    assert child["parentSpanId"] == root["spanId"]
+    assert child["traceId"] == root["traceId"] and len(root["traceId"]) == 32
+    assert {"key": "model", "value": {"stringValue": "flash"}} in child["attributes"]
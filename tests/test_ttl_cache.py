@@ -0,0 +1,35 @@
+"""Tests for the in-process TTL cache."""
+
+from unittest.mock import patch
+
+from api._lib.ttl_cache import TTLCache
+
+
+def test_get_set_and_pop():
+    cache: TTLCache[str, int] = TTLCache(ttl=60)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert "a" in cache
+    assert cache.pop("a") == 1
+    assert cache.get("a") is None
+
+
+def test_entries_expire():
+    cache: TTLCache[str, int] = TTLCache(ttl=10)
+    with patch("api._lib.ttl_cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("api._lib.ttl_cache.time.monotonic", return_value=105.0):
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+    with patch("api._lib.ttl_cache.time.monotonic", return_value=111.0):
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+        assert len(cache) == 1
+
+
+def test_maxsize_evicts_oldest():
+    cache: TTLCache[int, int] = TTLCache(ttl=60, maxsize=2)
+    for i in range(3):
+        cache.set(i, i)
+    assert cache.get(0) is None
+    assert cache.get(2) == 2
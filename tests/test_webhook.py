@@ -1,8 +1,12 @@
 """Tests for webhook event handling logic."""
 
+import asyncio
 from unittest.mock import patch, AsyncMock
 from urllib.parse import parse_qs
 
+import httpx
+
+from api._lib import line_client
 from api._lib.line_client import verify_signature
 
 
@@ -26,3 +30,88 @@ def test_verify_signature_rejects_invalid():
         mock_config.LINE_CHANNEL_SECRET = "test_secret"
         result = verify_signature(b"test body", "invalid_signature")
         assert result is False
+
+
+def test_line_client_is_shared_per_loop():
+    """LINE calls reuse one pooled client within an event loop."""
+    async def _grab():
+        first = line_client._get_client()
+        second = line_client._get_client()
+        await line_client.close_client()
+        return first, second
+
+    first, second = asyncio.run(_grab())
+    assert first is second
+    assert line_client._client is None
+
+
+def test_line_client_from_a_finished_loop_is_closed():
+    async def _grab():
+        return line_client._get_client()
+
+    async def _replace():
+        client = line_client._get_client()
+        await asyncio.gather(*line_client._retiring)
+        await line_client.close_client()
+        return client
+
+    stale = asyncio.run(_grab())
+    fresh = asyncio.run(_replace())
+    assert fresh is not stale
+    assert stale.is_closed and fresh.is_closed
+
+
+def test_push_message_uses_shared_client():
+    seen: list[str] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        return httpx.Response(200, json={})
+
+    async def _run():
+        line_client._client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        line_client._client_loop = asyncio.get_running_loop()
+        await line_client.push_message("U123", [{"type": "text", "text": "hi"}])
+        await line_client.push_message("U456", [{"type": "text", "text": "hi"}])
+        await line_client.close_client()
+
+    asyncio.run(_run())
+    assert seen == ["/v2/bot/message/push", "/v2/bot/message/push"]
+
+
+def test_user_profile_is_cached():
+    calls: list[str] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"displayName": "Amy"})
+
+    async def _run():
+        line_client._profile_cache.clear()
+        line_client._client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        line_client._client_loop = asyncio.get_running_loop()
+        first = await line_client.get_user_profile("U789")
+        second = await line_client.get_user_profile("U789")
+        await line_client.close_client()
+        return first, second
+
+    first, second = asyncio.run(_run())
+    assert first == second == {"displayName": "Amy", "pictureUrl": None}
+    assert calls == ["/v2/bot/profile/U789"]
+
+
+def test_push_body_is_compact_orjson():
+    bodies: list[bytes] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(request.content)
+        return httpx.Response(200, json={})
+
+    async def _run():
+        line_client._client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        line_client._client_loop = asyncio.get_running_loop()
+        await line_client.push_message("U1", [{"type": "text", "text": "hi 📖"}])
+        await line_client.close_client()
+
+    asyncio.run(_run())
+    assert bodies == ['{"to":"U1","messages":[{"type":"text","text":"hi 📖"}]}'.encode()]
@@ -31,6 +31,8 @@ import {
   checkQuota,
   uploadImage,
   saveVocabCards,
+  normalizeWord,
+  getCardIdsByWordKey,
   updateCardStatusWithOwner,
   logEvent,
   createUpgradeRequest,
@@ -197,10 +199,30 @@ async function processScreenshot(
       },
     });
 
-    // Build and send Flex Message
-    const wordCardPairs: [ParsedWord, string][] = parseResult.words.map(
-      (w, i) => [w, (savedCards[i] as Record<string, string>)?.id || ""]
+    // Build and send Flex Message. Words the user already had return no
+    // row from the upsert; their existing cards are looked up so every
+    // bubble's buttons point at a real card. New words come first.
+    const newIds = new Map(
+      savedCards.map((c) => {
+        const card = c as Record<string, string>;
+        return [card.word_key, card.id];
+      })
     );
+    const knownKeys = parseResult.words
+      .map((w) => normalizeWord(w.word))
+      .filter((key) => !newIds.has(key));
+    const knownIds = await getCardIdsByWordKey(userId, knownKeys, parseResult.target_lang);
+    const seen = new Set<string>();
+    const newPairs: [ParsedWord, string][] = [];
+    const knownPairs: [ParsedWord, string][] = [];
+    for (const w of parseResult.words) {
+      const key = normalizeWord(w.word);
+      if (seen.has(key)) continue;
+      seen.add(key);
+      if (newIds.has(key)) newPairs.push([w, newIds.get(key)!]);
+      else if (knownIds.has(key)) knownPairs.push([w, knownIds.get(key)!]);
+    }
+    const wordCardPairs = [...newPairs, ...knownPairs];
     const flexMsg = buildVocabCarousel(wordCardPairs, parseResult.source_app);
     await pushMessage(lineUserId, [flexMsg]);
   } catch (err) {
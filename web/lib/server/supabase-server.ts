@@ -74,7 +74,42 @@ export async function uploadImage(
   return data.publicUrl;
 }
 
-/** Save parsed words as vocab_cards. Returns inserted records. */
+/**
+ * Normalized word stored in vocab_cards.word_key (migration 014). Keep in
+ * step with word_key() in api/_lib/supabase_client.py.
+ */
+export function normalizeWord(word: string): string {
+  return word.split(/\s+/).filter(Boolean).join(" ").toLowerCase();
+}
+
+export function normalizeTargetLang(lang: string | undefined): string {
+  return (lang || "").trim().toLowerCase() || "en";
+}
+
+/** Card ids of the user's existing cards for the given word keys. */
+export async function getCardIdsByWordKey(
+  userId: string,
+  wordKeys: string[],
+  targetLang: string
+): Promise<Map<string, string>> {
+  if (wordKeys.length === 0) return new Map();
+
+  const sb = getClient();
+  const { data, error } = await sb
+    .from("vocab_cards")
+    .select("id, word_key")
+    .eq("user_id", userId)
+    .eq("target_lang", normalizeTargetLang(targetLang))
+    .in("word_key", wordKeys);
+
+  if (error) throw new Error(`Card lookup failed: ${error.message}`);
+  return new Map((data || []).map((c) => [c.word_key as string, c.id as string]));
+}
+
+/**
+ * Save parsed words as vocab_cards. Returns the newly created records;
+ * words the user already has a card for are skipped.
+ */
 export async function saveVocabCards(
   userId: string,
   imageUrl: string,
@@ -83,9 +118,11 @@ export async function saveVocabCards(
   if (parseResult.words.length === 0) return [];
 
   const sb = getClient();
+  const targetLang = normalizeTargetLang(parseResult.target_lang);
   const rows = parseResult.words.map((w) => ({
     user_id: userId,
     word: w.word,
+    word_key: normalizeWord(w.word),
     translation: w.translation,
     pronunciation: w.pronunciation,
     original_sentence: w.context_sentence,
@@ -93,14 +130,14 @@ export async function saveVocabCards(
     ai_example: w.ai_example,
     image_url: imageUrl,
     source_app: parseResult.source_app,
-    target_lang: parseResult.target_lang,
+    target_lang: targetLang,
     tags: w.tags,
     review_status: 0,
   }));
 
   const { data, error } = await sb
     .from("vocab_cards")
-    .insert(rows)
+    .upsert(rows, { onConflict: "user_id,word_key,target_lang", ignoreDuplicates: true })
     .select();
 
   if (error) throw new Error(`Save cards failed: ${error.message}`);